@@ -0,0 +1,147 @@
+"""
+Сравнение режимов нечеткого сопоставления имен XSD-элементов с ключами JSON:
+  difflib  - difflib.get_close_matches по одному имени (исходный вариант),
+  blocked  - FuzzyMatcher (те же результаты, что у difflib),
+  matrix   - NGramMatrixMatcher (пакетная матрица сходства на NumPy).
+
+Запуск из корня проекта:
+    python -m benchmarks.fuzzy_matrix
+    python -m benchmarks.fuzzy_matrix --sizes 1000 5000 --json result.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from difflib import get_close_matches
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.fuzzy_match import FuzzyMatcher, NGramMatrixMatcher, np
+from core.json_mapper_gen import XSDSchemaAnalyzer, JSONScenarioAnalyzer
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gui', 'assets')
+WORDS = ['applicant', 'person', 'first', 'last', 'middle', 'name', 'birth', 'date', 'place', 'document',
+         'series', 'number', 'issue', 'issued', 'by', 'code', 'address', 'region', 'city', 'street',
+         'house', 'flat', 'phone', 'email', 'snils', 'inn', 'ogrn', 'org', 'kind', 'type', 'status',
+         'request', 'service', 'target', 'reason', 'child', 'parent', 'info', 'value', 'id']
+
+
+def load_bundled_names():
+    """Имена XSD-элементов и ключи JSON из файлов в gui/assets."""
+    xsd_path = os.path.join(ASSETS_DIR, 'схема вида сведений.xsd')
+    scenarios = [os.path.join(ASSETS_DIR, name) for name in ('сценарий1.json', 'сценарий2.json')]
+    xsd_analysis = XSDSchemaAnalyzer(xsd_path).analyze()
+    json_analysis = JSONScenarioAnalyzer(scenarios).analyze()
+    names = [info['name'] for info in xsd_analysis['elements_by_path'].values() if info.get('name')]
+    keys = set(json_analysis['stored_values']) | set(json_analysis['field_to_id']) | set(json_analysis['flat_fields'])
+    return names, keys
+
+
+def synthetic_names(count, rng):
+    """Имена в стиле camelCase из 2-4 слов."""
+    names = []
+    for _ in range(count):
+        parts = rng.sample(WORDS, rng.randint(2, 4))
+        names.append(parts[0] + ''.join(part.capitalize() for part in parts[1:]))
+    return names
+
+
+def mutate(name, rng):
+    """Ключ JSON, похожий на имя XSD: другой регистр, пропущенная или лишняя буква."""
+    choice = rng.random()
+    if choice < 0.3:
+        return name.lower()
+    if choice < 0.6 and len(name) > 3:
+        pos = rng.randrange(len(name))
+        return name[:pos] + name[pos + 1:]
+    if choice < 0.8:
+        return name + rng.choice(['Value', 'Id', 'Code'])
+    return name[0].upper() + name[1:]
+
+
+def synthetic_case(size, seed=0):
+    rng = random.Random(seed)
+    names = synthetic_names(size, rng)
+    keys = {mutate(name, rng) for name in rng.sample(names, size // 2)}
+    keys.update(synthetic_names(size // 2, rng))
+    return names, keys
+
+
+def run_case(label, names, keys, cutoff=0.6, include_difflib=True):
+    unique_names = list(dict.fromkeys(names))
+    result = {'case': label, 'names': len(unique_names), 'keys': len(keys)}
+
+    reference = None
+    if include_difflib:
+        start = time.perf_counter()
+        normalized_keys = {}
+        for key in keys:
+            normalized_keys.setdefault(key.lower(), key)
+        reference = []
+        for name in unique_names:
+            matches = get_close_matches(name.lower(), list(normalized_keys), n=1, cutoff=cutoff)
+            reference.append(normalized_keys[matches[0]] if matches else None)
+        result['difflib_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    blocked = FuzzyMatcher(keys, cutoff=cutoff).match_many(unique_names)
+    result['blocked_s'] = time.perf_counter() - start
+    if reference is not None:
+        result['blocked_agreement'] = agreement(reference, blocked)
+    if reference is None:
+        reference = blocked
+
+    if np is not None:
+        start = time.perf_counter()
+        matrix = NGramMatrixMatcher(keys, cutoff=cutoff).match_many(unique_names)
+        result['matrix_s'] = time.perf_counter() - start
+        result['matrix_agreement'] = agreement(reference, matrix)
+        result['matrix_matched'] = sum(1 for m in matrix if m is not None)
+    result['reference_matched'] = sum(1 for m in reference if m is not None)
+    return result
+
+
+def agreement(reference, other):
+    """Доля имен, для которых выбран тот же ключ (без учета регистра)."""
+    if not reference:
+        return 1.0
+    same = sum(1 for a, b in zip(reference, other) if (a or '').lower() == (b or '').lower())
+    return same / len(reference)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк режимов нечеткого сопоставления")
+    parser.add_argument('--sizes', type=int, nargs='*', default=[300, 1000, 3000],
+                        help="Размеры синтетических наборов имен")
+    parser.add_argument('--difflib-limit', type=int, default=1000,
+                        help="Не запускать difflib на наборах больше этого размера")
+    parser.add_argument('--json', dest='json_path', help="Сохранить результаты в JSON-файл")
+    args = parser.parse_args(argv)
+
+    if np is None:
+        print("NumPy не установлен: режим matrix пропускается.")
+
+    results = [run_case('bundled', *load_bundled_names())]
+    for size in args.sizes:
+        results.append(run_case(f'synthetic-{size}', *synthetic_case(size),
+                                include_difflib=size <= args.difflib_limit))
+
+    for r in results:
+        parts = [f"{r['case']:>16}: {r['names']} имен x {r['keys']} ключей"]
+        for backend in ('difflib', 'blocked', 'matrix'):
+            if f'{backend}_s' in r:
+                parts.append(f"{backend} {r[f'{backend}_s']:.3f}s")
+        if 'matrix_agreement' in r:
+            parts.append(f"совпадение matrix {r['matrix_agreement']:.1%}")
+        print(", ".join(parts))
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,315 @@
+"""
+Бенчмарк конвейера генерации: время каждого этапа и всей генерации
+на файлах из gui/assets и на их увеличенных копиях.
+
+Запуск из корня проекта:
+    python -m benchmarks.pipeline run --output results.json
+    python -m benchmarks.pipeline run --scales 1 4 10 --repeat 5 --output results.json
+    python -m benchmarks.pipeline run --scales --synthetic 1 10 --output results.json
+    python -m benchmarks.pipeline compare baseline.json results.json --threshold 0.2
+
+compare завершается с кодом 1, если какая-либо метрика медленнее базовой
+больше чем на threshold (и больше чем на --min-delta секунд - защита от шума
+на очень коротких этапах).
+"""
+import argparse
+import copy
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lxml import etree
+
+import core.mid_vm
+from core.analysis_cache import AnalysisCache
+from core.fuzzy_match import np
+from benchmarks.synthetic import WorkloadSpec, generate_workload
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gui', 'assets')
+BUNDLED_XSD = os.path.join(ASSETS_DIR, 'схема вида сведений.xsd')
+BUNDLED_SERVICE_SCHEMA = os.path.join(ASSETS_DIR, 'схема услуги.txt')
+BUNDLED_SCENARIOS = [os.path.join(ASSETS_DIR, name) for name in ('сценарий1.json', 'сценарий2.json')]
+
+XSD_NS = "http://www.w3.org/2001/XMLSchema"
+# Служебные ключи сценария, которые анализатор узнает по имени - при копировании не переименовываются
+SCENARIO_RESERVED_KEYS = {'value', 'fieldToId', 'storedValues'}
+
+
+# --- Увеличенные копии входных файлов ---
+def scale_xsd(src, dst, factor):
+    """
+    Добавляет в схему factor - 1 копий всех глобальных определений. В копии i
+    глобальные имена и ссылки на них получают суффикс _i, локальные элементы -
+    суффикс i (FirstName -> FirstName2), чтобы нечеткому поиску доставались новые имена.
+    """
+    tree = etree.parse(src)
+    root = tree.getroot()
+    originals = [child for child in root if isinstance(child.tag, str) and child.get('name')]
+    global_names = {child.get('name') for child in originals}
+    for i in range(2, factor + 1):
+        for original in originals:
+            duplicate = copy.deepcopy(original)
+            for node in duplicate.iter():
+                if not isinstance(node.tag, str):
+                    continue
+                for attr in ('type', 'base', 'ref'):
+                    value = node.get(attr)
+                    if not value:
+                        continue
+                    prefix, _, local = value.rpartition(':')
+                    if local in global_names and node.nsmap.get(prefix or None) != XSD_NS:
+                        node.set(attr, f"{value}_{i}")
+                if node is duplicate:
+                    node.set('name', f"{node.get('name')}_{i}")
+                elif node.get('name') and etree.QName(node).localname in ('element', 'attribute'):
+                    node.set('name', f"{node.get('name')}{i}")
+            root.append(duplicate)
+    tree.write(dst, encoding='UTF-8', xml_declaration=True)
+
+
+def _suffix_key(key, suffix):
+    if key in SCENARIO_RESERVED_KEYS:
+        return key
+    if key.endswith('Choice'):
+        return key[:-len('Choice')] + suffix + 'Choice'
+    return key + suffix
+
+
+def _suffix_keys(obj, suffix):
+    if isinstance(obj, dict):
+        return {_suffix_key(key, suffix): _suffix_keys(value, suffix) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_suffix_keys(item, suffix) for item in obj]
+    return obj
+
+
+def scale_scenario(src, dst, factor):
+    """Добавляет в сценарий factor - 1 копий его содержимого с переименованными ключами."""
+    with open(src, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    original = dict(data)
+    for i in range(2, factor + 1):
+        data[f'scaled{i}'] = _suffix_keys(original, str(i))
+    with open(dst, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def _suffix_components(obj, suffix):
+    if isinstance(obj, dict):
+        result = {key: _suffix_components(value, suffix) for key, value in obj.items()}
+        if 'id' in result and isinstance(result['id'], str):
+            result['id'] += suffix
+            for key in ('binding', 'path'):
+                if isinstance(result.get(key), str):
+                    result[key] += suffix
+        return result
+    if isinstance(obj, list):
+        return [_suffix_components(item, suffix) for item in obj]
+    return obj
+
+
+def scale_service_schema(src, dst, factor):
+    """Добавляет в схему услуги factor - 1 копий документа с новыми id компонентов и привязками."""
+    with open(src, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    original = dict(data)
+    for i in range(2, factor + 1):
+        data[f'scaled{i}'] = _suffix_components(original, str(i))
+    with open(dst, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def bundled_case():
+    return {'name': 'bundled', 'xsd': BUNDLED_XSD, 'service_schema': BUNDLED_SERVICE_SCHEMA,
+            'scenarios': list(BUNDLED_SCENARIOS)}
+
+
+def scaled_case(factor, directory):
+    """Файлы из gui/assets, увеличенные в factor раз, в каталоге directory."""
+    if factor <= 1:
+        return bundled_case()
+    xsd = os.path.join(directory, f'scaled{factor}.xsd')
+    scale_xsd(BUNDLED_XSD, xsd, factor)
+    service_schema = os.path.join(directory, f'scaled{factor}-service.json')
+    scale_service_schema(BUNDLED_SERVICE_SCHEMA, service_schema, factor)
+    scenarios = []
+    for n, path in enumerate(BUNDLED_SCENARIOS, 1):
+        scenario = os.path.join(directory, f'scaled{factor}-scenario{n}.json')
+        scale_scenario(path, scenario, factor)
+        scenarios.append(scenario)
+    return {'name': f'scaled-x{factor}', 'xsd': xsd, 'service_schema': service_schema, 'scenarios': scenarios}
+
+
+# --- Замеры ---
+def _input_sizes(case):
+    paths = [case['xsd'], case['service_schema']] + case['scenarios']
+    return {'files': len(paths), 'bytes': sum(os.path.getsize(path) for path in paths)}
+
+
+def _summary(values):
+    return {'median': statistics.median(values), 'min': min(values), 'max': max(values)}
+
+
+def run_case(case, repeat=3, warmup=1):
+    """
+    Время этапов (core.instrumentation) и всей генерации без кэша,
+    а также генерации с прогретым кэшем анализа. Значения - медиана, минимум и максимум
+    по repeat запускам, в секундах.
+    """
+    args = (case['xsd'], case['service_schema'], case['scenarios'])
+    for _ in range(warmup):
+        core.mid_vm.generate_template(*args)
+
+    end_to_end = []
+    stage_wall, stage_cpu = {}, {}
+    counters = {}
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _, report = core.mid_vm.generate_template_with_report(*args)
+        end_to_end.append(time.perf_counter() - started)
+        for stage in report['stages']:
+            stage_wall.setdefault(stage['name'], []).append(stage['wall'])
+            stage_cpu.setdefault(stage['name'], []).append(stage['cpu'])
+        counters = report['counters']
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = AnalysisCache(cache_dir)
+        core.mid_vm.generate_template(*args, cache=cache)
+        warm_cache = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            core.mid_vm.generate_template(*args, cache=cache)
+            warm_cache.append(time.perf_counter() - started)
+
+    return {
+        'inputs': _input_sizes(case),
+        'end_to_end': _summary(end_to_end),
+        'warm_cache': _summary(warm_cache),
+        'stages': {name: {'wall': _summary(stage_wall[name]), 'cpu': _summary(stage_cpu[name])}
+                   for name in stage_wall},
+        'counters': counters,
+    }
+
+
+def synthetic_case(factor, directory, spec=None):
+    """Синтетические файлы (benchmarks.synthetic), увеличенные в factor раз."""
+    name = f'synthetic-x{factor:g}'
+    return generate_workload(directory, (spec or WorkloadSpec()).scaled(factor), name=name)
+
+
+def run(scales, repeat=3, warmup=1, synthetic_scales=(), extra_cases=()):
+    results = {
+        'meta': {
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': getattr(np, '__version__', None),
+            'cpu_count': os.cpu_count(),
+            'repeat': repeat,
+        },
+        'cases': {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        cases = [scaled_case(factor, directory) for factor in scales]
+        cases += [synthetic_case(factor, directory) for factor in synthetic_scales]
+        cases += list(extra_cases)
+        for case in cases:
+            print(f"{case['name']}...", file=sys.stderr, flush=True)
+            results['cases'][case['name']] = run_case(case, repeat=repeat, warmup=warmup)
+    return results
+
+
+def metrics(case_result):
+    """Плоский список метрик случая: {'end_to_end': с, 'warm_cache': с, 'stage:<этап>': с}."""
+    flat = {'end_to_end': case_result['end_to_end']['median'], 'warm_cache': case_result['warm_cache']['median']}
+    for name, stage in case_result['stages'].items():
+        flat[f'stage:{name}'] = stage['wall']['median']
+    return flat
+
+
+def compare(baseline, current, threshold=0.2, min_delta=0.005):
+    """
+    Сравнивает медианы метрик общих случаев. Возвращает список строк
+    (случай, метрика, базовое, текущее, отношение, регрессия).
+    """
+    rows = []
+    for case_name, case_result in current['cases'].items():
+        base_case = baseline['cases'].get(case_name)
+        if base_case is None:
+            continue
+        base_metrics = metrics(base_case)
+        for metric, value in metrics(case_result).items():
+            base_value = base_metrics.get(metric)
+            if base_value is None:
+                continue
+            ratio = value / base_value if base_value > 0 else float('inf') if value > 0 else 1.0
+            regression = ratio > 1 + threshold and value - base_value > min_delta
+            rows.append((case_name, metric, base_value, value, ratio, regression))
+    return rows
+
+
+def print_results(results):
+    for case_name, case_result in results['cases'].items():
+        inputs = case_result['inputs']
+        print(f"{case_name}: {inputs['files']} файлов, {inputs['bytes'] / 1024:.0f} КиБ; "
+              f"генерация {case_result['end_to_end']['median']:.3f} с, "
+              f"с прогретым кэшем {case_result['warm_cache']['median']:.3f} с")
+        for name, stage in case_result['stages'].items():
+            print(f"    {name:<28} {stage['wall']['median']:>8.4f} с  (cpu {stage['cpu']['median']:.4f} с)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк этапов конвейера генерации")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Выполнить замеры")
+    run_parser.add_argument('--scales', type=int, nargs='*', default=[1, 4, 10],
+                            help="Во сколько раз увеличить файлы из gui/assets (1 - как есть)")
+    run_parser.add_argument('--synthetic', type=float, nargs='*', default=[],
+                            help="Случаи с синтетическими файлами заданного масштаба (benchmarks.synthetic)")
+    run_parser.add_argument('--repeat', type=int, default=3, help="Число замеров каждого случая")
+    run_parser.add_argument('--warmup', type=int, default=1, help="Число прогревочных запусков")
+    run_parser.add_argument('--output', help="Сохранить результаты в JSON-файл")
+
+    compare_parser = subparsers.add_parser('compare', help="Сравнить результаты с базовыми")
+    compare_parser.add_argument('baseline', help="JSON с базовыми результатами")
+    compare_parser.add_argument('current', help="JSON с новыми результатами")
+    compare_parser.add_argument('--threshold', type=float, default=0.2,
+                                help="Допустимое замедление (0.2 - на 20%%)")
+    compare_parser.add_argument('--min-delta', type=float, default=0.005,
+                                help="Не считать регрессией замедление меньше этого числа секунд")
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        results = run(args.scales, repeat=args.repeat, warmup=args.warmup, synthetic_scales=args.synthetic)
+        print_results(results)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+        return 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, 'r', encoding='utf-8') as f:
+        current = json.load(f)
+    rows = compare(baseline, current, threshold=args.threshold, min_delta=args.min_delta)
+    regressions = 0
+    for case_name, metric, base_value, value, ratio, regression in rows:
+        mark = "  РЕГРЕССИЯ" if regression else ""
+        print(f"{case_name:<14} {metric:<30} {base_value:>9.4f} -> {value:>9.4f} с ({ratio - 1:+.1%}){mark}")
+        regressions += regression
+    if not rows:
+        print("Нет общих случаев для сравнения.")
+    print(f"Регрессий: {regressions}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,397 @@
+"""
+Синтетические входные файлы для бенчмарков: XSD-схема, схема услуги и сценарии
+заданного размера, согласованные между собой - ключи сценариев и привязки
+компонентов строятся из имен элементов схемы, поэтому сопоставление проходит
+и точные шаги (fieldToId, storedValues, привязки), и нечеткий поиск.
+
+Запуск из корня проекта:
+    python -m benchmarks.synthetic out/ --scale 10
+    python -m benchmarks.synthetic out/ --types 400 --depth 5 --choice-fanout 4 --seed 1
+    python cli.py generate out/synthetic.raw_esks --report -
+
+Размеры по умолчанию (--scale 1) близки к файлам из gui/assets.
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lxml import etree
+
+from core.project import PROJECT_EXTENSION, ProjectData
+
+XSD_NS = "http://www.w3.org/2001/XMLSchema"
+TARGET_NS = "http://socit.ru/kalin/orders/2.0.0"
+
+# Части имен элементов: сущность + реквизит (ApplicantLastName, ChildBirthDate, ...)
+ENTITY_WORDS = [
+    'Applicant', 'Child', 'Spouse', 'Parent', 'Representative', 'Document', 'Address', 'Contact',
+    'Payment', 'Benefit', 'Organization', 'Employer', 'Bank', 'Certificate', 'Residence', 'Income',
+]
+ATTRIBUTE_WORDS = [
+    'LastName', 'FirstName', 'MiddleName', 'BirthDate', 'BirthPlace', 'Gender', 'Snils', 'Inn',
+    'Series', 'Number', 'IssueDate', 'IssuedBy', 'Region', 'District', 'City', 'Street', 'House',
+    'Flat', 'PostIndex', 'Phone', 'Email', 'Amount', 'Account', 'Bik', 'Code', 'Name', 'Kind', 'Status',
+]
+# Имена кодов и реквизитов-справочников (OktmoCode, FiasRef, ...) - на них ведут привязки компонентов;
+# они не похожи на остальные имена, поэтому не сопоставляются нечетким поиском раньше шага привязок
+CODE_WORDS = ['Oktmo', 'Okato', 'Kladr', 'Fias', 'Ogrn', 'Kpp', 'Okved', 'Okpo', 'Oksm', 'Okopf']
+CODE_SUFFIXES = ['Code', 'Ref', 'Key']
+CODE_NAME_RATIO = 0.1
+# Простые типы, на которые ссылаются листовые элементы
+SIMPLE_TYPES = ['xsd:string', 'xsd:date', 'xsd:boolean', 'soc:stringNN-50', 'soc:stringNN-250']
+
+
+class WorkloadSpec:
+    """
+    Параметры синтетической нагрузки.
+
+    XSD:
+        global_types - число именованных complexType, распределенных по depth уровням
+            вложенности (типы уровня L ссылаются на типы уровня L + 1);
+        fields_per_type - листовых элементов в типе, complex_fields - элементов сложного типа;
+        reuse - доля сложных элементов, ссылающихся на общий именованный тип
+            (остальные объявляют вложенный анонимный complexType);
+        choice_ratio, choice_fanout - доля типов с xsd:choice и число веток в нем;
+        extension_ratio - доля типов, расширяющих базовый тип (complexContent/extension);
+        simple_content_ratio - доля листовых элементов с типом simpleContent/extension и атрибутом;
+        root_elements - число глобальных элементов.
+    Сценарии и схема услуги:
+        scenarios - число файлов сценариев;
+        field_to_id, stored_values - сколько имен элементов попадает в fieldToId и storedValues
+            (точные совпадения, шаги 1 и 2 сопоставления);
+        fuzzy_fields - полей с измененными именами элементов (нечеткий поиск, шаг 3)
+            и noise_fields - полей, не похожих ни на один элемент;
+        components, binding_ratio - компоненты схемы услуги и доля компонентов с привязкой (шаг 4).
+    """
+
+    def __init__(self, global_types=40, depth=4, fields_per_type=6, complex_fields=2, reuse=0.8,
+                 choice_ratio=0.15, choice_fanout=3, extension_ratio=0.2, simple_content_ratio=0.1,
+                 root_elements=1, scenarios=2, field_to_id=30, stored_values=15, fuzzy_fields=100,
+                 noise_fields=40, components=160, binding_ratio=0.3, seed=0):
+        self.global_types = global_types
+        self.depth = depth
+        self.fields_per_type = fields_per_type
+        self.complex_fields = complex_fields
+        self.reuse = reuse
+        self.choice_ratio = choice_ratio
+        self.choice_fanout = choice_fanout
+        self.extension_ratio = extension_ratio
+        self.simple_content_ratio = simple_content_ratio
+        self.root_elements = root_elements
+        self.scenarios = scenarios
+        self.field_to_id = field_to_id
+        self.stored_values = stored_values
+        self.fuzzy_fields = fuzzy_fields
+        self.noise_fields = noise_fields
+        self.components = components
+        self.binding_ratio = binding_ratio
+        self.seed = seed
+
+    # Параметры, пропорциональные размеру входных файлов
+    SIZE_FIELDS = ('global_types', 'root_elements', 'field_to_id', 'stored_values', 'fuzzy_fields',
+                   'noise_fields', 'components')
+
+    def scaled(self, factor):
+        """Копия параметров с размерами, увеличенными в factor раз (структура та же)."""
+        spec = copy.copy(self)
+        for name in self.SIZE_FIELDS:
+            setattr(spec, name, max(1, round(getattr(self, name) * factor)))
+        return spec
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+# --- XSD ---
+class _SchemaBuilder:
+    def __init__(self, spec, rng):
+        self.spec = spec
+        self.rng = rng
+        self.root = etree.Element(f'{{{XSD_NS}}}schema', nsmap={'xsd': XSD_NS, 'soc': TARGET_NS})
+        self.root.set('targetNamespace', TARGET_NS)
+        self.root.set('elementFormDefault', 'qualified')
+        self.root.set('attributeFormDefault', 'unqualified')
+        self.leaf_names = []  # имена листовых элементов в порядке создания
+        self.code_names = []  # листовые элементы с именами из CODE_WORDS (цели привязок)
+        self.choice_names = []  # по имени на каждый xsd:choice - поля выбора <имя>Choice в сценариях
+        self._used_names = set()
+        self._name_counter = 0
+
+    def _xsd(self, parent, tag, **attrs):
+        return etree.SubElement(parent, f'{{{XSD_NS}}}{tag}', {k: str(v) for k, v in attrs.items()})
+
+    def new_name(self, first_words=ENTITY_WORDS, second_words=ATTRIBUTE_WORDS):
+        """Уникальное имя элемента из словаря; при исчерпании сочетаний добавляется номер."""
+        name = self.rng.choice(first_words) + self.rng.choice(second_words)
+        if name in self._used_names:
+            self._name_counter += 1
+            name = f"{name}{self._name_counter}"
+        self._used_names.add(name)
+        return name
+
+    def build(self):
+        spec = self.spec
+        levels = max(1, spec.depth)
+        per_level = max(1, spec.global_types // levels)
+        self.type_names = [[f"Type{level}_{i}" for i in range(per_level)] for level in range(levels)]
+
+        for length in (50, 250):
+            simple = self._xsd(self.root, 'simpleType', name=f'stringNN-{length}')
+            restriction = self._xsd(simple, 'restriction', base='xsd:normalizedString')
+            self._xsd(restriction, 'minLength', value=1)
+            self._xsd(restriction, 'maxLength', value=length)
+
+        # Типы для simpleContent: значение с атрибутом кода
+        self.coded_types = [f"CodedValue{i}Type" for i in range(3)]
+        for name in self.coded_types:
+            complex_type = self._xsd(self.root, 'complexType', name=name)
+            extension = self._xsd(self._xsd(complex_type, 'simpleContent'), 'extension', base='xsd:string')
+            self._xsd(extension, 'attribute', name='code', type='xsd:string', use='optional')
+
+        # Базовые типы для complexContent/extension
+        self.base_types = [f"Base{i}Type" for i in range(3)]
+        for name in self.base_types:
+            sequence = self._xsd(self._xsd(self.root, 'complexType', name=name), 'sequence')
+            for _ in range(2):
+                self._leaf(sequence)
+
+        for level, names in enumerate(self.type_names):
+            for name in names:
+                complex_type = self._xsd(self.root, 'complexType', name=name)
+                self._fill_type(complex_type, level, allow_extension=True)
+
+        top_types = self.type_names[0]
+        for i in range(spec.root_elements):
+            self._xsd(self.root, 'element', name=f"Request{i}" if i else "Request",
+                      type=f"soc:{top_types[i % len(top_types)]}")
+        return self.root
+
+    def _leaf(self, parent):
+        if self.rng.random() < CODE_NAME_RATIO:
+            name = self.new_name(CODE_WORDS, CODE_SUFFIXES)
+            self.code_names.append(name)
+        else:
+            name = self.new_name()
+        if self.rng.random() < self.spec.simple_content_ratio:
+            type_name = f"soc:{self.rng.choice(self.coded_types)}"
+        else:
+            type_name = self.rng.choice(SIMPLE_TYPES)
+        attrs = {'name': name, 'type': type_name}
+        if self.rng.random() < 0.3:
+            attrs['minOccurs'] = 0
+        self._xsd(parent, 'element', **attrs)
+        self.leaf_names.append(name)
+        return name
+
+    def _complex(self, parent, level):
+        """Элемент сложного типа уровня level: ссылка на общий тип или вложенный анонимный тип."""
+        name = self.new_name()
+        if self.rng.random() < self.spec.reuse:
+            self._xsd(parent, 'element', name=name, type=f"soc:{self.rng.choice(self.type_names[level])}")
+        else:
+            element = self._xsd(parent, 'element', name=name)
+            self._fill_type(self._xsd(element, 'complexType'), level, allow_extension=False)
+        return name
+
+    def _fill_type(self, complex_type, level, allow_extension):
+        spec = self.spec
+        container = complex_type
+        if allow_extension and self.rng.random() < spec.extension_ratio:
+            container = self._xsd(self._xsd(complex_type, 'complexContent'), 'extension',
+                                  base=f"soc:{self.rng.choice(self.base_types)}")
+        has_children = level + 1 < len(self.type_names)
+        if spec.choice_fanout > 1 and self.rng.random() < spec.choice_ratio:
+            # Тип с xsd:choice: ветки - листовые элементы и (если есть уровень ниже) один сложный
+            particle = self._xsd(container, 'choice')
+            for branch in range(spec.choice_fanout):
+                if has_children and branch == 0:
+                    self._complex(particle, level + 1)
+                else:
+                    self._leaf(particle)
+            self.choice_names.append(self.new_name())
+        else:
+            particle = self._xsd(container, 'sequence')
+            for _ in range(spec.fields_per_type):
+                self._leaf(particle)
+            if has_children:
+                for _ in range(spec.complex_fields):
+                    self._complex(particle, level + 1)
+        if container is complex_type and self.rng.random() < spec.simple_content_ratio:
+            self._xsd(complex_type, 'attribute', name='id', type='xsd:string')
+
+
+# --- Сценарии и схема услуги ---
+def _perturb(name, rng):
+    """Имя поля, похожее на имя элемента (для нечеткого поиска)."""
+    variant = rng.randrange(4)
+    if variant == 0:
+        return name[0].lower() + name[1:]  # lowerCamelCase
+    if variant == 1:
+        return name + rng.choice(['Value', 'Txt', 'Fld'])
+    if variant == 2 and len(name) > 6:
+        i = rng.randrange(1, len(name) - 1)
+        return name[:i] + name[i + 1:]  # пропущенная буква
+    return name.replace('Number', 'Num').replace('Date', 'Dt').replace('Name', 'Nm') + 'Field'
+
+
+def _noise_name(rng):
+    return ''.join(rng.choice('qwxzjkvy') for _ in range(rng.randint(6, 12)))
+
+
+def _chunks(items, count):
+    """Делит items на count частей почти равного размера."""
+    count = max(1, count)
+    size, extra = divmod(len(items), count)
+    parts, start = [], 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        parts.append(items[start:end])
+        start = end
+    return parts
+
+
+def _build_documents(spec, builder, rng):
+    code_names = set(builder.code_names)
+    leaf_names = [name for name in dict.fromkeys(builder.leaf_names) if name not in code_names]
+    rng.shuffle(leaf_names)
+    exact_count = min(len(leaf_names), spec.field_to_id + spec.stored_values)
+    field_to_id_names = leaf_names[:min(spec.field_to_id, exact_count)]
+    stored_names = leaf_names[len(field_to_id_names):exact_count]
+    rest = leaf_names[exact_count:] or leaf_names
+    fuzzy_names = [_perturb(rng.choice(rest), rng) for _ in range(spec.fuzzy_fields)]
+    noise_names = [_noise_name(rng) for _ in range(spec.noise_fields)]
+
+    # Компоненты схемы услуги; привязки ведут к кодовым именам элементов,
+    # id большинства таких компонентов есть в fieldToId (точная привязка), остальные - для нечеткой
+    binding_targets = builder.code_names or rest
+    components = []
+    bound_ids = []
+    for i in range(spec.components):
+        component = {'id': f"comp{i}", 'name': f"Компонент {i}", 'type': rng.choice(['StringInput', 'DateInput',
+                                                                                      'Lookup', 'QuestionScr'])}
+        if rng.random() < spec.binding_ratio:
+            component['binding'] = f"order.{rng.choice(['userData', 'childData', 'docs'])}.{rng.choice(binding_targets)}"
+            if rng.random() < 0.8:
+                bound_ids.append(component['id'])
+        component['required'] = rng.random() < 0.5
+        component['attrs'] = {'label': component['name']}
+        components.append(component)
+    service_schema = {
+        'service': "Синтетическая услуга",
+        'serviceName': "Синтетическая услуга",
+        'screens': [{'id': f"s{i}", 'name': f"Экран {i}", 'type': 'UNIQUE',
+                     'components': [c['id'] for c in part]}
+                    for i, part in enumerate(_chunks(components, max(1, len(components) // 8)))],
+        'applicationFields': components,
+    }
+
+    # Сценарии: точные и нечеткие ключи распределены по файлам
+    c_keys = iter(range(1, 10 ** 9))
+    scenarios = []
+    parts = zip(_chunks(field_to_id_names + bound_ids, spec.scenarios),
+                _chunks(stored_names, spec.scenarios),
+                _chunks(fuzzy_names + noise_names, spec.scenarios),
+                _chunks(builder.choice_names, spec.scenarios))
+    for n, (id_names, stored, flat, choices) in enumerate(parts, 1):
+        field_to_id = {name: f"c{next(c_keys)}" for name in id_names}
+        current_value = {c_key: {'visited': True, 'value': f"значение {c_key}"} for c_key in field_to_id.values()}
+        groups = [dict.fromkeys(group, "значение") for group in _chunks(flat, max(1, len(flat) // 10))]
+        scenarios.append({
+            'serviceCode': "00000000",
+            'orderId': 1000 + n,
+            'currentValue': current_value,
+            'applicantAnswers': {f"{name}Choice": {'visited': True, 'value': 'v1'} for name in choices},
+            'cycledApplicantAnswers': {'answerlist': [{'items': [{'fieldToId': field_to_id}]}]},
+            'storedValues': {name: f"значение {name}" for name in stored},
+            'participants': [{'person': group} for group in groups],
+        })
+    return service_schema, scenarios
+
+
+def generate_workload(directory, spec=None, name='synthetic'):
+    """
+    Записывает в directory XSD, схему услуги, spec.scenarios сценариев и файл проекта.
+    Одинаковые параметры (включая seed) дают одинаковые файлы.
+
+    Returns:
+        dict: {'name', 'xsd', 'service_schema', 'scenarios', 'project'} - пути к файлам
+        (в том же виде, что и случаи benchmarks.pipeline).
+    """
+    spec = spec or WorkloadSpec()
+    rng = random.Random(spec.seed)
+    builder = _SchemaBuilder(spec, rng)
+    schema = builder.build()
+    service_schema, scenarios = _build_documents(spec, builder, rng)
+
+    os.makedirs(directory, exist_ok=True)
+    xsd_path = os.path.join(directory, f"{name}.xsd")
+    etree.ElementTree(schema).write(xsd_path, encoding='UTF-8', xml_declaration=True, pretty_print=True)
+    service_schema_path = os.path.join(directory, f"{name}-service.json")
+    with open(service_schema_path, 'w', encoding='utf-8') as f:
+        json.dump(service_schema, f, ensure_ascii=False)
+    scenario_paths = []
+    for n, scenario in enumerate(scenarios, 1):
+        path = os.path.join(directory, f"{name}-scenario{n}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(scenario, f, ensure_ascii=False)
+        scenario_paths.append(path)
+
+    project_path = os.path.join(directory, f"{name}{PROJECT_EXTENSION}")
+    project = ProjectData(json_schema_path=os.path.basename(service_schema_path),
+                          json_examples_paths=[os.path.basename(path) for path in scenario_paths],
+                          xsd_schema_path=os.path.basename(xsd_path))
+    with open(project_path, 'w', encoding='utf-8') as f:
+        json.dump(project.to_dict(), f, ensure_ascii=False, indent=4)
+    return {'name': name, 'xsd': xsd_path, 'service_schema': service_schema_path, 'scenarios': scenario_paths,
+            'project': project_path}
+
+
+def main(argv=None):
+    defaults = WorkloadSpec()
+    parser = argparse.ArgumentParser(description="Синтетические входные файлы для бенчмарков")
+    parser.add_argument('output_dir', help="Каталог для файлов")
+    parser.add_argument('--name', default='synthetic', help="Префикс имен файлов")
+    parser.add_argument('--scale', type=float, default=1.0, help="Множитель размеров (1 - как gui/assets)")
+    for option, attr, kind, help_text in (
+            ('--types', 'global_types', int, "Число именованных complexType"),
+            ('--depth', 'depth', int, "Уровней вложенности типов"),
+            ('--fields', 'fields_per_type', int, "Листовых элементов в типе"),
+            ('--complex-fields', 'complex_fields', int, "Элементов сложного типа в типе"),
+            ('--reuse', 'reuse', float, "Доля ссылок на общие типы (0..1)"),
+            ('--choice-ratio', 'choice_ratio', float, "Доля типов с xsd:choice"),
+            ('--choice-fanout', 'choice_fanout', int, "Веток в xsd:choice"),
+            ('--extension-ratio', 'extension_ratio', float, "Доля типов с complexContent/extension"),
+            ('--simple-content-ratio', 'simple_content_ratio', float, "Доля элементов с simpleContent"),
+            ('--roots', 'root_elements', int, "Глобальных элементов"),
+            ('--scenarios', 'scenarios', int, "Файлов сценариев"),
+            ('--field-to-id', 'field_to_id', int, "Имен элементов в fieldToId"),
+            ('--stored-values', 'stored_values', int, "Имен элементов в storedValues"),
+            ('--fuzzy-fields', 'fuzzy_fields', int, "Полей с измененными именами элементов"),
+            ('--noise-fields', 'noise_fields', int, "Полей, не похожих на элементы"),
+            ('--components', 'components', int, "Компонентов схемы услуги"),
+            ('--binding-ratio', 'binding_ratio', float, "Доля компонентов с привязкой"),
+            ('--seed', 'seed', int, "Начальное значение генератора случайных чисел")):
+        parser.add_argument(option, dest=attr, type=kind, default=None,
+                            help=f"{help_text} (по умолчанию {getattr(defaults, attr)})")
+    args = parser.parse_args(argv)
+
+    spec = defaults.scaled(args.scale) if args.scale != 1 else defaults
+    for attr in vars(defaults):
+        value = getattr(args, attr, None)
+        if value is not None:
+            setattr(spec, attr, value)
+    case = generate_workload(args.output_dir, spec, name=args.name)
+    for key in ('xsd', 'service_schema', 'project'):
+        print(case[key])
+    for path in case['scenarios']:
+        print(path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
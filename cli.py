@@ -0,0 +1,187 @@
+"""
+Генерация VM-шаблонов без графического интерфейса.
+
+    python cli.py generate проект.raw_esks
+    python cli.py generate projects/ --output-dir out/ --jobs 4
+    python cli.py generate manifest.txt
+    python cli.py watch projects/ --output-dir out/
+    python cli.py serve --port 8765
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+
+from core.analysis_cache import default_cache_dir
+from core.batch import collect_projects, configure_logging, run_batch
+
+
+def _add_cache_arguments(parser):
+    parser.add_argument('--cache-dir', default=None,
+                        help=f"Каталог кэша анализа (по умолчанию {default_cache_dir()})")
+    parser.add_argument('--no-cache', action='store_true', help="Не использовать кэш анализа")
+
+
+def cmd_generate(args):
+    try:
+        projects = collect_projects(args.targets)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 2
+    if not projects:
+        print("Проекты не найдены.", file=sys.stderr)
+        return 2
+
+    def report(result):
+        if result.ok:
+            print(f"OK    {result.project_path} -> {result.output_path} ({result.elapsed:.2f} с)")
+        else:
+            print(f"ОШИБКА {result.project_path}: {result.error}", file=sys.stderr)
+
+    try:
+        results = run_batch(projects, output_dir=args.output_dir, jobs=args.jobs, cache_dir=args.cache_dir,
+                            use_cache=not args.no_cache, on_result=report, report=bool(args.report),
+                            profile_dir=args.profile_dir, trace_memory=args.trace_memory)
+    except ValueError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 2
+    if args.report or args.trace_memory:
+        _write_report(args.report or '-', results)
+    failed = sum(1 for result in results if not result.ok)
+    print(f"Готово: {len(results) - failed} из {len(results)} проектов.")
+    return 1 if failed else 0
+
+
+def _write_report(report_path, results):
+    """Отчеты по этапам: JSON в файл или таблица в stderr, если указан '-'."""
+    if report_path == '-':
+        from core.instrumentation import format_report
+        for result in results:
+            if result.report:
+                print(f"\n{result.project_path}\n{format_report(result.report)}", file=sys.stderr)
+        return
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump([result.to_dict() for result in results], f, ensure_ascii=False, indent=2)
+
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def cmd_watch(args):
+    from core.watch import ProjectWatcher
+    try:
+        projects = collect_projects(args.targets)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 2
+    if not projects:
+        print("Проекты не найдены.", file=sys.stderr)
+        return 2
+
+    def report(result):
+        if result.ok:
+            print(f"OK    {result.project_path} -> {result.output_path} ({result.elapsed:.2f} с)", flush=True)
+        else:
+            print(f"ОШИБКА {result.project_path}: {result.error}", file=sys.stderr, flush=True)
+
+    try:
+        watcher = ProjectWatcher(projects, output_dir=args.output_dir, cache_dir=args.cache_dir,
+                                 use_cache=not args.no_cache, interval=args.interval,
+                                 debounce=args.debounce, on_result=report)
+    except ValueError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 2
+    print(f"Наблюдение за {len(projects)} проектами (Ctrl+C - остановить)", file=sys.stderr)
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    try:
+        watcher.run(initial=not args.no_initial)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def cmd_serve(args):
+    from core.server import GenerationService, create_server
+    try:
+        server = create_server(GenerationService(args.max_entries), host=args.host, port=args.port,
+                               socket_path=args.socket)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 2
+    host = f"[{args.host}]" if ':' in args.host else args.host
+    where = args.socket or f"http://{host}:{server.server_address[1]}"
+    print(f"Сервер генерации запущен: {where} (Ctrl+C - остановить)", file=sys.stderr)
+    # SIGTERM останавливает сервер так же, как Ctrl+C (с удалением сокета)
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+    return 0
+
+
+def _add_verbose_argument(parser):
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help="Подробный журнал: -v - ход генерации, -vv - отладка по каждому элементу")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description="Генератор VM-шаблонов (без GUI)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generate = subparsers.add_parser('generate', help="Сгенерировать шаблоны для проектов")
+    generate.add_argument('targets', nargs='+',
+                          help="Файлы проектов (.raw_esks), каталоги с проектами или манифесты (список путей)")
+    generate.add_argument('-o', '--output-dir', default=None,
+                          help="Каталог для .vm-файлов (по умолчанию - рядом с проектом)")
+    generate.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                          help="Число параллельных процессов")
+    generate.add_argument('--report', default=None, metavar='FILE',
+                          help="Записать время и счетчики этапов каждого проекта в JSON-файл ('-' - таблица в stderr)")
+    generate.add_argument('--profile-dir', default=None, metavar='DIR',
+                          help="Сохранить профиль cProfile каждого проекта (<проект>.prof) в каталог")
+    generate.add_argument('--trace-memory', action='store_true',
+                          help="Замерить пик и прирост памяти по этапам (tracemalloc, медленно); "
+                               "результат - в отчете --report (по умолчанию таблица в stderr)")
+    _add_verbose_argument(generate)
+    _add_cache_arguments(generate)
+    generate.set_defaults(func=cmd_generate)
+
+    watch = subparsers.add_parser('watch', help="Перегенерировать шаблоны при изменении входных файлов")
+    watch.add_argument('targets', nargs='+', help="Файлы проектов, каталоги с проектами или манифесты")
+    watch.add_argument('-o', '--output-dir', default=None,
+                       help="Каталог для .vm-файлов (по умолчанию - рядом с проектом)")
+    watch.add_argument('--interval', type=float, default=1.0, help="Период опроса файлов, с")
+    watch.add_argument('--debounce', type=float, default=0.5,
+                       help="Сколько секунд файлы должны не меняться перед генерацией")
+    watch.add_argument('--no-initial', action='store_true', help="Не генерировать все проекты при запуске")
+    _add_verbose_argument(watch)
+    _add_cache_arguments(watch)
+    watch.set_defaults(func=cmd_watch)
+
+    serve = subparsers.add_parser('serve', help="Запустить локальный сервер генерации (HTTP или Unix-сокет)")
+    serve.add_argument('--host', default='127.0.0.1', help="Локальный адрес HTTP-сервера")
+    serve.add_argument('--port', type=int, default=8765, help="Порт HTTP-сервера (0 - любой свободный)")
+    serve.add_argument('--socket', default=None, help="Путь к Unix-сокету вместо HTTP")
+    serve.add_argument('--max-entries', type=int, default=64,
+                       help="Сколько разобранных входных файлов держать в памяти")
+    _add_verbose_argument(serve)
+    serve.set_defaults(func=cmd_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    configure_logging({0: logging.WARNING, 1: logging.INFO}.get(args.verbose, logging.DEBUG))
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,308 @@
+import hashlib
+import importlib
+import logging
+import marshal
+import os
+import pickle
+import sys
+import tempfile
+
+import core.final_gen
+import core.json_mapper_gen
+from core.instrumentation import ensure_instrumentation
+from core.progress import ensure_progress
+from core.schema_model import load_schema
+
+logger = logging.getLogger(__name__)
+
+# Меняется при несовместимом изменении формата записей кэша
+CACHE_FORMAT_VERSION = 1
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+_ENTRY_SUFFIX = '.pickle'
+
+# Модули, от кода которых зависят сохраняемые результаты
+_CODE_MODULES = ('final_gen.py', 'json_mapper_gen.py', 'json_loader.py', 'json_stream.py', 'schema_model.py',
+                 'traversal.py', 'analysis_cache.py')
+_code_version = None
+
+
+def _module_code(module_file):
+    """
+    Код модуля core для версии: исходник, а если его нет (собранный exe) - байт-код
+    из загрузчика модуля. None, если недоступно ни то, ни другое.
+    """
+    try:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), module_file), 'rb') as f:
+            return f.read()
+    except OSError:
+        pass
+    module_name = 'core.' + os.path.splitext(module_file)[0]
+    try:
+        module = importlib.import_module(module_name)
+        code = module.__loader__.get_code(module_name)
+    except (ImportError, AttributeError):
+        return None
+    return marshal.dumps(code) if code is not None else None
+
+
+def _executable_stamp():
+    """Размер и время изменения исполняемого файла - различаются у разных сборок exe."""
+    try:
+        st = os.stat(sys.executable)
+    except OSError:
+        return sys.executable.encode()
+    return f"{sys.executable}:{st.st_size}:{st.st_mtime_ns}".encode()
+
+
+def code_version():
+    """
+    Версия кода анализаторов: хэш исходников (или байт-кода) модулей core, от которых
+    зависят результаты. После любого изменения этих модулей старые записи кэша перестают находиться.
+    Если код модуля получить нельзя, в версию входит отметка исполняемого файла,
+    поэтому новая сборка приложения не использует записи предыдущей.
+    """
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256(f"format:{CACHE_FORMAT_VERSION}".encode())
+        for module_file in _CODE_MODULES:
+            code = _module_code(module_file)
+            digest.update(module_file.encode())
+            digest.update(code if code is not None else _executable_stamp())
+        _code_version = digest.hexdigest()[:16]
+    return _code_version
+
+
+def file_digest(path):
+    """SHA-256 содержимого файла."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def default_cache_dir():
+    """Каталог кэша: %LOCALAPPDATA% в Windows, иначе $XDG_CACHE_HOME или ~/.cache."""
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') \
+        or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'gosuslugi-vm-generator', 'analysis')
+
+
+class AnalysisCache:
+    """
+    Кэш результатов анализа на диске с адресацией по содержимому.
+
+    Ключ записи - вид результата, хэш содержимого входного файла и версия кода,
+    поэтому переименование файла не сбрасывает кэш, а изменение файла или кода
+    анализаторов - сбрасывает. Общий размер записей ограничен max_bytes:
+    при превышении удаляются записи, к которым дольше всего не обращались.
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_path(self, kind, content_hash):
+        return os.path.join(self.directory, f"{kind}-{content_hash}-{code_version()}{_ENTRY_SUFFIX}")
+
+    def get(self, kind, content_hash):
+        """Сохраненный результат или None, если записи нет или она повреждена."""
+        path = self._entry_path(kind, content_hash)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            logger.warning("Повреждена запись кэша %s: %s", path, e)
+            self._remove(path)
+            self.misses += 1
+            return None
+        try:
+            # Время доступа для вытеснения хранится в mtime (atime часто отключено)
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, kind, content_hash, value):
+        """Сохраняет результат; ошибки записи не прерывают генерацию."""
+        path = self._entry_path(kind, content_hash)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Запись через временный файл и os.replace: параллельный читатель
+            # никогда не увидит недописанную запись
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+            except BaseException:
+                self._remove(tmp_path)
+                raise
+        except OSError as e:
+            logger.warning("Не удалось записать кэш %s: %s", path, e)
+            return
+        self._evict()
+
+    def clear(self):
+        """Удаляет все записи кэша."""
+        for path, _, _ in self._entries():
+            self._remove(path)
+
+    def _entries(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        entries = []
+        for name in names:
+            if not name.endswith(_ENTRY_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+            self._remove(path)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _strip_nodes(xsd_analysis):
+    """Узлы lxml не сериализуются и маппингу не нужны - в кэш они не попадают."""
+    for info in xsd_analysis.get('elements_by_path', {}).values():
+        info['node'] = None
+    return xsd_analysis
+
+
+def load_xsd_results(cache, xsd_path, progress=None, instrumentation=None):
+    """
+    Скелет VM-шаблона и анализ XSD для файла xsd_path.
+    При попадании в кэш XSD не читается и не разбирается.
+    progress, instrumentation - см. compute_xsd_results; попадания и промахи
+    кэша считаются в счетчиках cache.<вид>.hits/misses.
+
+    Returns:
+        tuple: (скелет шаблона, результат XSDSchemaAnalyzer.analyze()).
+
+    Raises:
+        ValueError: Если XSD-схему не удалось загрузить.
+    """
+    try:
+        content_hash = file_digest(xsd_path)
+    except FileNotFoundError:
+        logger.error("Файл XSD не найден: %s", xsd_path)
+        raise ValueError(f"Не удалось загрузить XSD-схему: {xsd_path}")
+    instrumentation = ensure_instrumentation(instrumentation)
+    cached = cache.get('xsd', content_hash)
+    if cached is not None:
+        logger.debug("XSD-схема %s взята из кэша", xsd_path)
+        instrumentation.count('cache.xsd.hits')
+        return cached
+
+    instrumentation.count('cache.xsd.misses')
+    results = compute_xsd_results(xsd_path, progress, instrumentation)
+    cache.put('xsd', content_hash, results)
+    return results
+
+
+def compute_xsd_results(xsd_path, progress=None, instrumentation=None):
+    """То же, что load_xsd_results, но всегда с разбором XSD и без кэша."""
+    instrumentation = ensure_instrumentation(instrumentation)
+    with instrumentation.stage('xsd_load'):
+        schema = load_schema(xsd_path)
+    if schema is None:
+        raise ValueError(f"Не удалось загрузить XSD-схему: {xsd_path}")
+    with instrumentation.stage('skeleton'):
+        skeleton = core.final_gen.generate(schema, progress, instrumentation)
+    with instrumentation.stage('xsd_analysis'):
+        xsd_analysis = _strip_nodes(core.json_mapper_gen.XSDSchemaAnalyzer(schema, progress).analyze())
+    return skeleton, xsd_analysis
+
+
+def load_scenario_analysis(cache, scenario_path):
+    """
+    Анализ одного JSON-сценария (как JSONScenarioAnalyzer._analyze_single_scenario).
+    Возвращает None, если сценарий не загрузился (такие сценарии пропускаются).
+    """
+    try:
+        content_hash = file_digest(scenario_path)
+    except FileNotFoundError:
+        # Как при ошибке загрузки в analyze_scenario_file: сценарий пропускается
+        logger.error("Ошибка при загрузке JSON-сценария %s: файл не найден", scenario_path)
+        return None
+    cached = cache.get('scenario', content_hash)
+    if cached is not None:
+        logger.debug("JSON-сценарий %s взят из кэша", scenario_path)
+        return cached
+
+    scenario_analysis = core.json_mapper_gen.analyze_scenario_file(scenario_path)
+    if scenario_analysis is not None:
+        cache.put('scenario', content_hash, scenario_analysis)
+    return scenario_analysis
+
+
+def load_scenario_results(cache, scenario_paths, progress=None, instrumentation=None):
+    """Объединенный анализ JSON-сценариев; каждый сценарий кэшируется отдельно."""
+    progress = ensure_progress(progress)
+    instrumentation = ensure_instrumentation(instrumentation)
+    progress.stage('scenarios', total=len(scenario_paths))
+    parts = []
+    for scenario_path in scenario_paths:
+        hits = cache.hits
+        part = load_scenario_analysis(cache, scenario_path)
+        instrumentation.count('cache.scenario.hits' if cache.hits > hits else 'cache.scenario.misses')
+        if part is not None:
+            parts.append(part)
+        progress.advance(scenario_path)
+    return core.json_mapper_gen.merge_scenario_analyses(parts)
+
+
+def load_service_schema_results(cache, service_schema_path, progress=None, instrumentation=None):
+    """Анализ JSON-схемы услуги (результат JSONServiceSchemaAnalyzer.analyze())."""
+    instrumentation = ensure_instrumentation(instrumentation)
+    try:
+        content_hash = file_digest(service_schema_path)
+    except FileNotFoundError:
+        # Как без кэша: анализатор сообщит об ошибке загрузки и вернет пустой результат
+        return compute_service_schema_results(service_schema_path, progress)
+    cached = cache.get('service', content_hash)
+    if cached is not None:
+        logger.debug("JSON-схема услуги %s взята из кэша", service_schema_path)
+        instrumentation.count('cache.service.hits')
+        return cached
+    instrumentation.count('cache.service.misses')
+
+    service_schema_analysis = compute_service_schema_results(service_schema_path, progress)
+    if service_schema_analysis:
+        cache.put('service', content_hash, service_schema_analysis)
+    return service_schema_analysis
+
+
+def compute_service_schema_results(service_schema_path, progress=None):
+    """То же, что load_service_schema_results, но без кэша."""
+    # Потоковый разбор: весь документ схемы услуги в памяти не строится
+    return core.json_mapper_gen.JSONServiceSchemaAnalyzer(service_schema_path, streaming=True,
+                                                          progress=progress).analyze()
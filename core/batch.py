@@ -0,0 +1,239 @@
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import core.mid_vm
+from core.analysis_cache import AnalysisCache
+from core.project import PROJECT_EXTENSION, find_missing_files, load_project
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+
+class ProjectResult:
+    """Результат генерации одного проекта."""
+    __slots__ = ('project_path', 'output_path', 'error', 'elapsed', 'report')
+
+    def __init__(self, project_path, output_path, error=None, elapsed=0.0, report=None):
+        self.project_path = project_path
+        self.output_path = output_path
+        self.error = error
+        self.elapsed = elapsed
+        self.report = report  # отчет core.instrumentation, если он запрошен
+
+    def to_dict(self):
+        return {'project': self.project_path, 'output': self.output_path, 'error': self.error,
+                'elapsed': self.elapsed, 'report': self.report}
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def _is_project_file(path):
+    """Файл проекта - JSON-объект; всё остальное считается списком проектов (манифестом)."""
+    if path.endswith(PROJECT_EXTENSION):
+        return True
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return isinstance(json.load(f), dict)
+    except (ValueError, UnicodeDecodeError):
+        return False
+
+
+def _read_manifest(manifest_path):
+    """Пути к проектам из манифеста: по одному на строку, '#' - комментарий."""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    paths = []
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                paths.append(os.path.normpath(os.path.join(base_dir, line)))
+    return paths
+
+
+def collect_projects(targets):
+    """
+    Список файлов проектов по аргументам командной строки.
+
+    Каждый аргумент - файл проекта (.raw_esks или любой JSON-файл в формате ProjectManager),
+    каталог (все *.raw_esks в нем и подкаталогах) или манифест (текстовый список
+    путей к проектам или каталогам, относительно каталога манифеста).
+    Порядок сохраняется, повторы убираются.
+    """
+    projects = []
+    pending = list(targets)
+    seen_manifests = set()
+    while pending:
+        target = pending.pop(0)
+        if os.path.isdir(target):
+            found = []
+            for root, dirs, files in os.walk(target):
+                dirs.sort()
+                found.extend(os.path.join(root, name) for name in sorted(files) if name.endswith(PROJECT_EXTENSION))
+            projects.extend(found)
+        elif not os.path.isfile(target):
+            raise FileNotFoundError(f"Не найден проект, каталог или манифест: {target}")
+        elif _is_project_file(target):
+            projects.append(target)
+        else:
+            manifest = os.path.abspath(target)
+            if manifest in seen_manifests:
+                continue
+            seen_manifests.add(manifest)
+            pending[0:0] = _read_manifest(target)
+    return list(dict.fromkeys(os.path.abspath(path) for path in projects))
+
+
+def configure_logging(level):
+    """
+    Журнал в stderr для командной строки и процессов пакетного режима.
+    По умолчанию (WARNING) выводятся только предупреждения и ошибки;
+    подробности по каждому элементу - на уровне DEBUG.
+    """
+    logging.basicConfig(level=level, format=LOG_FORMAT, stream=sys.stderr)
+
+
+def _path_in_directory(project_path, directory, base_dir, extension):
+    """
+    Файл проекта с расширением extension в directory; при base_dir внутри directory
+    повторяется путь каталога проекта относительно base_dir.
+    """
+    name = os.path.splitext(os.path.basename(project_path))[0] + extension
+    if base_dir:
+        directory = os.path.join(directory, os.path.relpath(os.path.dirname(os.path.abspath(project_path)), base_dir))
+    return os.path.normpath(os.path.join(directory, name))
+
+
+def output_path_for(project_path, output_dir=None, base_dir=None):
+    """
+    Путь к .vm-файлу проекта: рядом с проектом или в output_dir
+    (с подкаталогами относительно base_dir, см. output_paths_for).
+    """
+    if not output_dir:
+        return os.path.join(os.path.dirname(project_path), os.path.splitext(os.path.basename(project_path))[0] + '.vm')
+    return _path_in_directory(project_path, output_dir, base_dir, '.vm')
+
+
+def common_project_dir(project_paths):
+    """Общий каталог проектов (None, если его нет - например, проекты на разных дисках)."""
+    if not project_paths:
+        return None
+    try:
+        return os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in project_paths])
+    except ValueError:
+        return None
+
+
+def _check_unique_targets(project_paths, target_paths):
+    """ValueError, если у двух проектов совпадает путь результата."""
+    owners = {}
+    for project_path, target_path in zip(project_paths, target_paths):
+        key = os.path.normcase(os.path.abspath(target_path))
+        if key in owners:
+            raise ValueError(f"Проекты {owners[key]} и {project_path} записывают результат в один файл: {target_path}")
+        owners[key] = project_path
+
+
+def output_paths_for(project_paths, output_dir=None):
+    """
+    Пути к .vm-файлам проектов. В output_dir повторяется структура каталогов проектов
+    относительно их общего каталога, поэтому одноименные проекты из разных каталогов
+    не перезаписывают друг друга.
+
+    Raises:
+        ValueError: Если два проекта все же получают один путь (например, a/svc.raw_esks и a/svc.json).
+    """
+    base_dir = common_project_dir(project_paths) if output_dir else None
+    paths = [output_path_for(path, output_dir, base_dir) for path in project_paths]
+    _check_unique_targets(project_paths, paths)
+    return paths
+
+
+def generate_project(project_path, output_path, cache_dir=None, use_cache=True, report=False, profile_path=None,
+                     trace_memory=False):
+    """
+    Генерирует VM-шаблон одного проекта и записывает его в output_path.
+    Ошибки не выбрасываются, а возвращаются в ProjectResult (для пакетного режима).
+    report=True - в результат добавляется отчет о времени и счетчиках этапов;
+    profile_path - сохранить статистику cProfile генерации (включает отчет);
+    trace_memory=True - добавить в отчет замер памяти по этапам (tracemalloc).
+    """
+    started = time.perf_counter()
+    stage_report = None
+    try:
+        project = load_project(project_path)
+        if not project.xsd_schema_path or not project.json_schema_path:
+            raise ValueError("В проекте не указаны XSD-схема или JSON-схема услуги")
+        missing_files = find_missing_files(project)
+        if missing_files:
+            raise FileNotFoundError("Не найдены файлы: " + ", ".join(missing_files))
+        cache = AnalysisCache(cache_dir) if use_cache else None
+        if profile_path:
+            os.makedirs(os.path.dirname(os.path.abspath(profile_path)), exist_ok=True)
+        if report or profile_path or trace_memory:
+            template_content, stage_report = core.mid_vm.generate_template_with_report(
+                project.xsd_schema_path, project.json_schema_path, project.json_examples_paths, cache=cache,
+                profile_path=profile_path, trace_memory=trace_memory)
+        else:
+            template_content = core.mid_vm.generate_template(project.xsd_schema_path, project.json_schema_path,
+                                                             project.json_examples_paths, cache=cache)
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(template_content)
+    except Exception as e:
+        return ProjectResult(project_path, output_path, f"{type(e).__name__}: {e}", time.perf_counter() - started,
+                             stage_report)
+    return ProjectResult(project_path, output_path, None, time.perf_counter() - started, stage_report)
+
+
+def profile_path_for(project_path, profile_dir, base_dir=None):
+    """Путь к файлу cProfile проекта в profile_dir (с подкаталогами относительно base_dir)."""
+    if not profile_dir:
+        return None
+    return _path_in_directory(project_path, profile_dir, base_dir, '.prof')
+
+
+def run_batch(project_paths, output_dir=None, jobs=1, cache_dir=None, use_cache=True, on_result=None,
+              report=False, profile_dir=None, trace_memory=False):
+    """
+    Генерирует шаблоны для списка проектов; при jobs > 1 - в пуле процессов.
+    on_result(result) вызывается по мере готовности; возвращается список результатов
+    в порядке project_paths. report, profile_dir и trace_memory - см. generate_project.
+
+    Raises:
+        ValueError: Если результаты двух проектов попадают в один файл (см. output_paths_for);
+            генерация тогда не начинается.
+    """
+    project_paths = list(project_paths)
+    output_paths = output_paths_for(project_paths, output_dir)
+    base_dir = common_project_dir(project_paths)
+    profile_paths = [profile_path_for(path, profile_dir, base_dir) for path in project_paths]
+    if profile_dir:
+        _check_unique_targets(project_paths, profile_paths)
+    tasks = list(zip(project_paths, output_paths, profile_paths))
+    results = []
+    if jobs <= 1 or len(tasks) <= 1:
+        for project_path, output_path, profile_path in tasks:
+            result = generate_project(project_path, output_path, cache_dir, use_cache, report, profile_path,
+                                      trace_memory)
+            if on_result:
+                on_result(result)
+            results.append(result)
+        return results
+
+    # Процессы пула журналируют с тем же уровнем, что и основной процесс
+    log_level = logging.getLogger().getEffectiveLevel()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=configure_logging, initargs=(log_level,)) as pool:
+        futures = [pool.submit(generate_project, project_path, output_path, cache_dir, use_cache, report, profile_path,
+                               trace_memory)
+                   for project_path, output_path, profile_path in tasks]
+        for future in futures:
+            result = future.result()
+            if on_result:
+                on_result(result)
+            results.append(result)
+    return results
@@ -1,42 +1,25 @@
+import io
+import logging
 import os
+from collections import Counter
 from lxml import etree
+from core.instrumentation import ensure_instrumentation
+from core.progress import ensure_progress
+from core.schema_model import ensure_schema
+from core.traversal import run_frames
 
-def get_schema_elements_and_types(xsd_path):
-    try:
-        with open(xsd_path, 'r', encoding='utf-8') as f:
-            schema_doc = etree.parse(f)
-    except etree.XMLSyntaxError as e:
-        print(f"Ошибка парсинга XSD: {e}")
-        return {}, {}, None, "", {}
-    except FileNotFoundError:
-        print(f"Файл XSD не найден: {xsd_path}")
-        return {}, {}, None, "", {}
-
-    root = schema_doc.getroot()
-    xsd_ns = "http://www.w3.org/2001/XMLSchema"
-    nsmap = {'xs': xsd_ns}
-
-    target_ns = root.get('targetNamespace')
-    original_nsmap = root.nsmap
-    # element_nsmap не нужен для генерации строки шаблона, но сохраняем для информации
-    # element_nsmap = {k: v for k, v in original_nsmap.items() if k != 'xs' and v != xsd_ns}
-    # Сохраняем оригинальный nsmap, чтобы знать префиксы
-    relevant_nsmap = {k: v for k, v in original_nsmap.items() if k != 'xs' and v != xsd_ns}
-
-    global_elements = {}
-    global_types = {}
-
-    for elem in root.xpath('xs:element[@name]', namespaces=nsmap):
-        name = elem.get('name')
-        if name:
-            global_elements[name] = elem
+logger = logging.getLogger(__name__)
 
-    for elem in root.xpath('(xs:complexType[@name] | xs:simpleType[@name])', namespaces=nsmap):
-        name = elem.get('name')
-        if name:
-            global_types[name] = elem
 
-    return global_elements, global_types, schema_doc, target_ns, relevant_nsmap
+def get_schema_elements_and_types(xsd_source):
+    """
+    Возвращает глобальные элементы и типы схемы.
+    xsd_source - путь к XSD-файлу или уже скомпилированная CompiledSchema.
+    """
+    schema = ensure_schema(xsd_source)
+    if schema is None:
+        return {}, {}, None, "", {}
+    return schema.global_elements, schema.global_types, schema.schema_doc, schema.target_ns, schema.nsmap
 
 def resolve_type(element_or_attr, schema_doc, global_types, target_ns, xsd_ns_map):
     type_name = element_or_attr.get('type')
@@ -51,487 +34,479 @@ def resolve_type(element_or_attr, schema_doc, global_types, target_ns, xsd_ns_ma
                 return global_types[local_name], local_name
     return None, None
 
-# ... (вставьте сюда весь предыдущий код, заменив только эту функцию) ...
+INDENT = "  "
+XSD_NS = "http://www.w3.org/2001/XMLSchema"
+# Сколько строк фрагментов хранит FragmentCache (по умолчанию)
+FRAGMENT_CACHE_MAX_LINES = 100_000
 
-def build_velocity_template_recursive(element_or_type_def, schema_doc, global_types, target_ns, xsd_ns_map, nsmap, visited_types=None, element_name_hint=None, depth=0):
+
+class TemplateWriter:
     """
-    Рекурсивно строит строку-шаблон Apache Velocity на основе определения элемента или типа.
+    Потоковый приёмник шаблона: фрагменты сразу пишутся в out (файл, io.StringIO и т.п.),
+    поэтому рекурсия не собирает и не копирует строки дочерних элементов.
+
+    Пока открыт хотя бы один фрагмент (begin_fragment), записанные куски дополнительно
+    сохраняются с уровнем отступа в общий журнал, чтобы их можно было повторить на другой
+    глубине. Фрагмент - диапазон этого журнала: вложенные фрагменты не копируют куски внешних.
     """
-    if visited_types is None:
-        visited_types = set()
+    def __init__(self, out):
+        self._write = out.write
+        self._log = None  # [(depth | None, text)], пока открыт хотя бы один фрагмент
+        self._fragments = []  # стек [(начало в _log, множество проверенных типов)]
+        self._indents = [""]  # отступы по глубине
+
+    def _indent(self, depth):
+        indents = self._indents
+        while len(indents) <= depth:
+            indents.append(indents[-1] + INDENT)
+        return indents[depth]
+
+    def emit(self, depth, text):
+        """Пишет строку с отступом уровня depth."""
+        indents = self._indents
+        self._write((indents[depth] if depth < len(indents) else self._indent(depth)) + text)
+        if self._fragments:
+            self._log.append((depth, text))
+
+    def write(self, text):
+        """Пишет текст без отступа (продолжение текущей строки)."""
+        self._write(text)
+        if self._fragments:
+            self._log.append((None, text))
+
+    def note_type_check(self, type_name):
+        """Запоминает, что результат открытого фрагмента зависит от наличия type_name в visited_types."""
+        if self._fragments:
+            self._fragments[-1][1].add(type_name)
+
+    def begin_fragment(self):
+        if not self._fragments:
+            # Новый журнал: закрытые фрагменты продолжают ссылаться на предыдущий
+            self._log = []
+        self._fragments.append((len(self._log), set()))
+
+    def end_fragment(self, depth):
+        """
+        Закрывает фрагмент, открытый на глубине depth.
+        Возвращает ((журнал, начало, конец, depth), проверенные в нём типы).
+        """
+        start, checked = self._fragments.pop()
+        chunks = (self._log, start, len(self._log), depth)
+        if self._fragments:
+            self._fragments[-1][1].update(checked)
+        else:
+            self._log = None
+        return chunks, checked
+
+    def replay(self, fragment, depth):
+        """Повторяет сохранённый фрагмент на глубине depth."""
+        (log, start, end, base_depth), checked = fragment
+        shift = depth - base_depth
+        for i in range(start, end):
+            chunk_depth, text = log[i]
+            if chunk_depth is None:
+                self.write(text)
+            else:
+                self.emit(chunk_depth + shift, text)
+        if self._fragments:
+            self._fragments[-1][1].update(checked)
 
-    indent = "  " * depth
-    tag = etree.QName(element_or_type_def).localname
-    is_element = tag == 'element'
-    is_complex_type = tag == 'complexType'
-    is_simple_type = tag == 'simpleType'
 
-    name = element_or_type_def.get('name')
-    if is_element and name:
-        elem_name = name
-    elif element_name_hint:
-        elem_name = element_name_hint # Используем hint, если он есть
-    else:
-        elem_name = "AnonymousTypeElement"
+def fragment_lines(fragment):
+    """Число кусков в фрагменте TemplateWriter.end_fragment()."""
+    (_, start, end, _), _ = fragment
+    return end - start
 
-    # --- Обработка SimpleType ---
-    if is_simple_type:
-        # Простые типы не создают вложенных элементов, они определяют тип значения.
-        # Возвращаем пустую строку или значение по умолчанию, если оно есть.
-        # Для шаблона, это просто переменная $elem_name
-        # Однако, elem_name здесь - это имя типа (например, stringNN-250), если hint не был передан.
-        # Нам нужно имя элемента, для которого используется этот тип.
-        # Это имя передается через element_name_hint.
-        # Если hint не был передан, используем name (имя типа), но это неправильно для переменной.
-        # В идеале, hint всегда должен передаваться для типов, используемых элементами.
-        # Поэтому используем elem_name (которое теперь равно hint или name).
-        # Если hint не был передан, и name - это имя типа, а не элемента, переменная будет неправильной.
-        # Но в текущем контексте, hint *должен* быть передан из обработки элемента.
-        return f"$request.{elem_name}"
 
-    # --- Обработка ComplexType ---
-    if is_complex_type:
-        # Проверяем на циклические зависимости
-        if name in visited_types:
-            print(f"Предотвращена циклическая зависимость для типа: {name}")
-            # Возвращаем пустой элемент как комментарий или пустую строку
-            return f"{indent}<!-- Циклическая зависимость: {name} -->\n"
-
-        new_visited = visited_types | {name}
-
-        # Проверяем на simpleContent или complexContent (наследование)
-        simple_content = element_or_type_def.find('xs:simpleContent', namespaces=xsd_ns_map)
-        complex_content = element_or_type_def.find('xs:complexContent', namespaces=xsd_ns_map)
-
-        # Если есть simpleContent, это расширение/ограничение простого типа с атрибутами
-        if simple_content is not None:
-            ext_or_res = simple_content.xpath('(xs:extension | xs:restriction)', namespaces=xsd_ns_map)
-            if ext_or_res:
-                base_type_name = ext_or_res[0].get('base')
-                # Устанавливаем значение $elem_name, если базовый тип - встроенный XSD.
-                if ":" in base_type_name:
-                    qname_base = etree.QName(base_type_name.split(":")[1])
-                else:
-                    qname_base = etree.QName(base_type_name)
-                base_local_name = qname_base.localname
-                base_namespace = qname_base.namespace
-                if base_namespace == xsd_ns_map['xs']:
-                    # Создаём элемент с текстовым содержимым $elem_name и атрибутами
-                    full_elem_name = f"{{http://socit.ru/kalin/orders/2.0.0}}{elem_name}" if target_ns else elem_name
-                    # Или используем префикс, если он есть в nsmap
-                    elem_prefix = None
-                    for p, uri in nsmap.items():
-                        if uri == target_ns:
-                            elem_prefix = p
-                            break
-                    if elem_prefix:
-                        full_elem_name = f"{elem_prefix}:{elem_name}"
-                    else:
-                        full_elem_name = elem_name
-
-                    attr_str = ""
-                    for attr_elem in ext_or_res[0].xpath('xs:attribute', namespaces=xsd_ns_map):
-                        attr_name = attr_elem.get('name')
-                        if attr_name:
-                             attr_str += f' {attr_name}="$request.{attr_name}"'
-                    return f"{indent}<{full_elem_name}{attr_str}>$request.{elem_name}</{full_elem_name}>\n"
-                # Если базовый тип - не встроенный, обработка как у complexContent?
-                # Нет, simpleContent означает, что у него *есть* базовый простой тип.
-                # Если он не встроенный, но простой - это редкий случай, обрабатываем как строку.
-                # Но по спецификации, extension/restriction в simpleContent должны ссылаться на simpleType.
-                # Пока оставим как есть, если базовый тип не встроенный - возвращаем пустую строку или комментарий.
-                # Но если он определён как simpleType, его можно обработать рекурсивно.
-                # Проверим, есть ли он в global_types и является ли simpleType.
-                if base_namespace is None or base_namespace == target_ns:
-                     if base_local_name in global_types:
-                         base_type_def = global_types[base_local_name]
-                         if etree.QName(base_type_def).localname == 'simpleType':
-                             # --- ИЗМЕНЕНО ---
-                             # Передаем elem_name как hint, чтобы рекурсивный вызов для simpleType знал имя элемента
-                             base_val_template = build_velocity_template_recursive(base_type_def, schema_doc, global_types, target_ns, xsd_ns_map, nsmap, new_visited, elem_name, depth)
-                             full_elem_name = f"{{http://socit.ru/kalin/orders/2.0.0}}{elem_name}" if target_ns else elem_name
-                             elem_prefix = None
-                             for p, uri in nsmap.items():
-                                 if uri == target_ns:
-                                     elem_prefix = p
-                                     break
-                             if elem_prefix:
-                                 full_elem_name = f"{elem_prefix}:{elem_name}"
-                             else:
-                                 full_elem_name = elem_name
-                             attr_str = ""
-                             for attr_elem in ext_or_res[0].xpath('xs:attribute', namespaces=xsd_ns_map):
-                                 attr_name = attr_elem.get('name')
-                                 if attr_name:
-                                      attr_str += f' {attr_name}="$request.{attr_name}"'
-                             return f"{indent}<{full_elem_name}{attr_str}>{base_val_template}</{full_elem_name}>\n"
-                return f"{indent}<!-- Необработанный simpleContent для {elem_name} -->\n"
-
-        # Если есть complexContent, это наследование сложного типа
-        if complex_content:
-            ext_elem = complex_content.find('xs:extension', namespaces=xsd_ns_map)
-            res_elem = complex_content.find('xs:restriction', namespaces=xsd_ns_map)
-            base_type_def = None
-            base_type_name = None
-            if ext_elem is not None:
-                base_type_name = ext_elem.get('base')
-            elif res_elem is not None:
-                base_type_name = res_elem.get('base')
-
-            if base_type_name:
-                 if ":" in base_type_name:
-                     qname_base = etree.QName(base_type_name.split(":")[1])
-                 else:
-                     qname_base = etree.QName(base_type_name)
-                 base_local_name = qname_base.localname
-                 base_namespace = qname_base.namespace
-
-                 if base_namespace == xsd_ns_map['xs']:
-                     # Если базовый тип - встроенный XSD (например, xsd:string), но это complexContent - ошибка в схеме.
-                     # Обычно complexContent расширяет/ограничивает другой complexType.
-                     print(f"Предупреждение: complexContent расширяет встроенный простой тип {base_type_name} для {name}. Это необычно.")
-                     # Создаём элемент с текстовым содержимым $elem_name и атрибутами
-                     full_elem_name = f"{{http://socit.ru/kalin/orders/2.0.0}}{elem_name}" if target_ns else elem_name
-                     elem_prefix = None
-                     for p, uri in nsmap.items():
-                         if uri == target_ns:
-                             elem_prefix = p
-                             break
-                     if elem_prefix:
-                         full_elem_name = f"{elem_prefix}:{elem_name}"
-                     else:
-                         full_elem_name = elem_name
-                     attr_str = ""
-                     content_to_process = ext_elem if ext_elem is not None else res_elem
-                     if content_to_process is not None:
-                         for attr_elem in content_to_process.xpath('xs:attribute', namespaces=xsd_ns_map):
-                             attr_name = attr_elem.get('name')
-                             if attr_name:
-                                  attr_str += f' {attr_name}="$request.{attr_name}"'
-                     return f"{indent}<{full_elem_name}{attr_str}>$request.{elem_name}</{full_elem_name}>\n"
-                 elif base_namespace is None or base_namespace == target_ns:
-                     base_local_name = qname_base.localname
-                     if base_local_name in global_types:
-                         base_type_def = global_types[base_local_name]
-
-            full_elem_name = f"{{http://socit.ru/kalin/orders/2.0.0}}{elem_name}" if target_ns else elem_name
-            elem_prefix = None
-            for p, uri in nsmap.items():
-                if uri == target_ns:
-                    elem_prefix = p
-                    break
-            if elem_prefix:
-                full_elem_name = f"{elem_prefix}:{elem_name}"
-            else:
-                full_elem_name = elem_name
-
-            attr_str = ""
-            # Обрабатываем атрибуты в extension/restriction
-            content_to_process = ext_elem if ext_elem is not None else res_elem
-            if content_to_process is not None:
-                 for attr_elem in content_to_process.xpath('xs:attribute', namespaces=xsd_ns_map):
-                     attr_name = attr_elem.get('name')
-                     if attr_name:
-                          attr_str += f' {attr_name}="$request.{attr_name}"'
-
-            xml_str = f"{indent}<{full_elem_name}{attr_str}>\n"
-
-            # Сначала обрабатываем структуру базового типа, если он есть
-            if base_type_def is not None:
-                 # --- ИЗМЕНЕНО ---
-                 base_content = build_velocity_template_recursive(base_type_def, schema_doc, global_types, target_ns, xsd_ns_map, nsmap, new_visited, elem_name, depth + 1)
-                 xml_str += base_content
-
-            # Затем обрабатываем содержимое ext_elem или res_elem (обычно sequence/all/choice внутри extension)
-            if content_to_process is not None:
-                for particle_type in ['sequence', 'choice', 'all']:
-                    particle = content_to_process.find(f'xs:{particle_type}', namespaces=xsd_ns_map)
-                    if particle is not None:
-                        if particle_type == 'choice':
-                            # Для choice генерируем #if-ы для каждой ветки
-                            choice_name = f"{elem_name}_choice" # Имя переменной для выбора ветки
-                            for i, child_elem_def in enumerate(particle.xpath('xs:element', namespaces=xsd_ns_map)):
-                                child_name = child_elem_def.get('name')
-                                child_min_occurs = int(child_elem_def.get('minOccurs', '1'))
-                                child_max_occurs = child_elem_def.get('maxOccurs', '1')
-                                unbounded = child_max_occurs == 'unbounded'
-                                max_count = int(child_max_occurs) if not unbounded else 1 # Для шаблона ограничим
-
-                                child_type_def, child_type_name = resolve_type(child_elem_def, schema_doc, global_types, target_ns, xsd_ns_map)
-                                if child_type_def is None:
-                                    inline_ct = child_elem_def.find('xs:complexType', namespaces=xsd_ns_map)
-                                    inline_st = child_elem_def.find('xs:simpleType', namespaces=xsd_ns_map)
-                                    if inline_ct is not None:
-                                        child_type_def = inline_ct
-                                        child_type_name = None
-                                    elif inline_st is not None:
-                                        child_type_def = inline_st
-                                        child_type_name = None
-
-                                # Генерируем #if для этой ветки
-                                xml_str += f"{indent}  ## Выбор ветки {child_name} для {choice_name}\n"
-                                xml_str += f"{indent}  #if($request.velocityCount == {i+1}) ## Используем $request.velocityCount или другую переменную\n"
-                                # Внутри цикла обработки particle в complexType:
-                                if child_type_def is not None:
-                                    # --- ИЗМЕНЕНО ---
-                                    # Получаем содержимое типа
-                                    child_template_content = build_velocity_template_recursive(child_type_def,
-                                                                                               schema_doc, global_types,
-                                                                                               target_ns, xsd_ns_map,
-                                                                                               nsmap, new_visited,
-                                                                                               child_name, depth + 1)
-                                    # Создаём тег для дочернего элемента и помещаем в него содержимое типа
-                                    full_child_name = f"{{http://socit.ru/kalin/orders/2.0.0}}{child_name}" if target_ns else child_name
-                                    child_elem_prefix = None
-                                    for p, uri in nsmap.items():
-                                        if uri == target_ns:
-                                            child_elem_prefix = p
-                                            break
-                                    if child_elem_prefix:
-                                        full_child_name = f"{child_elem_prefix}:{child_name}"
-                                    else:
-                                        full_child_name = child_name
-                                    xml_str += f"{indent}  <{full_child_name}>{child_template_content}</{full_child_name}>\n"
-                                else:
-                                    # Если тип не определён (или inline simpleType), создаём элемент с переменной
-                                    full_child_name = f"{{http://socit.ru/kalin/orders/2.0.0}}{child_name}" if target_ns else child_name
-                                    child_elem_prefix = None
-                                    for p, uri in nsmap.items():
-                                        if uri == target_ns:
-                                            child_elem_prefix = p
-                                            break
-                                    if child_elem_prefix:
-                                        full_child_name = f"{child_elem_prefix}:{child_name}"
-                                    else:
-                                        full_child_name = child_name
-                                    xml_str += f"{indent}  <{full_child_name}>$request.{child_name}</{full_child_name}>\n"
-                                xml_str += f"{indent}  #end\n"
-                        else: # sequence, all
-                            for child_elem_def in particle.xpath('xs:element', namespaces=xsd_ns_map):
-                                child_name = child_elem_def.get('name')
-                                child_min_occurs = int(child_elem_def.get('minOccurs', '1'))
-                                child_max_occurs = child_elem_def.get('maxOccurs', '1')
-                                unbounded = child_max_occurs == 'unbounded'
-                                max_count = int(child_max_occurs) if not unbounded else 1 # Для шаблона ограничим
-
-                                child_type_def, child_type_name = resolve_type(child_elem_def, schema_doc, global_types, target_ns, xsd_ns_map)
-                                if child_type_def is None:
-                                    inline_ct = child_elem_def.find('xs:complexType', namespaces=xsd_ns_map)
-                                    inline_st = child_elem_def.find('xs:simpleType', namespaces=xsd_ns_map)
-                                    if inline_ct is not None:
-                                        child_type_def = inline_ct
-                                        child_type_name = None
-                                    elif inline_st is not None:
-                                        child_type_def = inline_st
-                                        child_type_name = None
-
-                                if child_type_def is not None:
-                                    # --- ИЗМЕНЕНО ---
-                                    child_template = build_velocity_template_recursive(child_type_def, schema_doc, global_types, target_ns, xsd_ns_map, nsmap, new_visited, child_name, depth + 1)
-                                    xml_str += child_template
-                                else:
-                                    # --- ИЗМЕНЕНО ---
-                                    full_child_name = f"{{http://socit.ru/kalin/orders/2.0.0}}{child_name}" if target_ns else child_name
-                                    child_elem_prefix = None
-                                    for p, uri in nsmap.items():
-                                        if uri == target_ns:
-                                            child_elem_prefix = p
-                                            break
-                                    if child_elem_prefix:
-                                        full_child_name = f"{child_elem_prefix}:{child_name}"
-                                    else:
-                                        full_child_name = child_name
-                                    xml_str += f"{indent}  <{full_child_name}>$request.{child_name}</{full_child_name}>\n"
-
-            xml_str += f"{indent}</{full_elem_name}>\n"
-            return xml_str
-
-
-        # Если нет ни simpleContent, ни complexContent, это "обычный" complexType
-        full_elem_name = f"{{http://socit.ru/kalin/orders/2.0.0}}{elem_name}" if target_ns else elem_name
-        elem_prefix = None
+class FragmentCache:
+    """
+    Кэш отрендеренных именованных complexType по ключу (имя типа, имя элемента).
+
+    Фрагмент зависит от того, какие типы уже есть в visited_types (защита от циклов),
+    поэтому вместе с ним хранится множество типов, проверенных при рендеринге,
+    и та их часть, что была в visited_types. Фрагмент переиспользуется, только если
+    пересечение совпадает - тогда результат повторного рендеринга был бы тем же.
+    Кэш привязан к одной схеме.
+
+    Хранится не больше max_lines кусков; после этого новые фрагменты не записываются
+    (accepting() == False), и генерация идет без кэширования с обычным потреблением памяти.
+    """
+    def __init__(self, max_lines=FRAGMENT_CACHE_MAX_LINES):
+        self._fragments = {}  # {(type_name, elem_name): [(checked, dependency, fragment)]}
+        self.max_lines = max_lines
+        self.lines = 0
+        self.hits = 0
+        self.misses = 0
+
+    def accepting(self):
+        return self.lines < self.max_lines
+
+    def get(self, type_name, elem_name, visited_types):
+        for checked, dependency, fragment in self._fragments.get((type_name, elem_name), ()):
+            if checked & visited_types == dependency:
+                self.hits += 1
+                return fragment
+        self.misses += 1
+        return None
+
+    def put(self, type_name, elem_name, visited_types, fragment):
+        lines = fragment_lines(fragment)
+        if self.lines + lines > self.max_lines:
+            self.lines = self.max_lines  # дальше фрагменты не записываются
+            return
+        self.lines += lines
+        chunks, checked = fragment
+        checked = frozenset(checked)
+        self._fragments.setdefault((type_name, elem_name), []).append(
+            (checked, checked & visited_types, (chunks, checked)))
+
+
+def count_type_references(schema_root):
+    """
+    Сколько раз на каждый тип ссылаются атрибуты type и base схемы (по локальному имени).
+    Кэшировать имеет смысл только типы, на которые ссылаются больше одного раза.
+    """
+    counts = Counter()
+    if schema_root is None:
+        return counts
+    for node in schema_root.iter(f'{{{XSD_NS}}}element', f'{{{XSD_NS}}}extension', f'{{{XSD_NS}}}restriction'):
+        type_ref = node.get('type') or node.get('base')
+        if type_ref:
+            counts[type_ref.rpartition(':')[2]] += 1
+    return counts
+
+
+class _RenderContext:
+    """Общие для всего обхода параметры схемы."""
+    def __init__(self, schema_doc, global_types, target_ns, xsd_ns_map, nsmap, fragment_cache=None):
+        self.schema_doc = schema_doc
+        self.global_types = global_types
+        self.target_ns = target_ns
+        self.xsd_ns_map = xsd_ns_map
+        self.fragment_cache = fragment_cache if fragment_cache is not None else FragmentCache()
+        # Типы, на которые ссылаются несколько раз: только их фрагменты записываются в кэш
+        type_references = count_type_references(schema_doc.getroot() if schema_doc is not None else None)
+        self.reused_types = {name for name, count in type_references.items() if count > 1}
+        # Префикс для targetNamespace одинаков для всех элементов, ищем его один раз
+        self.elem_prefix = None
         for p, uri in nsmap.items():
             if uri == target_ns:
-                elem_prefix = p
+                self.elem_prefix = p
                 break
-        if elem_prefix:
-            full_elem_name = f"{elem_prefix}:{elem_name}"
-        else:
-            full_elem_name = elem_name
 
+    def qualify(self, elem_name):
+        return f"{self.elem_prefix}:{elem_name}" if self.elem_prefix else elem_name
+
+    def attributes(self, node):
         attr_str = ""
-        # Обрабатываем атрибуты на уровне complexType
-        for attr_elem in element_or_type_def.xpath('xs:attribute', namespaces=xsd_ns_map):
+        for attr_elem in node.xpath('xs:attribute', namespaces=self.xsd_ns_map):
             attr_name = attr_elem.get('name')
             if attr_name:
-                 attr_str += f' {attr_name}="$request.{attr_name}"'
+                attr_str += f' {attr_name}="$request.{attr_name}"'
+        return attr_str
+
+    def resolve_child_type(self, child_elem_def):
+        """Тип дочернего элемента: глобальный по атрибуту type или inline complexType/simpleType."""
+        child_type_def, _ = resolve_type(child_elem_def, self.schema_doc, self.global_types, self.target_ns, self.xsd_ns_map)
+        if child_type_def is None:
+            inline_ct = child_elem_def.find('xs:complexType', namespaces=self.xsd_ns_map)
+            inline_st = child_elem_def.find('xs:simpleType', namespaces=self.xsd_ns_map)
+            if inline_ct is not None:
+                child_type_def = inline_ct
+            elif inline_st is not None:
+                child_type_def = inline_st
+        return child_type_def
+
+
+def _split_base(base_type_name):
+    if ":" in base_type_name:
+        qname_base = etree.QName(base_type_name.split(":")[1])
+    else:
+        qname_base = etree.QName(base_type_name)
+    return qname_base.localname, qname_base.namespace
 
-        xml_str = f"{indent}<{full_elem_name}{attr_str}>\n"
 
-        # Обрабатываем sequence, choice, all
-        for particle_type in ['sequence', 'choice', 'all']:
-            particle = element_or_type_def.find(f'xs:{particle_type}', namespaces=xsd_ns_map)
-            if particle is not None:
+def _complex_type_frame(writer, ctx, type_def, name, elem_name, path, depth):
+    """
+    Кадр обхода для complexType (name - имя типа, elem_name - имя элемента, который его использует).
+    Тип уже добавлен в path вызывающим кадром.
+    """
+    xsd_ns_map = ctx.xsd_ns_map
+    full_elem_name = ctx.qualify(elem_name)
+
+    # Проверяем на simpleContent или complexContent (наследование)
+    simple_content = type_def.find('xs:simpleContent', namespaces=xsd_ns_map)
+    complex_content = type_def.find('xs:complexContent', namespaces=xsd_ns_map)
+
+    # Если есть simpleContent, это расширение/ограничение простого типа с атрибутами
+    if simple_content is not None:
+        ext_or_res = simple_content.xpath('(xs:extension | xs:restriction)', namespaces=xsd_ns_map)
+        if ext_or_res:
+            base_local_name, base_namespace = _split_base(ext_or_res[0].get('base'))
+            if base_namespace == xsd_ns_map['xs']:
+                # Элемент с текстовым содержимым $elem_name и атрибутами
+                writer.emit(depth, f"<{full_elem_name}{ctx.attributes(ext_or_res[0])}>$request.{elem_name}</{full_elem_name}>\n")
+                return
+            # Базовый тип не встроенный: если это глобальный simpleType, подставляем его значение
+            if base_namespace is None or base_namespace == ctx.target_ns:
+                base_type_def = ctx.global_types.get(base_local_name)
+                if base_type_def is not None and etree.QName(base_type_def).localname == 'simpleType':
+                    writer.emit(depth, f"<{full_elem_name}{ctx.attributes(ext_or_res[0])}>")
+                    # Передаем elem_name как hint, чтобы simpleType знал имя элемента
+                    yield _node_frame(writer, ctx, base_type_def, path, elem_name, depth)
+                    writer.write(f"</{full_elem_name}>\n")
+                    return
+            writer.emit(depth, f"<!-- Необработанный simpleContent для {elem_name} -->\n")
+            return
+
+    # Если есть complexContent, это наследование сложного типа
+    # (пустой complexContent без extension/restriction обрабатывается как обычный complexType)
+    if complex_content is not None and len(complex_content):
+        ext_elem = complex_content.find('xs:extension', namespaces=xsd_ns_map)
+        res_elem = complex_content.find('xs:restriction', namespaces=xsd_ns_map)
+        content_to_process = ext_elem if ext_elem is not None else res_elem
+        base_type_def = None
+        base_type_name = content_to_process.get('base') if content_to_process is not None else None
+
+        if base_type_name:
+            base_local_name, base_namespace = _split_base(base_type_name)
+            if base_namespace == xsd_ns_map['xs']:
+                # Обычно complexContent расширяет/ограничивает другой complexType.
+                logger.warning("complexContent расширяет встроенный простой тип %s для %s. Это необычно.", base_type_name, name)
+                writer.emit(depth, f"<{full_elem_name}{ctx.attributes(content_to_process)}>$request.{elem_name}</{full_elem_name}>\n")
+                return
+            elif base_namespace is None or base_namespace == ctx.target_ns:
+                base_type_def = ctx.global_types.get(base_local_name)
+
+        attr_str = ctx.attributes(content_to_process) if content_to_process is not None else ""
+        writer.emit(depth, f"<{full_elem_name}{attr_str}>\n")
+
+        # Сначала обрабатываем структуру базового типа, если он есть
+        if base_type_def is not None:
+            yield _node_frame(writer, ctx, base_type_def, path, elem_name, depth + 1)
+
+        # Затем обрабатываем содержимое ext_elem или res_elem (обычно sequence/all/choice внутри extension)
+        if content_to_process is not None:
+            for particle_type in ['sequence', 'choice', 'all']:
+                particle = content_to_process.find(f'xs:{particle_type}', namespaces=xsd_ns_map)
+                if particle is None:
+                    continue
                 if particle_type == 'choice':
                     # Для choice генерируем #if-ы для каждой ветки
                     choice_name = f"{elem_name}_choice" # Имя переменной для выбора ветки
                     for i, child_elem_def in enumerate(particle.xpath('xs:element', namespaces=xsd_ns_map)):
                         child_name = child_elem_def.get('name')
-                        child_min_occurs = int(child_elem_def.get('minOccurs', '1'))
-                        child_max_occurs = child_elem_def.get('maxOccurs', '1')
-                        unbounded = child_max_occurs == 'unbounded'
-                        max_count = int(child_max_occurs) if not unbounded else 1 # Для шаблона ограничим
-
-                        child_type_def, child_type_name = resolve_type(child_elem_def, schema_doc, global_types, target_ns, xsd_ns_map)
-                        if child_type_def is None:
-                            inline_ct = child_elem_def.find('xs:complexType', namespaces=xsd_ns_map)
-                            inline_st = child_elem_def.find('xs:simpleType', namespaces=xsd_ns_map)
-                            if inline_ct is not None:
-                                child_type_def = inline_ct
-                                child_type_name = None
-                            elif inline_st is not None:
-                                child_type_def = inline_st
-                                child_type_name = None
-
-                        # Генерируем #if для этой ветки
-                        xml_str += f"{indent}  ## Выбор ветки {child_name} для {choice_name}\n"
-                        xml_str += f"{indent}  #if($request.velocityCount == {i+1}) ## Используем $request.velocityCount или другую переменную\n"
+                        child_type_def = ctx.resolve_child_type(child_elem_def)
+                        full_child_name = ctx.qualify(child_name)
+                        writer.emit(depth + 1, f"## Выбор ветки {child_name} для {choice_name}\n")
+                        writer.emit(depth + 1, f"#if($request.velocityCount == {i+1}) ## Используем $request.velocityCount или другую переменную\n")
                         if child_type_def is not None:
-                            # --- ИЗМЕНЕНО ---
-                            child_template = build_velocity_template_recursive(child_type_def, schema_doc, global_types, target_ns, xsd_ns_map, nsmap, new_visited, child_name, depth + 2)
-                            xml_str += child_template
+                            # Создаём тег для дочернего элемента и помещаем в него содержимое типа
+                            writer.emit(depth + 1, f"<{full_child_name}>")
+                            yield _node_frame(writer, ctx, child_type_def, path, child_name, depth + 1)
+                            writer.write(f"</{full_child_name}>\n")
                         else:
-                            # --- ИЗМЕНЕНО ---
-                            full_child_name = f"{{http://socit.ru/kalin/orders/2.0.0}}{child_name}" if target_ns else child_name
-                            child_elem_prefix = None
-                            for p, uri in nsmap.items():
-                                if uri == target_ns:
-                                    child_elem_prefix = p
-                                    break
-                            if child_elem_prefix:
-                                full_child_name = f"{child_elem_prefix}:{child_name}"
-                            else:
-                                full_child_name = child_name
-                            xml_str += f"{indent}    <{full_child_name}>$request.{child_name}</{full_child_name}>\n"
-                        xml_str += f"{indent}  #end\n"
+                            writer.emit(depth + 1, f"<{full_child_name}>$request.{child_name}</{full_child_name}>\n")
+                        writer.emit(depth + 1, "#end\n")
                 else: # sequence, all
                     for child_elem_def in particle.xpath('xs:element', namespaces=xsd_ns_map):
                         child_name = child_elem_def.get('name')
-                        child_min_occurs = int(child_elem_def.get('minOccurs', '1'))
-                        child_max_occurs = child_elem_def.get('maxOccurs', '1')
-                        unbounded = child_max_occurs == 'unbounded'
-                        max_count = int(child_max_occurs) if not unbounded else 1 # Для шаблона ограничим
-
-                        child_type_def, child_type_name = resolve_type(child_elem_def, schema_doc, global_types, target_ns, xsd_ns_map)
-                        if child_type_def is None:
-                            inline_ct = child_elem_def.find('xs:complexType', namespaces=xsd_ns_map)
-                            inline_st = child_elem_def.find('xs:simpleType', namespaces=xsd_ns_map)
-                            if inline_ct is not None:
-                                child_type_def = inline_ct
-                                child_type_name = None
-                            elif inline_st is not None:
-                                child_type_def = inline_st
-                                child_type_name = None
-
+                        child_type_def = ctx.resolve_child_type(child_elem_def)
                         if child_type_def is not None:
-                            # --- ИЗМЕНЕНО ---
-                            child_template = build_velocity_template_recursive(child_type_def, schema_doc, global_types, target_ns, xsd_ns_map, nsmap, new_visited, child_name, depth + 1)
-                            xml_str += child_template
+                            yield _node_frame(writer, ctx, child_type_def, path, child_name, depth + 1)
                         else:
-                            # --- ИЗМЕНЕНО ---
-                            full_child_name = f"{{http://socit.ru/kalin/orders/2.0.0}}{child_name}" if target_ns else child_name
-                            child_elem_prefix = None
-                            for p, uri in nsmap.items():
-                                if uri == target_ns:
-                                    child_elem_prefix = p
-                                    break
-                            if child_elem_prefix:
-                                full_child_name = f"{child_elem_prefix}:{child_name}"
-                            else:
-                                full_child_name = child_name
-                            xml_str += f"{indent}  <{full_child_name}>$request.{child_name}</{full_child_name}>\n"
-
-        xml_str += f"{indent}</{full_elem_name}>\n"
-        return xml_str
+                            full_child_name = ctx.qualify(child_name)
+                            writer.emit(depth + 1, f"<{full_child_name}>$request.{child_name}</{full_child_name}>\n")
+
+        writer.emit(depth, f"</{full_elem_name}>\n")
+        return
+
+    # Если нет ни simpleContent, ни complexContent, это "обычный" complexType
+    writer.emit(depth, f"<{full_elem_name}{ctx.attributes(type_def)}>\n")
+
+    # Обрабатываем sequence, choice, all
+    for particle_type in ['sequence', 'choice', 'all']:
+        particle = type_def.find(f'xs:{particle_type}', namespaces=xsd_ns_map)
+        if particle is None:
+            continue
+        if particle_type == 'choice':
+            # Для choice генерируем #if-ы для каждой ветки
+            choice_name = f"{elem_name}_choice" # Имя переменной для выбора ветки
+            for i, child_elem_def in enumerate(particle.xpath('xs:element', namespaces=xsd_ns_map)):
+                child_name = child_elem_def.get('name')
+                child_type_def = ctx.resolve_child_type(child_elem_def)
+                writer.emit(depth + 1, f"## Выбор ветки {child_name} для {choice_name}\n")
+                writer.emit(depth + 1, f"#if($request.velocityCount == {i+1}) ## Используем $request.velocityCount или другую переменную\n")
+                if child_type_def is not None:
+                    yield _node_frame(writer, ctx, child_type_def, path, child_name, depth + 2)
+                else:
+                    full_child_name = ctx.qualify(child_name)
+                    writer.emit(depth + 2, f"<{full_child_name}>$request.{child_name}</{full_child_name}>\n")
+                writer.emit(depth + 1, "#end\n")
+        else: # sequence, all
+            for child_elem_def in particle.xpath('xs:element', namespaces=xsd_ns_map):
+                child_name = child_elem_def.get('name')
+                child_type_def = ctx.resolve_child_type(child_elem_def)
+                if child_type_def is not None:
+                    yield _node_frame(writer, ctx, child_type_def, path, child_name, depth + 1)
+                else:
+                    full_child_name = ctx.qualify(child_name)
+                    writer.emit(depth + 1, f"<{full_child_name}>$request.{child_name}</{full_child_name}>\n")
+
+    writer.emit(depth, f"</{full_elem_name}>\n")
+    return
+
+
+def _node_frame(writer, ctx, element_or_type_def, path, element_name_hint, depth):
+    """
+    Кадр обхода для определения элемента или типа.
+    path - множество типов на текущем пути от корня (защита от циклов), изменяется через add/remove.
+    """
+    tag = etree.QName(element_or_type_def).localname
+
+    name = element_or_type_def.get('name')
+    if tag == 'element' and name:
+        elem_name = name
+    elif element_name_hint:
+        elem_name = element_name_hint # Используем hint, если он есть
+    else:
+        elem_name = "AnonymousTypeElement"
+
+    # --- Обработка SimpleType ---
+    if tag == 'simpleType':
+        # Простой тип не создаёт вложенных элементов - это только значение $request.<имя элемента>.
+        # Имя элемента, для которого используется тип, передаётся через element_name_hint.
+        writer.write(f"$request.{elem_name}")
+        return
+
+    # --- Обработка ComplexType ---
+    if tag == 'complexType':
+        # Проверяем на циклические зависимости
+        writer.note_type_check(name)
+        if name in path:
+            logger.debug("Предотвращена циклическая зависимость для типа: %s", name)
+            writer.emit(depth, f"<!-- Циклическая зависимость: {name} -->\n")
+            return
+
+        # Кэшируются только именованные типы, на которые ссылаются несколько раз
+        # (анонимные inline-типы и типы с одной ссылкой повторять незачем)
+        cacheable = name in ctx.reused_types
+        if cacheable:
+            # Именованный тип уже мог быть отрендерен для этого же имени элемента
+            cached = ctx.fragment_cache.get(name, elem_name, path)
+            if cached is not None:
+                writer.replay(cached, depth)
+                return
+            cacheable = ctx.fragment_cache.accepting()
+        if cacheable:
+            writer.begin_fragment()
+        path.add(name)
+        yield _complex_type_frame(writer, ctx, element_or_type_def, name, elem_name, path, depth)
+        path.remove(name)
+        if cacheable:
+            ctx.fragment_cache.put(name, elem_name, path, writer.end_fragment(depth))
+        return
 
     # --- Обработка Элемента ---
-    if is_element:
-        # Определяем тип элемента
-        type_def, type_name = resolve_type(element_or_type_def, schema_doc, global_types, target_ns, xsd_ns_map)
-
-        # Если тип не найден, проверим, не определён ли он inline
-        if type_def is None:
-            inline_ct = element_or_type_def.find('xs:complexType', namespaces=xsd_ns_map)
-            inline_st = element_or_type_def.find('xs:simpleType', namespaces=xsd_ns_map)
-            if inline_ct is not None:
-                type_def = inline_ct
-                type_name = None
-            elif inline_st is not None:
-                type_def = inline_st
-                type_name = None
+    if tag == 'element':
+        # Определяем тип элемента (глобальный или inline)
+        type_def = ctx.resolve_child_type(element_or_type_def)
 
         if type_def is not None:
-            # --- ИСПРАВЛЕНО ---
-            # Рекурсивно вызываем для типа элемента.
-            # Передаем elem_name как hint, чтобы тип знал, как его "зовут" в этом контексте.
-            # Тип сам должен создать соответствующую структуру, включая корневой тег с именем elem_name.
-            # НЕ оборачиваем результат в дополнительный тег <elem_name> здесь.
-            return build_velocity_template_recursive(type_def, schema_doc, global_types, target_ns, xsd_ns_map, nsmap, visited_types, elem_name, depth)
+            # Тип сам создаёт корневой тег с именем elem_name (передаётся как hint),
+            # поэтому здесь дополнительный тег <elem_name> не нужен.
+            yield _node_frame(writer, ctx, type_def, path, elem_name, depth)
         else:
-            # Если тип не определён (или inline simpleType), создаём элемент с переменной
-            # Этот случай для элементов без явного типа или с inline-типами.
-            full_elem_name = f"{{http://socit.ru/kalin/orders/2.0.0}}{elem_name}" if target_ns else elem_name
-            elem_prefix = None
-            for p, uri in nsmap.items():
-                if uri == target_ns:
-                    elem_prefix = p
-                    break
-            if elem_prefix:
-                full_elem_name = f"{elem_prefix}:{elem_name}"
-            else:
-                full_elem_name = elem_name
-            attr_str = ""
-            for attr_elem in element_or_type_def.xpath('xs:attribute', namespaces=xsd_ns_map):
-                attr_name = attr_elem.get('name')
-                if attr_name:
-                     attr_str += f' {attr_name}="$request.{attr_name}"'
-            return f"{indent}<{full_elem_name}{attr_str}>$request.{elem_name}</{full_elem_name}>\n"
-
-    return f"{indent}<!-- Неизвестный тип -->\n"
-
-def generate_velocity_template_from_xsd(xsd_path):
-    global_elements, global_types, schema_doc, target_ns, nsmap = get_schema_elements_and_types(xsd_path)
+            # Элемент без явного типа: создаём элемент с переменной
+            full_elem_name = ctx.qualify(elem_name)
+            writer.emit(depth, f"<{full_elem_name}{ctx.attributes(element_or_type_def)}>$request.{elem_name}</{full_elem_name}>\n")
+        return
+
+    writer.emit(depth, "<!-- Неизвестный тип -->\n")
+
+
+def write_velocity_template_recursive(writer, ctx, element_or_type_def, visited_types, element_name_hint=None, depth=0,
+                                      progress=None):
+    """
+    Пишет в writer шаблон Apache Velocity для определения элемента или типа.
+    Обход выполняется на явном стеке (core.traversal.run_frames), поэтому глубина схемы
+    не упирается в лимит рекурсии Python.
+    """
+    run_frames(_node_frame(writer, ctx, element_or_type_def, set(visited_types), element_name_hint, depth), progress)
+
+
+def build_velocity_template_recursive(element_or_type_def, schema_doc, global_types, target_ns, xsd_ns_map, nsmap, visited_types=None, element_name_hint=None, depth=0):
+    """
+    Строит строку-шаблон Apache Velocity на основе определения элемента или типа.
+    Обёртка над write_velocity_template_recursive для вызывающего кода, которому нужна строка.
+    """
+    if visited_types is None:
+        visited_types = set()
+    out = io.StringIO()
+    ctx = _RenderContext(schema_doc, global_types, target_ns, xsd_ns_map, nsmap)
+    write_velocity_template_recursive(TemplateWriter(out), ctx, element_or_type_def, visited_types, element_name_hint, depth)
+    return out.getvalue()
+
+
+def write_velocity_template_from_xsd(xsd_source, out, fragment_cache=None, progress=None, instrumentation=None):
+    """
+    Пишет скелет VM-шаблона напрямую в out (открытый файл или io-буфер).
+
+    Args:
+        xsd_source: Путь к XSD-файлу или CompiledSchema.
+        out: Объект с методом write(str).
+        fragment_cache (FragmentCache): Кэш фрагментов complexType; передайте свой,
+            чтобы прочитать счетчики hits/misses после генерации.
+        progress (core.progress.ProgressToken): Ход генерации по глобальным элементам и отмена.
+        instrumentation (core.instrumentation.Instrumentation): Счетчики элементов и кэша фрагментов.
+
+    Returns:
+        bool: False, если схему не удалось загрузить.
+    """
+    progress = ensure_progress(progress)
+    global_elements, global_types, schema_doc, target_ns, nsmap = get_schema_elements_and_types(xsd_source)
     if schema_doc is None:
-        print("Не удалось загрузить XSD-схему.")
-        return None
+        logger.error("Не удалось загрузить XSD-схему.")
+        return False
+    progress.stage('xsd_template', total=len(global_elements))
 
     xsd_ns_map = {'xs': "http://www.w3.org/2001/XMLSchema"}
+    ctx = _RenderContext(schema_doc, global_types, target_ns, xsd_ns_map, nsmap, fragment_cache)
+    writer = TemplateWriter(out)
 
     # Начинаем генерацию с корня. Создаём общий корень для шаблона.
     output_root_name = "FullyGeneratedVMTemplateFromXSD"
-    # Определяем префикс для targetNamespace
-    root_elem_prefix = None
-    for p, uri in nsmap.items():
-        if uri == target_ns:
-            root_elem_prefix = p
-            break
-    full_root_name = f"{root_elem_prefix}:{output_root_name}" if root_elem_prefix else output_root_name
+    root_elem_prefix = ctx.elem_prefix
+    full_root_name = ctx.qualify(output_root_name)
 
     # Генерируем пространства имён в корне
     ns_decl_str = ' '.join([f'xmlns:{prefix}="{uri}"' for prefix, uri in nsmap.items() if prefix])
     if root_elem_prefix: # Добавляем default namespace, если оно есть и используется для корня
         ns_decl_str += f' xmlns="{target_ns}"'
 
-    template_str = f"<{full_root_name} {ns_decl_str}>\n"
+    writer.write(f"<{full_root_name} {ns_decl_str}>\n")
 
     for elem_name, elem_def in global_elements.items():
         # Создаём шаблонную часть для каждого глобального элемента
-        elem_template = build_velocity_template_recursive(elem_def, schema_doc, global_types, target_ns, xsd_ns_map, nsmap)
-        template_str += elem_template
+        write_velocity_template_recursive(writer, ctx, elem_def, set(), progress=progress)
+        progress.advance(elem_name)
+
+    writer.write(f"</{full_root_name}>\n")
+    cache = ctx.fragment_cache
+    logger.debug("Кэш фрагментов типов: %d попаданий, %d промахов.", cache.hits, cache.misses)
+    instrumentation = ensure_instrumentation(instrumentation)
+    instrumentation.count('skeleton.global_elements', len(global_elements))
+    instrumentation.count('skeleton.fragment_cache.hits', cache.hits)
+    instrumentation.count('skeleton.fragment_cache.misses', cache.misses)
+    return True
+
+
+def generate_velocity_template_from_xsd(xsd_source, progress=None, instrumentation=None):
+    out = io.StringIO()
+    if not write_velocity_template_from_xsd(xsd_source, out, progress=progress, instrumentation=instrumentation):
+        return None
+    return out.getvalue()
 
-    template_str += f"</{full_root_name}>\n"
+def generate(xsd_source, progress=None, instrumentation=None):
+    template_str = generate_velocity_template_from_xsd(xsd_source, progress, instrumentation)
     return template_str
-
-def generate(xsd_file_path):
-    template_str = generate_velocity_template_from_xsd(xsd_file_path)
-    return template_str
\ No newline at end of file
@@ -0,0 +1,247 @@
+import bisect
+import logging
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher, get_close_matches
+
+try:
+    import numpy as np
+except ImportError:  # NumPy нужен только для пакетного режима (NGramMatrixMatcher)
+    np = None
+
+logger = logging.getLogger(__name__)
+
+FUZZY_BACKENDS = ('difflib', 'matrix')
+
+
+class FuzzyMatcher:
+    """
+    Нечеткий поиск ближайшего ключа, совместимый с difflib.get_close_matches(word, candidates, n=1, cutoff).
+
+    Кандидаты нормализуются (lower) один раз и индексируются по символам
+    (с учетом числа вхождений), списки кандидатов отсортированы по длине.
+    Для слова просматриваются только кандидаты допустимой длины (граница real_quick_ratio)
+    с общими символами; сумма совпадающих символов - это quick_ratio, и полный
+    SequenceMatcher.ratio() считается только для прошедших этот порог.
+    Оба фильтра - верхние оценки ratio, поэтому результат совпадает с difflib.
+
+    Блоки строятся по одиночным символам: по биграммам и длиннее так делать нельзя,
+    ratio >= cutoff возможно и без общих биграмм (например, "axbxc" и "aybyc").
+    """
+
+    def __init__(self, candidates, cutoff=0.6):
+        if not 0.0 <= cutoff <= 1.0:
+            raise ValueError(f"cutoff должен быть в диапазоне [0.0, 1.0]: {cutoff!r}")
+        self.cutoff = cutoff
+        self._originals = {}  # {нормализованный ключ: первый исходный ключ}
+        for candidate in candidates:
+            self._originals.setdefault(candidate.lower(), candidate)
+        self._normalized = list(self._originals)
+        self._lengths = [len(c) for c in self._normalized]
+
+        # {(символ, k): (длины, номера)} - кандидаты, где символ встречается не меньше k раз,
+        # по возрастанию длины. Вклад символа в quick_ratio min(qc, count) = число k <= qc
+        # с count >= k, поэтому сумма считается Counter.update() по срезам без цикла Python.
+        postings = defaultdict(list)
+        for idx, normalized in enumerate(self._normalized):
+            for ch, count in Counter(normalized).items():
+                for k in range(1, count + 1):
+                    postings[(ch, k)].append((len(normalized), idx))
+        self._postings = {}
+        for key, items in postings.items():
+            items.sort()
+            self._postings[key] = ([length for length, _ in items], [idx for _, idx in items])
+        self._memo = {}
+
+    def __len__(self):
+        return len(self._normalized)
+
+    def original(self, normalized):
+        """Исходный ключ для нормализованного (первый по порядку кандидатов)."""
+        return self._originals.get(normalized)
+
+    def match(self, word):
+        """Исходный ключ, ближайший к word, или None."""
+        normalized = self.match_normalized(word)
+        return self._originals[normalized] if normalized is not None else None
+
+    def match_many(self, words):
+        """Исходные ключи для каждого слова из words (None, если совпадения нет)."""
+        return [self.match(word) for word in words]
+
+    def match_normalized(self, word):
+        """Нормализованный ключ, ближайший к word, или None."""
+        word = word.lower()
+        if word not in self._memo:
+            self._memo[word] = self._best(word)
+        return self._memo[word]
+
+    def _best(self, word):
+        cutoff = self.cutoff
+        word_len = len(word)
+        if word_len == 0 or cutoff <= 0.0:
+            # Вырожденные случаи: блокировка ничего не отсекает, считаем как difflib
+            matches = get_close_matches(word, self._normalized, n=1, cutoff=cutoff)
+            return matches[0] if matches else None
+
+        # Допустимые длины кандидата по оценке 2*min(la, lb)/(la + lb) >= cutoff (с запасом)
+        min_len = int(cutoff * word_len / (2.0 - cutoff))
+        max_len = int(word_len * (2.0 - cutoff) / cutoff) + 1
+        shared = Counter()
+        for ch, qc in Counter(word).items():
+            for k in range(1, qc + 1):
+                entry = self._postings.get((ch, k))
+                if entry is None:
+                    break
+                lengths, idxs = entry
+                shared.update(idxs[bisect.bisect_left(lengths, min_len):bisect.bisect_right(lengths, max_len)])
+
+        best = None
+        lengths = self._lengths
+        matcher = SequenceMatcher()
+        matcher.set_seq2(word)
+        for idx, matches in shared.items():
+            cand_len = lengths[idx]
+            total = cand_len + word_len
+            # real_quick_ratio и quick_ratio по формуле difflib
+            if 2.0 * min(cand_len, word_len) / total < cutoff or 2.0 * matches / total < cutoff:
+                continue
+            candidate = self._normalized[idx]
+            matcher.set_seq1(candidate)
+            score = matcher.ratio()
+            if score >= cutoff and (best is None or (score, candidate) > best):
+                best = (score, candidate)
+        return best[1] if best is not None else None
+
+
+class NGramMatrixMatcher:
+    """
+    Пакетный режим нечеткого поиска на NumPy.
+
+    Все кандидаты и все слова кодируются векторами присутствия символьных n-грамм,
+    и матрица сходства для блока слов считается одним умножением матриц
+    (коэффициент Дайса по множествам n-грамм: 2*|A & B| / (|A| + |B|)).
+    Из каждой строки матрицы берутся top_k лучших кандидатов, и окончательная
+    оценка для них считается SequenceMatcher.ratio(), как в difflib. Кандидат,
+    не попавший в top_k, не рассматривается, поэтому результат может изредка
+    отличаться от FuzzyMatcher. При top_k=None оценкой служит сам коэффициент Дайса.
+    """
+
+    def __init__(self, candidates, cutoff=0.6, n=2, top_k=16, block_rows=1024):
+        if np is None:
+            raise ImportError("Для пакетного режима сопоставления нужен NumPy (pip install numpy)")
+        if not 0.0 <= cutoff <= 1.0:
+            raise ValueError(f"cutoff должен быть в диапазоне [0.0, 1.0]: {cutoff!r}")
+        self.cutoff = cutoff
+        self.n = n
+        self.top_k = top_k
+        self.block_rows = block_rows
+        self._originals = {}
+        for candidate in candidates:
+            self._originals.setdefault(candidate.lower(), candidate)
+        self._normalized = list(self._originals)
+
+        candidate_grams = [self._grams(c) for c in self._normalized]
+        self._vocabulary = {}
+        for grams in candidate_grams:
+            for gram in grams:
+                self._vocabulary.setdefault(gram, len(self._vocabulary))
+        self._matrix = self._encode(candidate_grams)
+        self._sizes = np.array([len(grams) for grams in candidate_grams], dtype=np.float32)
+        self._memo = {}
+
+    def _grams(self, text):
+        padded = " " * (self.n - 1) + text + " " * (self.n - 1)
+        return {padded[i:i + self.n] for i in range(len(padded) - self.n + 1)}
+
+    def _encode(self, grams_list):
+        # n-граммы вне словаря кандидатов не влияют на пересечение, они учитываются только в размере
+        rows, cols = [], []
+        for row, grams in enumerate(grams_list):
+            for gram in grams:
+                col = self._vocabulary.get(gram)
+                if col is not None:
+                    rows.append(row)
+                    cols.append(col)
+        matrix = np.zeros((len(grams_list), len(self._vocabulary)), dtype=np.float32)
+        matrix[rows, cols] = 1.0
+        return matrix
+
+    def __len__(self):
+        return len(self._normalized)
+
+    def original(self, normalized):
+        """Исходный ключ для нормализованного (первый по порядку кандидатов)."""
+        return self._originals.get(normalized)
+
+    def match(self, word):
+        """Исходный ключ, ближайший к word, или None."""
+        return self.match_many([word])[0]
+
+    def match_normalized(self, word):
+        """Нормализованный ключ, ближайший к word, или None."""
+        word = word.lower()
+        if word not in self._memo:
+            self._match_batch([word])
+        return self._memo[word]
+
+    def match_many(self, words):
+        """Исходные ключи для каждого слова из words (None, если совпадения нет)."""
+        words = [word.lower() for word in words]
+        self._match_batch([word for word in dict.fromkeys(words) if word not in self._memo])
+        return [self._originals[self._memo[word]] if self._memo[word] is not None else None
+                for word in words]
+
+    def _match_batch(self, words):
+        # Слова обрабатываются блоками по block_rows строк, чтобы матрица сходства
+        # занимала не больше block_rows x число кандидатов
+        if not self._normalized:
+            self._memo.update(dict.fromkeys(words))
+            return
+        for start in range(0, len(words), self.block_rows):
+            block = words[start:start + self.block_rows]
+            block_grams = [self._grams(word) for word in block]
+            query = self._encode(block_grams)
+            query_sizes = np.array([len(grams) for grams in block_grams], dtype=np.float32)
+            scores = 2.0 * (query @ self._matrix.T) / (query_sizes[:, None] + self._sizes[None, :])
+            if self.top_k is None:
+                self._take_best(block, scores)
+            else:
+                self._rerank(block, scores)
+
+    def _take_best(self, block, scores):
+        best_idx = scores.argmax(axis=1)
+        best_scores = scores[np.arange(len(block)), best_idx]
+        for word, idx, score in zip(block, best_idx.tolist(), best_scores.tolist()):
+            self._memo[word] = self._normalized[idx] if score >= self.cutoff else None
+
+    def _rerank(self, block, scores):
+        k = min(self.top_k, scores.shape[1])
+        shortlist = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        matcher = SequenceMatcher()
+        for word, idxs in zip(block, shortlist.tolist()):
+            matcher.set_seq2(word)
+            best = None
+            for idx in idxs:
+                candidate = self._normalized[idx]
+                matcher.set_seq1(candidate)
+                if matcher.real_quick_ratio() < self.cutoff or matcher.quick_ratio() < self.cutoff:
+                    continue
+                score = matcher.ratio()
+                if score >= self.cutoff and (best is None or (score, candidate) > best):
+                    best = (score, candidate)
+            self._memo[word] = best[1] if best is not None else None
+
+
+def create_matcher(candidates, cutoff=0.6, backend='difflib'):
+    """
+    Создает нечеткий матчер: 'difflib' - FuzzyMatcher (результаты как у difflib),
+    'matrix' - NGramMatrixMatcher (пакетный режим на NumPy).
+    Если NumPy не установлен, вместо 'matrix' используется 'difflib'.
+    """
+    if backend not in FUZZY_BACKENDS:
+        raise ValueError(f"Неизвестный режим нечеткого сопоставления: {backend!r}")
+    if backend == 'matrix':
+        if np is not None:
+            return NGramMatrixMatcher(candidates, cutoff=cutoff)
+        logger.warning("NumPy не установлен, используется сопоставление через difflib.")
+    return FuzzyMatcher(candidates, cutoff=cutoff)
@@ -0,0 +1,282 @@
+import contextlib
+import cProfile
+import os
+import pstats
+import time
+import tracemalloc
+
+
+class Instrumentation:
+    """
+    Время и счетчики этапов генерации.
+
+    Для каждого этапа накапливаются время по часам (wall) и процессорное время
+    потока генерации (cpu), а также число входов. Этапы могут быть вложенными:
+    depth в отчете - уровень вложенности, время вложенного этапа входит в время внешнего.
+    Счетчики - число обработанных элементов и найденных сопоставлений.
+
+    trace_memory=True (нужен запущенный tracemalloc, см. memory_tracing) добавляет
+    к этапам пик (mem_peak) и прирост оставшейся после этапа памяти (mem_retained)
+    относительно начала этапа, в байтах, и top_allocations - строки кода, выделившие
+    больше всего памяти за этап. С трассировкой код работает в разы медленнее,
+    поэтому время в таком отчете завышено.
+    """
+
+    def __init__(self, trace_memory=False, top_allocations=10):
+        self.stages = {}  # {этап: {'wall', 'cpu', 'calls', 'depth'}}, в порядке первого входа
+        self.counters = {}
+        self.trace_memory = trace_memory
+        self.top_allocations = top_allocations
+        self._depth = 0
+        self._memory_stack = []  # незавершенные этапы: {'start', 'peak', 'snapshot'}
+        self._memory_start = None
+        self._memory_peak = 0  # наибольший пик среди всех замеров
+        self._created = time.perf_counter()
+        if trace_memory:
+            if not tracemalloc.is_tracing():
+                raise RuntimeError("trace_memory=True требует запущенного tracemalloc (memory_tracing())")
+            self._memory_start = tracemalloc.get_traced_memory()[0]
+            self._start_snapshot = tracemalloc.take_snapshot()
+
+    def _entry(self, name, depth):
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = {'wall': 0.0, 'cpu': 0.0, 'calls': 0, 'depth': depth}
+        return entry
+
+    def _record(self, name, wall, cpu, depth, memory=None):
+        entry = self._entry(name, depth)
+        entry['wall'] += wall
+        entry['cpu'] += cpu
+        entry['calls'] += 1
+        if memory is not None:
+            peak, retained, top = memory
+            # При повторных входах - наибольший пик и суммарный прирост
+            entry['mem_peak'] = max(entry.get('mem_peak', 0), peak)
+            entry['mem_retained'] = entry.get('mem_retained', 0) + retained
+            if top is not None:
+                entry['top_allocations'] = top
+
+    def _take_peak(self):
+        """
+        Текущий объем и пик с прошлого сброса; пик сразу сбрасывается, а его значение
+        учитывается у внешнего этапа, чтобы вложенные замеры не теряли пик внешнего.
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        self._memory_peak = max(self._memory_peak, peak)
+        if self._memory_stack:
+            outer = self._memory_stack[-1]
+            outer['peak'] = max(outer['peak'], peak)
+        tracemalloc.reset_peak()
+        return current, peak
+
+    def _memory_enter(self):
+        current, _ = self._take_peak()
+        self._memory_stack.append({'start': current, 'peak': current, 'snapshot': tracemalloc.take_snapshot()})
+
+    def _memory_exit(self):
+        current, peak = tracemalloc.get_traced_memory()
+        frame = self._memory_stack.pop()
+        stage_peak = max(frame['peak'], peak)
+        self._memory_peak = max(self._memory_peak, stage_peak)
+        if self._memory_stack:
+            outer = self._memory_stack[-1]
+            outer['peak'] = max(outer['peak'], stage_peak)
+        top = top_allocation_sites(tracemalloc.take_snapshot(), frame['snapshot'], self.top_allocations)
+        return stage_peak - frame['start'], current - frame['start'], top
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        depth = self._depth
+        # Место в отчете - по первому входу, чтобы внешний этап шел раньше вложенных
+        self._entry(name, depth)
+        self._depth += 1
+        if self.trace_memory:
+            self._memory_enter()
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            self._depth -= 1
+            memory = self._memory_exit() if self.trace_memory else None
+            self._record(name, wall, cpu, depth, memory)
+
+    def laps(self, prefix):
+        """Последовательные шаги внутри этапа без вложенных блоков with: см. Laps."""
+        return Laps(self, prefix)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self):
+        """Отчет в виде словаря (сериализуется в JSON)."""
+        report = {
+            'total_wall': time.perf_counter() - self._created,
+            'stages': [dict(name=name, **entry) for name, entry in self.stages.items()],
+            'counters': dict(self.counters),
+        }
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max([peak, self._memory_peak] + [frame['peak'] for frame in self._memory_stack])
+            report['memory'] = {
+                'peak': peak - self._memory_start,
+                'retained': current - self._memory_start,
+                'top_allocations': top_allocation_sites(tracemalloc.take_snapshot(), self._start_snapshot,
+                                                        self.top_allocations),
+            }
+        return report
+
+
+class Laps:
+    """
+    Замер последовательных шагов: lap(name) записывает этап "<prefix>.<name>"
+    длиной от предыдущей отметки (или от создания) до текущего момента.
+    """
+
+    def __init__(self, instrumentation, prefix):
+        self.instrumentation = instrumentation
+        self.prefix = prefix
+        self._depth = instrumentation._depth
+        self._memory = None
+        if instrumentation.trace_memory:
+            self._memory = instrumentation._take_peak()[0]
+        self._wall, self._cpu = time.perf_counter(), time.thread_time()
+
+    def lap(self, name):
+        wall, cpu = time.perf_counter(), time.thread_time()
+        memory = None
+        if self._memory is not None:
+            # Для шагов - только пик и прирост, без снимков (top_allocations)
+            current, peak = self.instrumentation._take_peak()
+            memory = (max(peak, current) - self._memory, current - self._memory, None)
+            self._memory = current
+        self.instrumentation._record(f"{self.prefix}.{name}", wall - self._wall, cpu - self._cpu, self._depth, memory)
+        self._wall, self._cpu = wall, cpu
+
+
+class _NullInstrumentation:
+    """Замены без затрат для вызовов без instrumentation."""
+
+    def stage(self, name):
+        return contextlib.nullcontext()
+
+    def laps(self, prefix):
+        return _NULL_LAPS
+
+    def count(self, name, n=1):
+        pass
+
+
+class _NullLaps:
+    def lap(self, name):
+        pass
+
+
+_NULL_LAPS = _NullLaps()
+_NULL_INSTRUMENTATION = _NullInstrumentation()
+
+
+def ensure_instrumentation(instrumentation):
+    return instrumentation if instrumentation is not None else _NULL_INSTRUMENTATION
+
+
+def top_allocation_sites(snapshot, base_snapshot, limit):
+    """Строки кода с наибольшим приростом выделенной памяти между снимками."""
+    snapshot = snapshot.filter_traces(_TRACE_FILTERS)
+    base_snapshot = base_snapshot.filter_traces(_TRACE_FILTERS)
+    sites = []
+    for stat in snapshot.compare_to(base_snapshot, 'lineno'):
+        if stat.size_diff <= 0:
+            continue
+        frame = stat.traceback[0]
+        sites.append({'site': f"{frame.filename}:{frame.lineno}", 'size': stat.size_diff, 'count': stat.count_diff})
+        if len(sites) >= limit:
+            break
+    return sites
+
+
+_TRACE_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),  # собственные структуры отчета
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+@contextlib.contextmanager
+def memory_tracing(enabled=True, frames=1):
+    """Запускает tracemalloc на время блока (если он еще не запущен)."""
+    if not enabled or tracemalloc.is_tracing():
+        yield
+        return
+    tracemalloc.start(frames)
+    try:
+        yield
+    finally:
+        tracemalloc.stop()
+
+
+def _mib(size):
+    return f"{size / (1024 * 1024):.2f}"
+
+
+def format_report(report):
+    """Отчет Instrumentation.report() в виде текстовой таблицы."""
+    memory = 'memory' in report
+    header = f"{'Этап':<40} {'wall, с':>9} {'cpu, с':>9} {'вызовов':>8}"
+    if memory:
+        header += f" {'пик, МиБ':>9} {'прирост, МиБ':>12}"
+    lines = [header]
+    for entry in report['stages']:
+        name = '  ' * entry['depth'] + entry['name']
+        line = f"{name:<40} {entry['wall']:>9.4f} {entry['cpu']:>9.4f} {entry['calls']:>8}"
+        if memory and 'mem_peak' in entry:
+            line += f" {_mib(entry['mem_peak']):>9} {_mib(entry['mem_retained']):>12}"
+        lines.append(line)
+    lines.append(f"{'Всего':<40} {report['total_wall']:>9.4f}")
+    for name, value in report['counters'].items():
+        lines.append(f"  {name}: {value}")
+    if memory:
+        lines.append(f"Память: пик {_mib(report['memory']['peak'])} МиБ, "
+                     f"осталось {_mib(report['memory']['retained'])} МиБ")
+        for site in report['memory']['top_allocations']:
+            lines.append(f"  {_mib(site['size']):>8} МиБ  {site['count']:>7}  {_short_path(site['site'])}")
+    return '\n'.join(lines)
+
+
+def _short_path(site):
+    """Путь к файлу относительно текущего каталога, если файл внутри него."""
+    try:
+        relative = os.path.relpath(site)
+    except ValueError:  # другой диск в Windows
+        return site
+    return site if relative.startswith('..') else relative
+
+
+@contextlib.contextmanager
+def profiled(profile_path, top=25):
+    """
+    Необязательный профиль cProfile: статистика сохраняется в profile_path
+    (формат pstats, открывается через pstats.Stats или snakeviz).
+    Отдает словарь, в который после выхода записываются самые затратные функции.
+    """
+    summary = {}
+    if not profile_path:
+        yield summary
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield summary
+    finally:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
+        stats = pstats.Stats(profiler)
+        functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+        summary['path'] = profile_path
+        summary['top_cumulative'] = [
+            {'function': f"{filename}:{line}({name})", 'calls': calls, 'total': total, 'cumulative': cumulative}
+            for (filename, line, name), (_, calls, total, cumulative, _) in functions
+        ]
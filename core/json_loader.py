@@ -0,0 +1,110 @@
+import json
+import mmap
+import os
+import time
+
+# Файлы от этого размера читаются через mmap
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+# Первые байты, с которых может начинаться JSON-документ (после пробелов и BOM)
+_JSON_START_BYTES = frozenset(b'{["-0123456789tfn')
+_UTF8_BOM = b'\xef\xbb\xbf'
+
+
+class JSONLoadError(ValueError):
+    """Файл не содержит корректного JSON ни целиком, ни между первой '{' и последней '}'."""
+
+
+class JSONDocument:
+    """
+    Загруженный JSON-документ и сведения о загрузке.
+
+    strategy: 'direct' - разобран весь файл, 'brace_slice' - текст между первой '{'
+    и последней '}' (файлы .txt с JSON внутри).
+    """
+    __slots__ = ('path', 'data', 'strategy', 'used_mmap', 'size', 'elapsed')
+
+    def __init__(self, path, data, strategy, used_mmap, size, elapsed):
+        self.path = path
+        self.data = data
+        self.strategy = strategy
+        self.used_mmap = used_mmap
+        self.size = size
+        self.elapsed = elapsed
+
+    def describe(self):
+        """Краткое описание загрузки для сообщений."""
+        how = "весь файл" if self.strategy == 'direct' else "фрагмент между { и }"
+        via = ", mmap" if self.used_mmap else ""
+        return f"{how}{via}, {self.size} байт, {self.elapsed:.3f} с"
+
+    def __str__(self):
+        # Для ленивого форматирования в журнале: logger.debug("... (%s)", document)
+        return self.describe()
+
+
+def parse_json_buffer(buffer):
+    """
+    Разбирает JSON из байтов (bytes или mmap) без повторного чтения файла.
+
+    Сначала разбирается весь буфер; если это не JSON, разбирается фрагмент того же
+    буфера между первой '{' и последней '}'. Если буфер заведомо не начинается
+    с JSON-значения, первая попытка пропускается.
+
+    Returns:
+        tuple: (данные, стратегия 'direct' или 'brace_slice').
+
+    Raises:
+        JSONLoadError: Если JSON не найден.
+        UnicodeDecodeError: Если файл не в UTF-8.
+    """
+    head = buffer[:64].lstrip()
+    if head.startswith(_UTF8_BOM):
+        head = head[len(_UTF8_BOM):].lstrip()
+    if head and head[0] in _JSON_START_BYTES:
+        try:
+            if not isinstance(buffer, bytes):
+                # Текст декодируется прямо из mmap, без промежуточной копии в bytes;
+                # кодировку определяет json так же, как для bytes
+                return json.loads(str(buffer, json.detect_encoding(buffer[:4]), 'surrogatepass')), 'direct'
+            return json.loads(buffer), 'direct'
+        except json.JSONDecodeError:
+            pass
+
+    try:
+        start = buffer.find(b'{')
+        end = buffer.rfind(b'}')
+        if start != -1 and end != -1 and start < end:
+            return json.loads(buffer[start:end + 1]), 'brace_slice'
+        raise ValueError("Не удалось найти корректный JSON в файле.")
+    except Exception as e:
+        raise JSONLoadError(str(e)) from e
+
+
+def load_json_document(path, use_mmap=None):
+    """
+    Загружает JSON-документ за одно чтение файла.
+
+    Args:
+        path (str): Путь к файлу.
+        use_mmap (bool): Читать через mmap; по умолчанию - для файлов от MMAP_THRESHOLD байт.
+
+    Returns:
+        JSONDocument: Данные и сведения о том, как они были получены.
+
+    Raises:
+        OSError: Если файл не удалось открыть.
+        JSONLoadError: Если JSON не найден.
+    """
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if use_mmap is None:
+            use_mmap = size >= MMAP_THRESHOLD
+        if use_mmap and size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                data, strategy = parse_json_buffer(buffer)
+        else:
+            use_mmap = False
+            data, strategy = parse_json_buffer(f.read())
+    return JSONDocument(path, data, strategy, use_mmap, size, time.perf_counter() - started)
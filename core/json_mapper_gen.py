@@ -1,15 +1,30 @@
 # auto_field_mapper_v3.py
-import json
-import re
-import difflib  # Для нечеткого сравнения строк
+import logging
+import os
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from collections import defaultdict
 from lxml import etree
+from core.fuzzy_match import create_matcher
+from core.json_loader import JSONLoadError, load_json_document, parse_json_buffer
+from core.json_stream import ComponentScanner
+from core.instrumentation import ensure_instrumentation
+from core.progress import ensure_progress
+from core.schema_model import CompiledSchema, ensure_schema
+from core.traversal import run_frames
+
+logger = logging.getLogger(__name__)
 
 
 # --- 1. Анализ XSD-схемы ---
 class XSDSchemaAnalyzer:
-    def __init__(self, xsd_path):
-        self.xsd_path = xsd_path
+    def __init__(self, xsd_source, progress=None):
+        # xsd_source - путь к XSD-файлу или уже скомпилированная CompiledSchema,
+        # общая с final_gen (чтобы не разбирать один и тот же файл дважды).
+        # progress - core.progress.ProgressToken: ход анализа по глобальным элементам и отмена
+        self.progress = ensure_progress(progress)
+        self.xsd_path = xsd_source.path if isinstance(xsd_source, CompiledSchema) else xsd_source
+        self.schema = None
         self.schema_doc = None
         self.nsmap = {'xs': 'http://www.w3.org/2001/XMLSchema', 'soc': 'http://socit.ru/kalin/orders/2.0.0'}
         self.target_ns = "http://socit.ru/kalin/orders/2.0.0"
@@ -17,60 +32,44 @@ class XSDSchemaAnalyzer:
         self.global_types = {}
         self.element_paths_info = {}  # {full_xpath: {info}}
         self.choice_info = {}  # {parent_xpath: [choice_branch_xpaths]}
-        self._load_schema()
+        self._type_path = set()  # определения типов, раскрываемые на текущем пути обхода
+        self._load_schema(xsd_source)
 
-    def _load_schema(self):
-        try:
-            with open(self.xsd_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            match = re.search(r'targetNamespace\s*=\s*["\']([^"\']+)["\']', content)
-            if match:
-                self.target_ns = match.group(1)
-                print(f"Найден targetNamespace: {self.target_ns}")
-                if 'socit.ru' in self.target_ns:
-                    self.nsmap['soc'] = self.target_ns
-
-            self.schema_doc = etree.fromstring(content.encode('utf-8'))
-            print(f"XSD-схема успешно загружена из {self.xsd_path}")
-        except FileNotFoundError:
-            print(f"Ошибка: Файл XSD {self.xsd_path} не найден.")
-            return
-        except etree.XMLSyntaxError as e:
-            print(f"Ошибка синтаксиса XML в XSD {self.xsd_path}: {e}")
-            return
-        except Exception as e:
-            print(f"Ошибка при загрузке XSD-схемы {self.xsd_path}: {e}")
+    def _load_schema(self, xsd_source):
+        self.schema = ensure_schema(xsd_source)
+        if self.schema is None:
             return
 
-        for elem in self.schema_doc.xpath('//xs:element[@name]', namespaces={'xs': 'http://www.w3.org/2001/XMLSchema'}):
-            name = elem.get('name')
-            if name and not (elem.getparent() is not None and etree.QName(elem.getparent()).localname in ['complexType',
-                                                                                                          'schema']):
-                self.global_elements[name] = elem
+        if self.schema.target_ns:
+            self.target_ns = self.schema.target_ns
+            logger.debug("Найден targetNamespace: %s", self.target_ns)
+            if 'socit.ru' in self.target_ns:
+                self.nsmap['soc'] = self.target_ns
+
+        self.schema_doc = self.schema.root
+        logger.info("XSD-схема успешно загружена из %s", self.xsd_path)
 
-        for elem in self.schema_doc.xpath('//xs:complexType[@name] | //xs:simpleType[@name]',
-                                          namespaces={'xs': 'http://www.w3.org/2001/XMLSchema'}):
-            name = elem.get('name')
-            if name:
-                self.global_types[name] = elem
+        self.global_elements = self.schema.nested_elements
+        self.global_types = self.schema.named_types
 
-        print(f"  Найдено {len(self.global_elements)} глобальных элементов.")
-        print(f"  Найдено {len(self.global_types)} глобальных типов.")
+        logger.debug("Найдено %d глобальных элементов, %d глобальных типов.",
+                     len(self.global_elements), len(self.global_types))
 
     def analyze(self):
         """Анализирует схему и возвращает информацию о структуре."""
-        if not self.schema_doc:
-            print("Ошибка: Схема не загружена.")
+        if self.schema_doc is None:
+            logger.error("Схема не загружена.")
             return {}
 
-        print("Начало анализа структуры XSD...")
+        logger.debug("Начало анализа структуры XSD...")
+        self.progress.stage('xsd_analysis', total=len(self.global_elements))
         for elem_name, elem_def in self.global_elements.items():
-            print(f"  Анализ глобального элемента: {elem_name}")
+            logger.debug("Анализ глобального элемента: %s", elem_name)
             root_xpath = f"/{elem_name}"
             self._analyze_element_node(elem_def, root_xpath, None)
+            self.progress.advance(elem_name)
 
-        print(f"Анализ XSD завершен. Найдено путей элементов: {len(self.element_paths_info)}")
+        logger.info("Анализ XSD завершен. Найдено путей элементов: %d", len(self.element_paths_info))
 
         analysis_result = {
             'elements_by_path': self.element_paths_info,
@@ -80,8 +79,13 @@ class XSDSchemaAnalyzer:
 
     def _analyze_element_node(self, element_node, current_xpath, parent_type_name):
         """
-        Рекурсивно анализирует узел элемента и собирает информацию о его пути.
+        Анализирует узел элемента со всем поддеревом и собирает информацию о путях.
+        Обход выполняется на явном стеке (core.traversal.run_frames), без рекурсии Python.
         """
+        run_frames(self._element_frame(element_node, current_xpath, parent_type_name), self.progress)
+
+    def _element_frame(self, element_node, current_xpath, parent_type_name):
+        """Кадр обхода для узла элемента."""
         elem_name = element_node.get('name')
         elem_type_ref = element_node.get('type')
         elem_min_occurs = element_node.get('minOccurs', '1')
@@ -116,12 +120,22 @@ class XSDSchemaAnalyzer:
         }
 
         if type_def is not None:
-            self._analyze_type_definition(type_def, type_name, current_xpath)
+            # Тип, который уже раскрывается выше по текущему пути, - рекурсивное определение
+            if type_def in self._type_path:
+                logger.debug("Предотвращена циклическая зависимость для типа %s в %s", type_name, current_xpath)
+                return
+            self._type_path.add(type_def)
+            yield self._type_frame(type_def, type_name, current_xpath)
+            self._type_path.remove(type_def)
 
     def _analyze_type_definition(self, type_def_node, type_name, parent_xpath):
         """
         Анализирует определение типа (complexType/simpleType) и его содержимое.
         """
+        run_frames(self._type_frame(type_def_node, type_name, parent_xpath), self.progress)
+
+    def _type_frame(self, type_def_node, type_name, parent_xpath):
+        """Кадр обхода для определения типа."""
         tag_localname = etree.QName(type_def_node).localname
 
         if tag_localname == 'simpleType':
@@ -131,7 +145,7 @@ class XSDSchemaAnalyzer:
             return
 
         simple_content = type_def_node.find('xs:simpleContent', namespaces={'xs': 'http://www.w3.org/2001/XMLSchema'})
-        if simple_content:
+        if simple_content is not None and len(simple_content):
             ext_or_res = simple_content.xpath('(xs:extension | xs:restriction)',
                                               namespaces={'xs': 'http://www.w3.org/2001/XMLSchema'})
             if ext_or_res:
@@ -152,7 +166,7 @@ class XSDSchemaAnalyzer:
 
         complex_content = type_def_node.find('xs:complexContent', namespaces={'xs': 'http://www.w3.org/2001/XMLSchema'})
         content_to_process = None
-        if complex_content:
+        if complex_content is not None and len(complex_content):
             ext_elem = complex_content.find('xs:extension', namespaces={'xs': 'http://www.w3.org/2001/XMLSchema'})
             res_elem = complex_content.find('xs:restriction', namespaces={'xs': 'http://www.w3.org/2001/XMLSchema'})
             content_to_process = ext_elem if ext_elem is not None else res_elem
@@ -186,7 +200,7 @@ class XSDSchemaAnalyzer:
                         if child_name:
                             child_xpath = f"{parent_xpath}/{child_name}"
                             choice_branches.append(child_xpath)
-                            self._analyze_element_node(child_elem_def, child_xpath, type_name)
+                            yield self._element_frame(child_elem_def, child_xpath, type_name)
 
                     self.choice_info[parent_xpath] = choice_branches
 
@@ -196,7 +210,7 @@ class XSDSchemaAnalyzer:
                         child_name = child_elem_def.get('name')
                         if child_name:
                             child_xpath = f"{parent_xpath}/{child_name}"
-                            self._analyze_element_node(child_elem_def, child_xpath, type_name)
+                            yield self._element_frame(child_elem_def, child_xpath, type_name)
 
                 break
 
@@ -213,158 +227,374 @@ class XSDSchemaAnalyzer:
 
 # --- 2. Анализ JSON-сценариев ---
 class JSONScenarioAnalyzer:
-    def __init__(self, json_paths):
+    def __init__(self, json_paths, workers=None, progress=None):
+        # workers - число процессов для параллельного разбора и анализа сценариев;
+        # None или 1 - последовательная обработка в текущем процессе
+        # progress - core.progress.ProgressToken: ход анализа по файлам и отмена
         self.json_paths = json_paths
+        self.workers = workers
+        self.progress = ensure_progress(progress)
+        self.progress.stage('scenarios', total=len(json_paths))
+        # Исходные деревья сценариев не хранятся (анализ выполняется при загрузке);
+        # атрибут оставлен для совместимости
         self.scenarios_data = []
         self.analysis_results = []
+        self._merged = None
+        if workers and workers > 1 and len(json_paths) > 1:
+            self._load_scenarios_parallel()
+        else:
+            self._load_scenarios()
+
+    def _load_scenarios_parallel(self):
+        """
+        Разбирает и анализирует сценарии в пуле процессов.
+        Файлы заранее читаются в пуле потоков, результаты собираются в порядке json_paths,
+        поэтому объединенный анализ совпадает с последовательным.
+        """
+        # Запасной последовательный режим - только при сбое самого пула процессов;
+        # ошибки чтения отдельных файлов сообщаются для этих файлов
+        try:
+            pool = ProcessPoolExecutor(max_workers=self.workers)
+        except (OSError, NotImplementedError) as e:
+            self._load_scenarios_serial_fallback(e)
+            return
+        try:
+            with ThreadPoolExecutor(max_workers=min(len(self.json_paths), 8)) as readers, pool:
+                # Каждый файл отправляется в пул процессов, как только прочитан
+                reads = [readers.submit(_read_bytes, path) for path in self.json_paths]
+                futures = []
+                for path, read in zip(self.json_paths, reads):
+                    try:
+                        data = read.result()
+                    except OSError as e:
+                        futures.append(_completed_future((None, str(e))))
+                        continue
+                    try:
+                        # Процессы пула запускаются при первой отправке задачи
+                        futures.append(pool.submit(_load_and_analyze_scenario, path, data))
+                    except OSError as e:
+                        raise BrokenProcessPool(str(e)) from e
+                results = []
+                for future in futures:
+                    self.progress.check()
+                    results.append(future.result())
+        except BrokenProcessPool as e:
+            self._load_scenarios_serial_fallback(e)
+            return
+
+        for i, (path, (analysis, error)) in enumerate(zip(self.json_paths, results)):
+            if error is not None:
+                logger.error("Ошибка при загрузке JSON-сценария %s: %s", path, error)
+                continue
+            logger.debug("JSON-сценарий загружен и проанализирован в отдельном процессе: %s", path)
+            self.analysis_results.append(analysis)
+            self.progress.advance(path)
+
+    def _load_scenarios_serial_fallback(self, error):
+        logger.warning("Параллельный анализ сценариев недоступен (%s), используется последовательный.", error)
         self._load_scenarios()
 
     def _load_scenarios(self):
+        # Каждый сценарий анализируется сразу после загрузки, и его дерево не сохраняется:
+        # в памяти одновременно находится не больше одного исходного сценария
         for path in self.json_paths:
+            self.progress.check()
             try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-            except json.JSONDecodeError:
-                try:
-                    with open(path, 'r', encoding='utf-8') as f:
-                        text_content = f.read()
-                    start = text_content.find('{')
-                    end = text_content.rfind('}')
-                    if start != -1 and end != -1 and start < end:
-                        json_string = text_content[start:end + 1]
-                        data = json.loads(json_string)
-                    else:
-                        raise ValueError("Не удалось найти корректный JSON в файле.")
-                except Exception as e:
-                    print(f"Ошибка при загрузке JSON-сценария {path}: {e}")
-                    continue
-            self.scenarios_data.append(data)
-            print(f"JSON-сценарий успешно загружен из {path}")
+                document = load_json_document(path)
+            except JSONLoadError as e:
+                logger.error("Ошибка при загрузке JSON-сценария %s: %s", path, e)
+                continue
+            data = document.data
+            document.data = None
+            logger.debug("JSON-сценарий успешно загружен из %s (%s)", path, document)
+            logger.debug("Анализ сценария %d...", len(self.analysis_results) + 1)
+            self.analysis_results.append(self._analyze_single_scenario(data))
+            del data
+            self.progress.advance(path)
 
     def analyze(self):
         """Анализирует загруженные сценарии."""
-        all_analysis = {
-            'field_to_id': {},
-            'stored_values': {},
-            'choice_fields': {},
-            'flat_fields': {},
-            'common_keys': set(),
-            'keys_per_scenario': []
-        }
+        if self._merged is None:
+            self._merged = merge_scenario_analyses(self.analyze_parts())
+            # Части уже вошли в объединенный результат
+            self.analysis_results = []
+        return self._merged
 
-        for i, data in enumerate(self.scenarios_data):
-            print(f"Анализ сценария {i + 1}...")
-            scenario_analysis = self._analyze_single_scenario(data)
-            self.analysis_results.append(scenario_analysis)
-
-            all_analysis['field_to_id'].update(scenario_analysis['field_to_id'])
-            all_analysis['stored_values'].update(scenario_analysis['stored_values'])
-            all_analysis['choice_fields'].update(scenario_analysis['choice_fields'])
-            all_analysis['flat_fields'].update(scenario_analysis['flat_fields'])
-
-            keys_in_this_scenario = set(scenario_analysis['field_to_id'].keys()) | \
-                                    set(scenario_analysis['stored_values'].keys()) | \
-                                    set(scenario_analysis['choice_fields'].keys())
-            all_analysis['keys_per_scenario'].append(keys_in_this_scenario)
-            all_analysis['common_keys'].update(keys_in_this_scenario)
-
-        if all_analysis['keys_per_scenario']:
-            common_keys = set.intersection(*all_analysis['keys_per_scenario'])
-            all_analysis['common_keys'] = common_keys
-            print(f"Найдено {len(common_keys)} общих ключей во всех сценариях.")
-
-        return all_analysis
+    def analyze_parts(self):
+        """
+        Результаты анализа каждого загруженного сценария (в порядке загрузки).
+        После analyze() части освобождаются и список пуст.
+        """
+        return self.analysis_results
 
     def _analyze_single_scenario(self, data, path=""):
-        """Рекурсивно анализирует один сценарий."""
+        """
+        Анализирует один сценарий.
+
+        Обход пишет в один общий набор словарей, а не собирает словари на каждом
+        уровне и копирует их вверх через update(). Ключ оказывается на позиции
+        первой записи со значением последней - как и при объединении уровней.
+        Строки путей строятся только для сохраняемых полей (flat_fields).
+        """
         analysis = {
             'field_to_id': {},
             'stored_values': {},
             'choice_fields': {},
             'flat_fields': {},
         }
+        self._walk_scenario(data, _LazyPath(path), analysis['field_to_id'], analysis['stored_values'],
+                            analysis['choice_fields'], analysis['flat_fields'])
+        return analysis
 
+    def _walk_scenario(self, data, path, field_to_id, stored_values, choice_fields, flat_fields):
         if isinstance(data, dict):
             for key, value in data.items():
-                new_path = f"{path}.{key}" if path else key
                 if key == 'fieldToId' and isinstance(value, dict):
-                    normalized_fti = {k.lstrip('$'): v for k, v in value.items()}
-                    analysis['field_to_id'].update(normalized_fti)
+                    for k, v in value.items():
+                        field_to_id[k.lstrip('$')] = v
                 elif key == 'storedValues' and isinstance(value, dict):
-                    analysis['stored_values'].update(value)
+                    stored_values.update(value)
                 elif key.endswith('Choice') and isinstance(value, dict) and 'value' in value:
-                    analysis['choice_fields'][key] = value.get('value', '')
+                    choice_fields[key] = value.get('value', '')
                 elif key.startswith('c') and isinstance(value, dict) and 'value' in value:
-                    analysis['flat_fields'][key] = new_path
+                    flat_fields[key] = path.child(key)
                 elif isinstance(value, (str, int, float, bool)) or value is None:
-                    analysis['flat_fields'][key] = new_path
+                    flat_fields[key] = path.child(key)
                 elif isinstance(value, dict):
-                    sub_analysis = self._analyze_single_scenario(value, new_path)
-                    analysis['field_to_id'].update(sub_analysis['field_to_id'])
-                    analysis['stored_values'].update(sub_analysis['stored_values'])
-                    analysis['choice_fields'].update(sub_analysis['choice_fields'])
-                    analysis['flat_fields'].update(sub_analysis['flat_fields'])
+                    path.push_key(key)
+                    self._walk_scenario(value, path, field_to_id, stored_values, choice_fields, flat_fields)
+                    path.pop()
                 elif isinstance(value, list):
-                    for i, item in enumerate(value):
-                        sub_analysis = self._analyze_single_scenario(item, f"{new_path}[{i}]")
-                        analysis['field_to_id'].update(sub_analysis['field_to_id'])
-                        analysis['stored_values'].update(sub_analysis['stored_values'])
-                        analysis['choice_fields'].update(sub_analysis['choice_fields'])
-                        analysis['flat_fields'].update(sub_analysis['flat_fields'])
+                    path.push_key(key)
+                    self._walk_list(value, path, field_to_id, stored_values, choice_fields, flat_fields)
+                    path.pop()
         elif isinstance(data, list):
-            for i, item in enumerate(data):
-                sub_analysis = self._analyze_single_scenario(item, f"{path}[{i}]")
-                analysis['field_to_id'].update(sub_analysis['field_to_id'])
-                analysis['stored_values'].update(sub_analysis['stored_values'])
-                analysis['choice_fields'].update(sub_analysis['choice_fields'])
-                analysis['flat_fields'].update(sub_analysis['flat_fields'])
+            self._walk_list(data, path, field_to_id, stored_values, choice_fields, flat_fields)
+
+    def _walk_list(self, items, path, field_to_id, stored_values, choice_fields, flat_fields):
+        for i, item in enumerate(items):
+            if isinstance(item, (dict, list)):
+                path.push_index(i)
+                self._walk_scenario(item, path, field_to_id, stored_values, choice_fields, flat_fields)
+                path.pop()
+
+
+class _LazyPath:
+    """
+    Путь к текущему узлу сценария в виде стека сегментов.
+    Строка пути ("a.b[0].c") собирается только по запросу и кэшируется
+    для каждого уровня, поэтому соседние поля переиспользуют строку родителя.
+    """
+    __slots__ = ('_segments', '_joined')
+
+    def __init__(self, root=""):
+        self._segments = [root]
+        self._joined = [root]
+
+    def push_key(self, key):
+        self._segments.append(key)
+
+    def push_index(self, index):
+        self._segments.append(index)
+
+    def pop(self):
+        self._segments.pop()
+        if len(self._joined) > len(self._segments):
+            del self._joined[len(self._segments):]
+
+    def join(self):
+        joined = self._joined
+        for segment in self._segments[len(joined):]:
+            parent = joined[-1]
+            if isinstance(segment, int):
+                joined.append(f"{parent}[{segment}]")
+            else:
+                joined.append(f"{parent}.{segment}" if parent else segment)
+        return joined[-1]
+
+    def child(self, key):
+        parent = self.join()
+        return f"{parent}.{key}" if parent else key
+
+
+def _read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _completed_future(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def _load_and_analyze_scenario(path, data):
+    """
+    Выполняется в процессе пула: разбор одного сценария из прочитанных байтов
+    (core.json_loader, как и в _load_scenarios) и его анализ.
+    Возвращает (анализ, None) или (None, текст ошибки загрузки).
+    """
+    try:
+        scenario, _ = parse_json_buffer(data)
+    except JSONLoadError as e:
+        return None, str(e)
+    del data
+    return JSONScenarioAnalyzer([])._analyze_single_scenario(scenario), None
+
+
+def merge_scenario_analyses(scenario_analyses):
+    """
+    Объединяет результаты анализа отдельных сценариев (JSONScenarioAnalyzer._analyze_single_scenario)
+    в общий результат: при совпадении ключей побеждает более поздний сценарий.
+    """
+    all_analysis = {
+        'field_to_id': {},
+        'stored_values': {},
+        'choice_fields': {},
+        'flat_fields': {},
+        'common_keys': set(),
+        'keys_per_scenario': []
+    }
+
+    for scenario_analysis in scenario_analyses:
+        all_analysis['field_to_id'].update(scenario_analysis['field_to_id'])
+        all_analysis['stored_values'].update(scenario_analysis['stored_values'])
+        all_analysis['choice_fields'].update(scenario_analysis['choice_fields'])
+        all_analysis['flat_fields'].update(scenario_analysis['flat_fields'])
+
+        keys_in_this_scenario = set(scenario_analysis['field_to_id'].keys()) | \
+                                set(scenario_analysis['stored_values'].keys()) | \
+                                set(scenario_analysis['choice_fields'].keys())
+        all_analysis['keys_per_scenario'].append(keys_in_this_scenario)
+        all_analysis['common_keys'].update(keys_in_this_scenario)
+
+    if all_analysis['keys_per_scenario']:
+        common_keys = set.intersection(*all_analysis['keys_per_scenario'])
+        all_analysis['common_keys'] = common_keys
+        logger.debug("Найдено %d общих ключей во всех сценариях.", len(common_keys))
+
+    return all_analysis
+
+
+def analyze_scenario_file(path):
+    """Анализ одного файла сценария или None, если файл не загрузился."""
+    parts = JSONScenarioAnalyzer([path]).analyze_parts()
+    return parts[0] if parts else None
+
+
+class IncrementalScenarioAnalyzer:
+    """
+    Анализатор JSON-сценариев, который хранит результат по каждому файлу отдельно.
+
+    При добавлении, удалении или изменении одного сценария анализируется только он,
+    а общий результат (объединенные словари, keys_per_scenario, common_keys)
+    собирается из сохраненных частей через merge_scenario_analyses().
+    analyze() возвращает то же, что JSONScenarioAnalyzer(json_paths).analyze(),
+    поэтому объект можно передавать в create_mapping вместо JSONScenarioAnalyzer.
+
+    loader(path) - функция анализа одного файла (по умолчанию analyze_scenario_file),
+    например core.analysis_cache.load_scenario_analysis с привязанным кэшем.
+    """
+
+    def __init__(self, json_paths=(), loader=None):
+        self.loader = loader or analyze_scenario_file
+        self.json_paths = []
+        self._parts = {}  # {путь: (отметка файла, анализ или None)}
+        self.set_paths(json_paths)
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
 
-        return analysis
+    def _load(self, path):
+        self._parts[path] = (self._stamp(path), self.loader(path))
+
+    def add(self, path):
+        """Добавляет сценарий в конец списка (повторное добавление ничего не делает)."""
+        if path in self._parts:
+            return
+        self.json_paths.append(path)
+        self._load(path)
+
+    def remove(self, path):
+        """Убирает сценарий; остальные результаты не пересчитываются."""
+        if path not in self._parts:
+            return
+        self.json_paths.remove(path)
+        del self._parts[path]
+
+    def set_paths(self, json_paths):
+        """
+        Приводит список сценариев к json_paths (в этом порядке):
+        анализируются только новые и измененные на диске файлы.
+        """
+        json_paths = list(dict.fromkeys(json_paths))
+        keep = set(json_paths)
+        for path in [p for p in self._parts if p not in keep]:
+            del self._parts[path]
+        self.json_paths = json_paths
+        for path in json_paths:
+            if path not in self._parts:
+                self._load(path)
+        self.refresh()
+
+    def refresh(self):
+        """Повторно анализирует сценарии, файлы которых изменились с момента анализа."""
+        for path in self.json_paths:
+            stamp, _ = self._parts[path]
+            if stamp != self._stamp(path):
+                logger.info("JSON-сценарий %s изменился, повторный анализ", path)
+                self._load(path)
+
+    def analyze(self):
+        """Объединенный анализ текущих сценариев (в порядке json_paths)."""
+        parts = [self._parts[path][1] for path in self.json_paths]
+        return merge_scenario_analyses([part for part in parts if part is not None])
 
 
 # --- 3. Анализ JSON-схемы услуги ---
 class JSONServiceSchemaAnalyzer:
-    def __init__(self, json_service_schema_path):
+    def __init__(self, json_service_schema_path, streaming=False, progress=None):
+        # streaming=True - компоненты извлекаются потоково (core.json_stream),
+        # без загрузки всего документа в память; результат analyze() тот же
+        # progress - core.progress.ProgressToken: отмена проверяется на каждом компоненте
         self.json_service_schema_path = json_service_schema_path
+        self.streaming = streaming
+        self.progress = ensure_progress(progress)
         self.service_schema_data = None
         self.component_bindings = {}  # {component_id: binding_path}
         self.component_names = {}  # {component_id: component_name}
         self.component_types = {}  # {component_id: component_type}
-        self._load_schema()
+        if not streaming:
+            self._load_schema()
 
     def _load_schema(self):
-        """Загружает и парсит JSON-схему услуги."""
+        """Загружает и парсит JSON-схему услуги (файл читается один раз)."""
         try:
-            with open(self.json_service_schema_path, 'r', encoding='utf-8') as f:
-                # Попробуем загрузить как JSON напрямую
-                self.service_schema_data = json.load(f)
-        except json.JSONDecodeError:
-            # Если не получилось, попробуем извлечь из текста
-            try:
-                with open(self.json_service_schema_path, 'r', encoding='utf-8') as f:
-                    text_content = f.read()
-                start = text_content.find('{')
-                end = text_content.rfind('}')
-                if start != -1 and end != -1 and start < end:
-                    json_string = text_content[start:end + 1]
-                    self.service_schema_data = json.loads(json_string)
-                else:
-                    raise ValueError("Не удалось найти корректный JSON в файле схемы услуги.")
-            except Exception as e:
-                print(f"Ошибка при загрузке JSON-схемы услуги {self.json_service_schema_path}: {e}")
-                return
-        print(f"JSON-схема услуги успешно загружена из {self.json_service_schema_path}")
+            document = load_json_document(self.json_service_schema_path)
+        except JSONLoadError as e:
+            logger.error("Ошибка при загрузке JSON-схемы услуги %s: %s", self.json_service_schema_path, e)
+            return
+        self.service_schema_data = document.data
+        logger.info("JSON-схема услуги успешно загружена из %s (%s)", self.json_service_schema_path, document)
 
     def analyze(self):
         """Анализирует схему услуги и извлекает привязки."""
+        self.progress.stage('service_schema')
+        if self.streaming:
+            return self._analyze_streaming()
         if not self.service_schema_data:
-            print("Ошибка: Схема услуги не загружена.")
+            logger.error("Схема услуги не загружена.")
             return {}
 
-        print("Начало анализа JSON-схемы услуги...")
+        logger.debug("Начало анализа JSON-схемы услуги...")
         # Рекурсивно ищем компоненты и их привязки
         self._recursive_find_components(self.service_schema_data)
-        print(f"Анализ JSON-схемы услуги завершен. Найдено {len(self.component_bindings)} привязок компонентов.")
+        logger.info("Анализ JSON-схемы услуги завершен. Найдено %d привязок компонентов.", len(self.component_bindings))
 
         analysis_result = {
             'component_bindings': self.component_bindings,
@@ -373,27 +603,59 @@ class JSONServiceSchemaAnalyzer:
         }
         return analysis_result
 
+    def _analyze_streaming(self):
+        """Потоковый вариант analyze(): дерево документа не строится."""
+        try:
+            with open(self.json_service_schema_path, 'r', encoding='utf-8') as f:
+                # Объекты закрываются в обратном порядке, а словари результата
+                # заполняются в порядке обхода в глубину - сортируем по номеру открытия
+                scanner = ComponentScanner(f)
+                components = sorted(scanner, key=lambda record: record[0])
+        except (OSError, ValueError) as e:
+            logger.error("Ошибка при загрузке JSON-схемы услуги %s: %s", self.json_service_schema_path, e)
+            return {}
+        logger.info("JSON-схема услуги потоково прочитана из %s", self.json_service_schema_path)
+        if scanner.empty_document:
+            logger.error("Схема услуги не загружена.")
+            return {}
+
+        logger.debug("Начало анализа JSON-схемы услуги...")
+        for _, fields in components:
+            self._add_component(fields)
+        logger.info("Анализ JSON-схемы услуги завершен. Найдено %d привязок компонентов.", len(self.component_bindings))
+
+        return {
+            'component_bindings': self.component_bindings,
+            'component_names': self.component_names,
+            'component_types': self.component_types
+        }
+
+    def _add_component(self, obj):
+        """Запоминает имя, тип и привязку компонента (объекта с ключом 'id')."""
+        self.progress.check()
+        comp_id = obj.get('id')
+        comp_name = obj.get('name', 'UnknownName')
+        comp_type = obj.get('type', 'UnknownType')
+
+        if comp_id:
+            self.component_names[comp_id] = comp_name
+            self.component_types[comp_id] = comp_type
+
+            # Ищем привязку
+            binding_path = obj.get('binding') or obj.get('path')
+            if binding_path:
+                # Привязка может быть относительной, например order.userData.lastName
+                # Для упрощения, будем хранить как есть
+                self.component_bindings[comp_id] = binding_path
+                logger.debug("Найдена привязка: %s -> %s", comp_id, binding_path)
+
     def _recursive_find_components(self, obj, path=""):
         """Рекурсивно ищет компоненты и их привязки в структуре JSON."""
         if isinstance(obj, dict):
             # Проверяем, является ли текущий объект компонентом
             # Обычно у компонента есть 'id' и 'binding' или 'path'
             if 'id' in obj:
-                comp_id = obj.get('id')
-                comp_name = obj.get('name', 'UnknownName')
-                comp_type = obj.get('type', 'UnknownType')
-
-                if comp_id:
-                    self.component_names[comp_id] = comp_name
-                    self.component_types[comp_id] = comp_type
-
-                    # Ищем привязку
-                    binding_path = obj.get('binding') or obj.get('path')
-                    if binding_path:
-                        # Привязка может быть относительной, например order.userData.lastName
-                        # Для упрощения, будем хранить как есть
-                        self.component_bindings[comp_id] = binding_path
-                        print(f"  Найдена привязка: {comp_id} -> {binding_path}")
+                self._add_component(obj)
 
             # Продолжаем рекурсивный обход
             for key, value in obj.items():
@@ -407,220 +669,304 @@ class JSONServiceSchemaAnalyzer:
 
 
 # --- 4. Автоматическое сопоставление ---
-def create_mapping(xsda: XSDSchemaAnalyzer, jsa: JSONScenarioAnalyzer, jssa: JSONServiceSchemaAnalyzer):
-    """Создает автоматический маппинг между полями XSD и JSON."""
-    xsd_analysis = xsda.analyze()
-    json_analysis = jsa.analyze()
-    service_schema_analysis = jssa.analyze()
+def create_mapping(xsda: XSDSchemaAnalyzer, jsa: JSONScenarioAnalyzer, jssa: JSONServiceSchemaAnalyzer,
+                   fuzzy_backend='difflib', progress=None, instrumentation=None):
+    """
+    Создает автоматический маппинг между полями XSD и JSON.
+
+    jsa может быть и IncrementalScenarioAnalyzer - нужен только метод analyze().
+    fuzzy_backend: режим нечеткого сопоставления (шаги 3 и 4) - 'difflib' (по умолчанию)
+    или 'matrix' (пакетный расчет матрицы сходства по n-граммам, нужен NumPy).
+    """
+    instrumentation = ensure_instrumentation(instrumentation)
+    with instrumentation.stage('xsd_analysis'):
+        xsd_analysis = xsda.analyze()
+    with instrumentation.stage('scenarios'):
+        json_analysis = jsa.analyze()
+    with instrumentation.stage('service_schema'):
+        service_schema_analysis = jssa.analyze()
+    return create_mapping_from_analyses(xsd_analysis, json_analysis, service_schema_analysis,
+                                        fuzzy_backend=fuzzy_backend, progress=progress,
+                                        instrumentation=instrumentation)
+
+
+# Сколько имен нечеткого поиска (шаг 3) обрабатывается между проверками отмены
+FUZZY_BATCH_SIZE = 256
+
+
+def _binding_json_path(binding_path, comp_id, field_to_id, stored_values):
+    """
+    Путь в JSON для привязки компонента: ключ fieldToId или storedValues,
+    соответствующий binding_path или comp_id, либо None.
+    """
+    # Упрощённый путь $currentValue.<binding_path> не используем - лучше не сопоставлять, если не уверены.
+    # 1. Прямой поиск по fieldToId (если ключ fieldToId == binding_path)
+    if binding_path in field_to_id:
+        return f"$currentValue.{field_to_id[binding_path]}['value']"
+    # 2. Поиск по storedValues (если ключ storedValues == binding_path)
+    if binding_path in stored_values:
+        return f"$currentValue.storedValues.{binding_path}"
+    # 3. Поиск по ID компонента (если comp_id есть в fieldToId)
+    if comp_id in field_to_id:
+        return f"$currentValue.{field_to_id[comp_id]}['value']"
+    # 4. Поиск по ID компонента в storedValues (если ключ storedValues == comp_id)
+    if comp_id in stored_values:
+        return f"$currentValue.storedValues.{comp_id}"
+    return None
+
+
+def create_mapping_from_analyses(xsd_analysis, json_analysis, service_schema_analysis, fuzzy_backend='difflib',
+                                 progress=None, instrumentation=None):
+    """
+    Создает маппинг по готовым результатам analyze() трех анализаторов
+    (например, взятым из core.analysis_cache без повторного разбора файлов).
+    progress - core.progress.ProgressToken: ход по шагам 1-6 и отмена.
+    instrumentation - core.instrumentation.Instrumentation: время каждой стратегии
+    (mapping.<стратегия>) и число найденных ею сопоставлений (mapping.<стратегия>.matches).
+    """
+    progress = ensure_progress(progress)
+    instrumentation = ensure_instrumentation(instrumentation)
+    progress.stage('mapping', total=6)
+    laps = instrumentation.laps('mapping')
+    mapped = 0
+
+    def finish_strategy(name):
+        nonlocal mapped
+        progress.advance(name)
+        laps.lap(name)
+        instrumentation.count(f'mapping.{name}.matches', len(mapping) - mapped)
+        mapped = len(mapping)
 
     mapping = {}
     reverse_mapping = {}
 
-    print("\n--- Создание автоматического маппинга ---")
-
-    # 1. Используем fieldToId из JSON сценариев
-    print("1. Сопоставление по fieldToId из JSON сценариев...")
-    for xsd_xpath, xsd_elem_info in xsd_analysis['elements_by_path'].items():
+    elements_by_path = xsd_analysis['elements_by_path']
+    field_to_id = json_analysis['field_to_id']
+    stored_values = json_analysis['stored_values']
+    flat_fields = json_analysis['flat_fields']
+
+    # Индексы строятся один раз: стратегии ниже работают через поиск в словарях,
+    # а не через вложенные циклы "пути XSD x ключи JSON".
+    # Имена XSD-элементов в порядке путей (с повторами) и имя -> пути XSD
+    xsd_names = []
+    xsd_paths_by_name = defaultdict(list)
+    for xsd_xpath, xsd_elem_info in elements_by_path.items():
         xsd_elem_name = xsd_elem_info.get('name')
         if not xsd_elem_name:
             continue
-        for json_fti_key, json_c_key in json_analysis['field_to_id'].items():
-            if xsd_elem_name == json_fti_key:
-                json_path = f"$currentValue.{json_c_key}['value']"
-                vm_var = f"$request.{xsd_elem_name}"
-                mapping[vm_var] = json_path
-                reverse_mapping[json_c_key] = vm_var
-                print(f"  [fieldToId] {vm_var} <-> {json_path}")
+        xsd_names.append(xsd_elem_name)
+        xsd_paths_by_name[xsd_elem_name].append(xsd_xpath)
+
+    # Ключ JSON -> путь к значению (приоритет: storedValues, flat_fields, fieldToId)
+    json_sources = {}
+    for c_key_name, c_key in field_to_id.items():
+        json_sources[c_key_name] = f"$currentValue.{c_key}['value']"
+    for flat_key, raw_path in flat_fields.items():
+        if raw_path.endswith('.value'):
+            json_sources[flat_key] = f"$currentValue.{raw_path[:-6]}['value']"
+        else:
+            json_sources[flat_key] = f"$currentValue.{raw_path}"
+    for stored_key in stored_values:
+        json_sources[stored_key] = f"$currentValue.storedValues.{stored_key}"
+
+    laps.lap('index')
+    instrumentation.count('xsd.element_paths', len(elements_by_path))
+    instrumentation.count('xsd.choices', len(xsd_analysis['choices']))
+    instrumentation.count('scenarios.field_to_id', len(field_to_id))
+    instrumentation.count('scenarios.stored_values', len(stored_values))
+    instrumentation.count('scenarios.flat_fields', len(flat_fields))
+    instrumentation.count('service_schema.bindings', len(service_schema_analysis['component_bindings']))
+    instrumentation.count('mapping.xsd_names', len(xsd_names))
+    instrumentation.count('mapping.json_keys', len(json_sources))
+    logger.debug("Создание автоматического маппинга...")
+
+    # 1. Используем fieldToId из JSON сценариев
+    logger.debug("1. Сопоставление по fieldToId из JSON сценариев...")
+    for xsd_elem_name in xsd_names:
+        if xsd_elem_name in field_to_id:
+            json_c_key = field_to_id[xsd_elem_name]
+            json_path = f"$currentValue.{json_c_key}['value']"
+            vm_var = f"$request.{xsd_elem_name}"
+            mapping[vm_var] = json_path
+            reverse_mapping[json_c_key] = vm_var
+            logger.debug("[fieldToId] %s <-> %s", vm_var, json_path)
+
+    finish_strategy("fieldToId")
 
     # 2. Используем storedValues из JSON сценариев
-    print("2. Сопоставление по storedValues из JSON сценариев...")
-    for xsd_xpath, xsd_elem_info in xsd_analysis['elements_by_path'].items():
-        xsd_elem_name = xsd_elem_info.get('name')
-        if not xsd_elem_name:
-            continue
+    logger.debug("2. Сопоставление по storedValues из JSON сценариев...")
+    for xsd_elem_name in xsd_names:
         vm_var = f"$request.{xsd_elem_name}"
-        if vm_var not in mapping:
-            for stored_key in json_analysis['stored_values'].keys():
-                if xsd_elem_name == stored_key:
-                    json_path = f"$currentValue.storedValues.{stored_key}"
-                    mapping[vm_var] = json_path
-                    reverse_mapping[stored_key] = vm_var
-                    print(f"  [storedValues] {vm_var} <-> {json_path}")
-                    break
+        if vm_var not in mapping and xsd_elem_name in stored_values:
+            json_path = f"$currentValue.storedValues.{xsd_elem_name}"
+            mapping[vm_var] = json_path
+            reverse_mapping[xsd_elem_name] = vm_var
+            logger.debug("[storedValues] %s <-> %s", vm_var, json_path)
 
-    # 3. Нечеткое сопоставление (по именам полей)
-    print("3. Нечеткое сопоставление по именам...")
-    json_keys_for_fuzzy = set(json_analysis['stored_values'].keys()) | \
-                          set(json_analysis['field_to_id'].keys()) | \
-                          set(json_analysis['flat_fields'].keys())
+    finish_strategy("storedValues")
 
-    for xsd_xpath, xsd_elem_info in xsd_analysis['elements_by_path'].items():
-        xsd_elem_name = xsd_elem_info.get('name')
-        if not xsd_elem_name:
-            continue
+    # 3. Нечеткое сопоставление (по именам полей)
+    logger.debug("3. Нечеткое сопоставление по именам...")
+    json_keys_for_fuzzy = set(stored_values.keys()) | \
+                          set(field_to_id.keys()) | \
+                          set(flat_fields.keys())
+
+    # Ключи нормализуются и индексируются один раз; в режиме 'difflib'
+    # совпадает с difflib.get_close_matches(cutoff=0.6)
+    json_key_matcher = create_matcher(json_keys_for_fuzzy, cutoff=0.6, backend=fuzzy_backend)
+
+    # Все еще не сопоставленные имена оцениваются одним пакетом. Внутри цикла ниже
+    # имя может стать сопоставленным только на своем собственном шаге, поэтому
+    # пакетный расчет заранее дает тот же результат, что и поиск по одному имени.
+    unmapped_names = [name for name in dict.fromkeys(xsd_names) if f"$request.{name}" not in mapping]
+    instrumentation.count('mapping.fuzzy.queries', len(unmapped_names))
+    fuzzy_matches = {}
+    for start in range(0, len(unmapped_names), FUZZY_BATCH_SIZE):
+        progress.check()
+        batch = unmapped_names[start:start + FUZZY_BATCH_SIZE]
+        fuzzy_matches.update(zip(batch, json_key_matcher.match_many(batch)))
+
+    for xsd_elem_name in xsd_names:
         vm_var = f"$request.{xsd_elem_name}"
         if vm_var not in mapping:
-            close_matches = difflib.get_close_matches(xsd_elem_name.lower(), [k.lower() for k in json_keys_for_fuzzy],
-                                                      n=1, cutoff=0.6)
-            if close_matches:
-                matched_json_key_lower = close_matches[0]
-                original_json_key = next((k for k in json_keys_for_fuzzy if k.lower() == matched_json_key_lower), None)
-                if original_json_key:
-                    json_path_source = "unknown"
-                    if original_json_key in json_analysis['stored_values']:
-                        json_path_source = f"$currentValue.storedValues.{original_json_key}"
-                    elif original_json_key in json_analysis['flat_fields']:
-                        raw_path = json_analysis['flat_fields'][original_json_key]
-                        json_path_source = f"$currentValue.{raw_path}"
-                        if raw_path.endswith('.value'):
-                            json_path_source = f"$currentValue.{raw_path[:-6]}['value']"
-                    elif original_json_key in json_analysis['field_to_id']:
-                        c_key = json_analysis['field_to_id'][original_json_key]
-                        json_path_source = f"$currentValue.{c_key}['value']"
-
-                    mapping[vm_var] = json_path_source
-                    reverse_mapping[original_json_key] = vm_var
-                    print(f"  [fuzzy] {vm_var} <-> {json_path_source} (на основе '{original_json_key}')")
+            original_json_key = fuzzy_matches[xsd_elem_name]
+            if original_json_key:
+                json_path_source = json_sources[original_json_key]
+                mapping[vm_var] = json_path_source
+                reverse_mapping[original_json_key] = vm_var
+                logger.debug("[fuzzy] %s <-> %s (на основе '%s')", vm_var, json_path_source, original_json_key)
+
+    finish_strategy("fuzzy")
 
     # 4. Сопоставление через JSON-схему услуги (bindings)
-    print("4. Сопоставление через привязки из JSON-схемы услуги...")
+    logger.debug("4. Сопоставление через привязки из JSON-схемы услуги...")
     # Пример: binding "order.userData.lastName" <-> XSD элемент "lastName"
     # Пример: binding "contact.email" <-> XSD элемент "Email"
-    # Это сложнее, так как пути могут быть разными.
-    # Попробуем сопоставить конечные части путей.
+    # Пути могут быть разными, поэтому сопоставляем конечные части путей.
+    # Имена XSD-элементов для нечеткого поиска; исходное имя - первое по порядку путей
+    xsd_name_matcher = create_matcher((info.get('name', '') for info in elements_by_path.values()),
+                                      cutoff=0.7, backend=fuzzy_backend)
+
+    # Концы привязок, для которых дойдет до нечеткого поиска, оцениваются одним пакетом.
+    # Результат поиска зависит только от имени, а сопоставления внутри цикла лишь
+    # добавляются, поэтому набор, собранный до цикла, покрывает все обращения в нем.
+    fuzzy_binding_names = []
     for comp_id, binding_path in service_schema_analysis['component_bindings'].items():
-        # Разбиваем binding_path на части
+        potential_xsd_name = binding_path.split('.')[-1]
+        if potential_xsd_name in xsd_paths_by_name and f"$request.{potential_xsd_name}" not in mapping \
+                and _binding_json_path(binding_path, comp_id, field_to_id, stored_values) is None:
+            fuzzy_binding_names.append(potential_xsd_name)
+    fuzzy_binding_names = list(dict.fromkeys(fuzzy_binding_names))
+    instrumentation.count('mapping.binding.fuzzy_queries', len(fuzzy_binding_names))
+    fuzzy_binding_matches = {}
+    for start in range(0, len(fuzzy_binding_names), FUZZY_BATCH_SIZE):
+        progress.check()
+        batch = fuzzy_binding_names[start:start + FUZZY_BATCH_SIZE]
+        fuzzy_binding_matches.update(zip(batch, xsd_name_matcher.match_many(batch)))
+
+    for comp_id, binding_path in service_schema_analysis['component_bindings'].items():
+        progress.check()
         # Пример: "order.userData.lastName" -> ["order", "userData", "lastName"]
-        # Или "contact.email" -> ["contact", "email"]
         binding_parts = binding_path.split('.')
-        if binding_parts:
-            # Берем последнюю часть как потенциальное имя XSD элемента
-            potential_xsd_name = binding_parts[-1]
-
-            # Также можно попробовать сопоставить по имени компонента
-            comp_name = service_schema_analysis['component_names'].get(comp_id, '')
-            # Или по ID компонента (c6, c7 и т.д.), если они совпадают с ключами в fieldToId/storedValues
-
-            # Попробуем найти XSD элемент с таким именем
-            matched_xsd_xpath = None
-            matched_xsd_info = None
-            for xsd_xpath, xsd_elem_info in xsd_analysis['elements_by_path'].items():
-                if xsd_elem_info.get('name') == potential_xsd_name:
-                    matched_xsd_xpath = xsd_xpath
-                    matched_xsd_info = xsd_elem_info
-                    break
-
-            if matched_xsd_xpath:
-                vm_var = f"$request.{potential_xsd_name}"
-                if vm_var not in mapping:  # Приоритет у предыдущих сопоставлений
-                    # Формируем путь к JSON данным.
-                    # Это упрощенный вариант. В реальности путь зависит от структуры сценария.
-                    # Предположим, что binding "order.userData.lastName" соответствует
-                    # структуре в сценарии. Тогда путь к значению может быть
-                    # $currentValue.order.userData.lastName (если это storedValues)
-                    # или $currentValue.c6.value (если c6 привязан к order.userData.lastName)
-
-                    # Попробуем найти, есть ли в fieldToId или storedValues ключ,
-                    # который соответствует этому binding_path или comp_id
-                    found_json_path = None
-                    # 1. Прямой поиск по fieldToId (если ключ fieldToId == binding_path)
-                    # (редко, но возможно)
-                    if binding_path in json_analysis['field_to_id']:
-                        c_key = json_analysis['field_to_id'][binding_path]
-                        found_json_path = f"$currentValue.{c_key}['value']"
-                    # 2. Поиск по storedValues (если ключ storedValues == binding_path)
-                    elif binding_path in json_analysis['stored_values']:
-                        found_json_path = f"$currentValue.storedValues.{binding_path}"
-                    # 3. Поиск по ID компонента (если comp_id есть в fieldToId)
-                    elif comp_id in json_analysis['field_to_id']:
-                        c_key = json_analysis['field_to_id'][comp_id]
-                        found_json_path = f"$currentValue.{c_key}['value']"
-                    # 4. Поиск по ID компонента в storedValues (если ключ storedValues == comp_id)
-                    elif comp_id in json_analysis['stored_values']:
-                        found_json_path = f"$currentValue.storedValues.{comp_id}"
-                    # 5. Если не нашли, используем упрощенный путь (может быть неверным)
-                    else:
-                        # found_json_path = f"$currentValue.{binding_path}" # Очень упрощенный путь
-                        pass  # Лучше не сопоставлять, если не уверены
-
-                    if found_json_path:
-                        mapping[vm_var] = found_json_path
-                        reverse_mapping[f"binding:{comp_id}"] = vm_var  # Для отладки
-                        print(
-                            f"  [service schema binding] {vm_var} <-> {found_json_path} (через binding '{binding_path}' для компонента {comp_id})")
-                    else:
-                        # Можно попробовать нечеткое сопоставление для binding_path
-                        # против имен XSD элементов
-                        close_xsd_matches = difflib.get_close_matches(potential_xsd_name.lower(),
-                                                                      [info.get('name', '').lower() for info in
-                                                                       xsd_analysis['elements_by_path'].values()], n=1,
-                                                                      cutoff=0.7)
-                        if close_xsd_matches and close_xsd_matches[0] != potential_xsd_name.lower():
-                            # Найдено похожее имя XSD элемента
-                            matched_xsd_name_lower = close_xsd_matches[0]
-                            # Найти оригинальное имя
-                            original_xsd_name = next(
-                                (info.get('name') for info in xsd_analysis['elements_by_path'].values() if
-                                 info.get('name', '').lower() == matched_xsd_name_lower), None)
-                            if original_xsd_name:
-                                vm_var_alt = f"$request.{original_xsd_name}"
-                                if vm_var_alt not in mapping:
-                                    # Попробуем сопоставить с JSON по comp_id или binding_path
-                                    alt_json_path = None
-                                    if comp_id in json_analysis['field_to_id']:
-                                        c_key = json_analysis['field_to_id'][comp_id]
-                                        alt_json_path = f"$currentValue.{c_key}['value']"
-                                    elif comp_id in json_analysis['stored_values']:
-                                        alt_json_path = f"$currentValue.storedValues.{comp_id}"
-                                    if alt_json_path:
-                                        mapping[vm_var_alt] = alt_json_path
-                                        reverse_mapping[f"fuzzy_binding:{comp_id}"] = vm_var_alt
-                                        print(
-                                            f"  [fuzzy service schema binding] {vm_var_alt} <-> {alt_json_path} (через binding '{binding_path}' для компонента {comp_id}, fuzzy match с XSD '{original_xsd_name}')")
+        # Берем последнюю часть как потенциальное имя XSD элемента
+        potential_xsd_name = binding_parts[-1]
+
+        if potential_xsd_name not in xsd_paths_by_name:
+            continue
+        vm_var = f"$request.{potential_xsd_name}"
+        if vm_var in mapping:  # Приоритет у предыдущих сопоставлений
+            continue
+
+        found_json_path = _binding_json_path(binding_path, comp_id, field_to_id, stored_values)
+
+        if found_json_path:
+            mapping[vm_var] = found_json_path
+            reverse_mapping[f"binding:{comp_id}"] = vm_var  # Для отладки
+            logger.debug("[service schema binding] %s <-> %s (через binding '%s' для компонента %s)",
+                         vm_var, found_json_path, binding_path, comp_id)
+            continue
+
+        # Нечеткое сопоставление binding_path с именами XSD элементов
+        original_xsd_name = fuzzy_binding_matches[potential_xsd_name]
+        if original_xsd_name is not None and original_xsd_name.lower() != potential_xsd_name.lower():
+            if original_xsd_name:
+                vm_var_alt = f"$request.{original_xsd_name}"
+                if vm_var_alt not in mapping:
+                    # Попробуем сопоставить с JSON по comp_id
+                    alt_json_path = None
+                    if comp_id in field_to_id:
+                        alt_json_path = f"$currentValue.{field_to_id[comp_id]}['value']"
+                    elif comp_id in stored_values:
+                        alt_json_path = f"$currentValue.storedValues.{comp_id}"
+                    if alt_json_path:
+                        mapping[vm_var_alt] = alt_json_path
+                        reverse_mapping[f"fuzzy_binding:{comp_id}"] = vm_var_alt
+                        logger.debug("[fuzzy service schema binding] %s <-> %s (через binding '%s' для компонента %s, "
+                                     "fuzzy match с XSD '%s')",
+                                     vm_var_alt, alt_json_path, binding_path, comp_id, original_xsd_name)
+
+    instrumentation.count('mapping.binding.candidates', len(service_schema_analysis['component_bindings']))
+    finish_strategy("binding")
 
     # 5. Специальная обработка для choice
-    print("5. Сопоставление для элементов choice...")
-    for elem_name, branches in xsda.choice_info.items():
-        print(
-            f"  [XSD choice] Элемент '{elem_name}' имеет ветки: {[b.split('/')[-1] for b in branches[:3]]}...")  # Первые 3
+    logger.debug("5. Сопоставление для элементов choice...")
+    for elem_name, branches in xsd_analysis['choices'].items():
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[XSD choice] Элемент '%s' имеет ветки: %s...",
+                         elem_name, [b.split('/')[-1] for b in branches[:3]])  # Первые 3
         # В JSON может быть поле elem_name + "Choice"
         # Или просто elem_name с числовым значением, указывающим на ветку
         # Или отдельное поле выбора (как ApplicantChoice)
         # Пока оставим это для ручной настройки или более сложной логики
 
+    finish_strategy("choice")
+
     # 6. Сопоставление полей выбора (choice fields)
-    print("6. Сопоставление полей выбора из JSON...")
+    logger.debug("6. Сопоставление полей выбора из JSON...")
     for choice_field_name, choice_value in json_analysis['choice_fields'].items():
         vm_choice_var = f"$request.{choice_field_name}_choice"
         json_choice_path = f"$currentValue.{choice_field_name}['value']"
         mapping[vm_choice_var] = json_choice_path
-        print(f"  [choice field] {vm_choice_var} <-> {json_choice_path} (значение: {choice_value})")
+        logger.debug("[choice field] %s <-> %s (значение: %s)", vm_choice_var, json_choice_path, choice_value)
 
-    print(f"\n--- Создано {len(mapping)} сопоставлений ---")
+    finish_strategy("choice_fields")
+
+    logger.info("Создано %d сопоставлений", len(mapping))
     return mapping, reverse_mapping
 
 
 # --- Основная функция ---
-def generate(xsd_file_path,json_scenario_paths,json_service_schema_path):
-
-    print("--- Анализ XSD-схемы ---")
-    xsd_analyzer = XSDSchemaAnalyzer(xsd_file_path)
+def generate(xsd_source, json_scenario_paths, json_service_schema_path, fuzzy_backend='difflib',
+             json_analyzer=None, scenario_workers=None, progress=None, instrumentation=None):
+    # json_analyzer - готовый анализатор сценариев (например, IncrementalScenarioAnalyzer);
+    # если он передан, json_scenario_paths не используются.
+    # scenario_workers - число процессов для анализа сценариев (см. JSONScenarioAnalyzer)
+    # progress - core.progress.ProgressToken: ход по этапам и кооперативная отмена
+    # instrumentation - core.instrumentation.Instrumentation: время и счетчики этапов
+    instrumentation = ensure_instrumentation(instrumentation)
+
+    logger.debug("Анализ XSD-схемы...")
+    with instrumentation.stage('xsd_analysis'):
+        xsd_analyzer = XSDSchemaAnalyzer(xsd_source, progress=progress)
     # xsd_analysis = xsd_analyzer.analyze()
     # print("Структура XSD (пример):")
     # for path in list(xsd_analysis['elements_by_path'].keys())[:5]:
     #     info = xsd_analysis['elements_by_path'][path]
     #     print(f"  Путь: {path}, Имя: {info['name']}, Тип: {info['type']}")
 
-    print("\n--- Анализ JSON-сценариев ---")
-    json_analyzer = JSONScenarioAnalyzer(json_scenario_paths)
+    logger.debug("Анализ JSON-сценариев...")
+    if json_analyzer is None:
+        with instrumentation.stage('scenarios'):
+            json_analyzer = JSONScenarioAnalyzer(json_scenario_paths, workers=scenario_workers, progress=progress)
     # json_analysis = json_analyzer.analyze()
     # print("Анализ JSON (пример):")
     # print(f"  fieldToId ключей: {len(json_analysis['field_to_id'])}")
     # print(f"  storedValues ключей: {len(json_analysis['stored_values'])}")
     # print(f"  choice_fields: {list(json_analysis['choice_fields'].keys())}")
 
-    print("\n--- Анализ JSON-схемы услуги ---")
-    json_service_analyzer = JSONServiceSchemaAnalyzer(json_service_schema_path)
+    logger.debug("Анализ JSON-схемы услуги...")
+    with instrumentation.stage('service_schema'):
+        json_service_analyzer = JSONServiceSchemaAnalyzer(json_service_schema_path, progress=progress)
     # service_schema_analysis = json_service_analyzer.analyze()
     # print("Анализ JSON-схемы услуги (пример):")
     # print(f"  Найдено привязок: {len(service_schema_analysis['component_bindings'])}")
@@ -628,6 +974,8 @@ def generate(xsd_file_path,json_scenario_paths,json_service_schema_path):
     #     cname = service_schema_analysis['component_names'].get(cid, 'Unknown')
     #     print(f"  Компонент: {cid} ({cname}) -> Привязка: {binding}")
 
-    print("\n--- Создание маппинга ---")
-    mapping, reverse_mapping = create_mapping(xsd_analyzer, json_analyzer, json_service_analyzer)
+    logger.debug("Создание маппинга...")
+    mapping, reverse_mapping = create_mapping(xsd_analyzer, json_analyzer, json_service_analyzer,
+                                              fuzzy_backend=fuzzy_backend, progress=progress,
+                                              instrumentation=instrumentation)
     return mapping
\ No newline at end of file
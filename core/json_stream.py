@@ -0,0 +1,139 @@
+import json
+import re
+
+CHUNK_SIZE = 64 * 1024
+
+# Один токен JSON (с пробелами перед ним): знак структуры, строка или скаляр.
+# Скаляр должен заканчиваться разделителем, иначе он может продолжаться в следующем блоке
+_TOKEN_RE = re.compile(r'[ \t\n\r]*(?:([{}\[\]:,])|("[^"\\]*(?:\\.[^"\\]*)*")|(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null)(?=[ \t\n\r,:\]}]))')
+_WHITESPACE = ' \t\n\r\ufeff'
+
+# Поля компонента, которые нужны JSONServiceSchemaAnalyzer
+COMPONENT_FIELDS = frozenset(('id', 'name', 'type', 'binding', 'path'))
+_CONTAINER = object()
+
+
+class JSONStreamError(ValueError):
+    """Документ не удалось разобрать потоково."""
+
+
+def _decode_string(token):
+    # Строки без экранирования (почти все ключи и значения) не разбираются через json
+    return token[1:-1] if '\\' not in token else json.loads(token)
+
+
+class ComponentScanner:
+    """
+    Потоково ищет в JSON-документе объекты с ключом "id", не строя дерево объектов.
+
+    При итерации для каждого такого объекта (в момент его закрытия) отдается кортеж
+    (номер, {поле: значение}), где номер - порядковый номер открытия объекта
+    в документе (порядок обхода в глубину), а словарь содержит только поля из fields
+    со скалярными значениями. При повторе ключа побеждает последнее значение, как в json.load.
+    Файл читается блоками по CHUNK_SIZE, память зависит от глубины вложенности,
+    а не от размера документа.
+
+    Чтение начинается с первого '{' (или с '[' в начале файла), как и запасной
+    разбор текста "с оберткой" в JSONServiceSchemaAnalyzer; текст до него и после
+    корневого значения пропускается.
+
+    После итерации empty_document - True, если корневое значение пустое ({} или []).
+    """
+
+    def __init__(self, f, fields=COMPONENT_FIELDS):
+        self.f = f
+        self.fields = fields
+        self.empty_document = None
+
+    def _read_start(self):
+        buf = ''
+        while True:
+            chunk = self.f.read(CHUNK_SIZE)
+            buf += chunk
+            stripped = buf.lstrip(_WHITESPACE)
+            if stripped[:1] == '[':
+                return buf, len(buf) - len(stripped), not chunk
+            pos = buf.find('{')
+            if pos != -1:
+                return buf, pos, not chunk
+            if not chunk:
+                raise JSONStreamError("Не удалось найти JSON-объект в файле.")
+            buf = ''
+
+    def __iter__(self):
+        fields = self.fields
+        decode_string = _decode_string
+        buf, pos, eof = self._read_start()
+        # Кадр: [номер объекта или None для массива, поля, текущий ключ, ожидается ключ]
+        stack = []
+        seq = 0
+        tokens_in_root = 0
+        while True:
+            for match in _TOKEN_RE.finditer(buf, pos):
+                # Токен не с текущей позиции или упирающийся в конец буфера может
+                # продолжаться в следующем блоке - дочитываем и разбираем заново
+                if match.start() != pos or (match.end() == len(buf) and not eof):
+                    break
+                pos = match.end()
+                group = match.lastindex
+                if stack:
+                    frame = stack[-1]
+                    if len(stack) == 1:
+                        tokens_in_root += 1
+                else:
+                    frame = None
+
+                if group == 2:  # строка
+                    if frame is None:
+                        raise JSONStreamError("Значение вне объекта")
+                    if frame[3]:
+                        frame[2] = decode_string(match.group(2))
+                        frame[3] = False
+                    elif frame[0] is not None and frame[2] in fields:
+                        frame[1][frame[2]] = decode_string(match.group(2))
+                    continue
+                if frame is not None and frame[3] and match.group(1) != '}':
+                    raise JSONStreamError(f"Ожидался ключ объекта рядом с позицией {pos}")
+                if group == 3:  # число, true, false, null
+                    if frame is None:
+                        raise JSONStreamError("Значение вне объекта")
+                    if frame[0] is not None and frame[2] in fields:
+                        frame[1][frame[2]] = json.loads(match.group(3))
+                    continue
+
+                punct = match.group(1)
+                if punct == ',':
+                    if frame is not None and frame[0] is not None:
+                        frame[3] = True
+                elif punct == '{':
+                    if frame is not None and frame[0] is not None and frame[2] in fields:
+                        frame[1][frame[2]] = _CONTAINER
+                    stack.append([seq, {}, None, True])
+                    seq += 1
+                elif punct == '[':
+                    if frame is not None and frame[0] is not None and frame[2] in fields:
+                        frame[1][frame[2]] = _CONTAINER
+                    stack.append([None, None, None, False])
+                elif punct == '}' or punct == ']':
+                    if frame is None or (punct == '}') != (frame[0] is not None):
+                        raise JSONStreamError(f"Непарная скобка {punct!r}")
+                    stack.pop()
+                    if punct == '}' and 'id' in frame[1]:
+                        values = {k: v for k, v in frame[1].items() if v is not _CONTAINER}
+                        if 'id' in values:
+                            yield frame[0], values
+                    if not stack:
+                        # Закрывающая скобка корня засчитывается в tokens_in_root
+                        self.empty_document = tokens_in_root <= 1
+                        return
+            if eof:
+                raise JSONStreamError("Неожиданный конец JSON-документа")
+            chunk = self.f.read(CHUNK_SIZE)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+
+
+def iter_components(f, fields=COMPONENT_FIELDS):
+    """Компоненты JSON-документа из файла f (см. ComponentScanner)."""
+    return iter(ComponentScanner(f, fields))
@@ -1,7 +1,83 @@
 import core.final_gen, core.json_mapper_gen, core.vm_templ_finalizer
+from core.instrumentation import Instrumentation, ensure_instrumentation, memory_tracing, profiled
+from core.progress import ensure_progress
+from core.schema_model import load_schema
 
 
-def generate_template(xsd_path : str, json_path : str, json_app_paths : list[str]):
-    initial_vm = core.final_gen.generate(xsd_path)
-    mapping =  core.json_mapper_gen.generate(xsd_path, json_app_paths, json_path)
-    return core.vm_templ_finalizer.apply_mapping_to_vm_template(initial_vm, mapping)
\ No newline at end of file
+def generate_template(xsd_path : str, json_path : str, json_app_paths : list[str], cache=None,
+                      scenario_analyzer=None, progress=None, instrumentation=None):
+    # cache - core.analysis_cache.AnalysisCache: результаты анализа неизмененных
+    # файлов берутся с диска без повторного разбора.
+    # scenario_analyzer - core.json_mapper_gen.IncrementalScenarioAnalyzer, который
+    # живет между генерациями: пересчитываются только добавленные и измененные сценарии.
+    # progress - core.progress.ProgressToken: ход по этапам и отмена
+    # (после ProgressToken.cancel() выбрасывается core.progress.GenerationCancelled).
+    # instrumentation - core.instrumentation.Instrumentation: время и счетчики этапов
+    # (см. generate_template_with_report).
+    progress = ensure_progress(progress)
+    instrumentation = ensure_instrumentation(instrumentation)
+    if scenario_analyzer is not None:
+        with instrumentation.stage('scenarios'):
+            scenario_analyzer.set_paths(json_app_paths)
+    if cache is not None:
+        return _generate_template_cached(xsd_path, json_path, json_app_paths, cache, scenario_analyzer, progress,
+                                         instrumentation)
+    # XSD читается и разбирается один раз, схема общая для скелета и маппинга
+    with instrumentation.stage('xsd_load'):
+        schema = load_schema(xsd_path)
+    if schema is None:
+        raise ValueError(f"Не удалось загрузить XSD-схему: {xsd_path}")
+    with instrumentation.stage('skeleton'):
+        initial_vm = core.final_gen.generate(schema, progress, instrumentation)
+    mapping =  core.json_mapper_gen.generate(schema, json_app_paths, json_path, json_analyzer=scenario_analyzer,
+                                             progress=progress, instrumentation=instrumentation)
+    with instrumentation.stage('finalize'):
+        return core.vm_templ_finalizer.apply_mapping_to_vm_template(initial_vm, mapping, progress, instrumentation)
+
+
+def _generate_template_cached(xsd_path, json_path, json_app_paths, cache, scenario_analyzer=None, progress=None,
+                              instrumentation=None):
+    import core.analysis_cache
+    instrumentation = ensure_instrumentation(instrumentation)
+    # При промахе кэша внутри этапа xsd записываются xsd_load, skeleton и xsd_analysis
+    with instrumentation.stage('xsd'):
+        initial_vm, xsd_analysis = core.analysis_cache.load_xsd_results(cache, xsd_path, progress, instrumentation)
+    with instrumentation.stage('scenarios'):
+        if scenario_analyzer is not None:
+            json_analysis = scenario_analyzer.analyze()
+        else:
+            json_analysis = core.analysis_cache.load_scenario_results(cache, json_app_paths, progress,
+                                                                      instrumentation)
+    with instrumentation.stage('service_schema'):
+        service_schema_analysis = core.analysis_cache.load_service_schema_results(cache, json_path, progress,
+                                                                                  instrumentation)
+    mapping, _ = core.json_mapper_gen.create_mapping_from_analyses(xsd_analysis, json_analysis, service_schema_analysis,
+                                                                   progress=progress, instrumentation=instrumentation)
+    with instrumentation.stage('finalize'):
+        return core.vm_templ_finalizer.apply_mapping_to_vm_template(initial_vm, mapping, progress, instrumentation)
+
+
+def generate_template_with_report(xsd_path, json_path, json_app_paths, cache=None, scenario_analyzer=None,
+                                  progress=None, profile_path=None, trace_memory=False):
+    """
+    То же, что generate_template, но вместе с шаблоном возвращает отчет о времени
+    и счетчиках этапов (Instrumentation.report()).
+
+    profile_path - необязательный путь для статистики cProfile (формат pstats);
+    тогда в отчет добавляется раздел 'profile' с самыми затратными функциями.
+    trace_memory=True - замер памяти по этапам через tracemalloc (пик, прирост,
+    места выделения; раздел 'memory' и поля mem_* этапов), генерация заметно медленнее.
+
+    Returns:
+        tuple: (шаблон, отчет).
+    """
+    with memory_tracing(trace_memory):
+        instrumentation = Instrumentation(trace_memory=trace_memory)
+        with profiled(profile_path) as profile_summary:
+            template_content = generate_template(xsd_path, json_path, json_app_paths, cache=cache,
+                                                 scenario_analyzer=scenario_analyzer, progress=progress,
+                                                 instrumentation=instrumentation)
+        report = instrumentation.report()
+    if profile_summary:
+        report['profile'] = profile_summary
+    return template_content, report
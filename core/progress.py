@@ -0,0 +1,73 @@
+import threading
+
+# Этапы конвейера генерации и их названия для интерфейса
+STAGE_TITLES = {
+    'xsd_template': "Построение скелета шаблона по XSD",
+    'xsd_analysis': "Анализ XSD-схемы",
+    'scenarios': "Анализ JSON-сценариев",
+    'service_schema': "Анализ JSON-схемы услуги",
+    'mapping': "Создание маппинга",
+    'finalize': "Подстановка маппинга в шаблон",
+}
+
+# Как часто обход на явном стеке (core.traversal.run_frames) проверяет отмену, в кадрах
+CHECK_EVERY = 256
+
+
+class GenerationCancelled(Exception):
+    """Генерация остановлена через ProgressToken.cancel()."""
+
+
+class ProgressToken:
+    """
+    Наблюдение за ходом генерации и кооперативная отмена.
+
+    Токен передается в функции конвейера (параметр progress). Они сообщают о начале
+    этапа (stage) и о каждом обработанном элементе (advance), а в длинных циклах
+    вызывают check(): после cancel() ближайшая проверка выбрасывает GenerationCancelled.
+
+    callback(stage, done, total, detail) вызывается в потоке генерации;
+    total равен None, если число шагов этапа заранее неизвестно.
+    cancel() можно вызывать из любого потока.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self._cancel_event = threading.Event()
+        self.current_stage = None
+        self.done = 0
+        self.total = None
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def check(self):
+        if self._cancel_event.is_set():
+            raise GenerationCancelled(f"Генерация отменена (этап: {self.current_stage})")
+
+    def stage(self, name, total=None):
+        """Начало этапа name из total шагов."""
+        self.check()
+        self.current_stage = name
+        self.done = 0
+        self.total = total
+        self._report(None)
+
+    def advance(self, detail=None):
+        """Очередной шаг текущего этапа завершен (detail - например, имя элемента)."""
+        self.check()
+        self.done += 1
+        self._report(detail)
+
+    def _report(self, detail):
+        if self.callback is not None:
+            self.callback(self.current_stage, self.done, self.total, detail)
+
+
+def ensure_progress(progress):
+    """Токен для функций, вызванных без progress: ничего не сообщает и не отменяется."""
+    return progress if progress is not None else ProgressToken()
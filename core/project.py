@@ -0,0 +1,66 @@
+import json
+import os
+
+PROJECT_EXTENSION = '.raw_esks'
+
+
+class ProjectData:
+    def __init__(self, json_schema_path="", json_examples_paths=None, xsd_schema_path=""):
+        self.json_schema_path = json_schema_path
+        self.json_examples_paths = json_examples_paths or []
+        self.xsd_schema_path = xsd_schema_path
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            json_schema_path=data.get("json_schema_path", ""),
+            json_examples_paths=data.get("json_examples_paths", []),
+            xsd_schema_path=data.get("xsd_schema_path", "")
+        )
+
+    def to_dict(self):
+        return {
+            "json_schema_path": self.json_schema_path,
+            "json_examples_paths": self.json_examples_paths,
+            "xsd_schema_path": self.xsd_schema_path
+        }
+
+    def resolved(self, base_dir):
+        """Копия проекта, в которой относительные пути отсчитываются от base_dir."""
+        def resolve(path):
+            return os.path.normpath(os.path.join(base_dir, path)) if path else path
+        return ProjectData(
+            json_schema_path=resolve(self.json_schema_path),
+            json_examples_paths=[resolve(path) for path in self.json_examples_paths],
+            xsd_schema_path=resolve(self.xsd_schema_path)
+        )
+
+    def input_paths(self):
+        """Все входные файлы проекта: XSD, схема услуги, сценарии."""
+        paths = [self.xsd_schema_path, self.json_schema_path] + list(self.json_examples_paths)
+        return [path for path in paths if path]
+
+
+def load_project(project_path):
+    """
+    Читает файл проекта (JSON, как его сохраняет ProjectManager).
+    Относительные пути в проекте отсчитываются от каталога файла проекта.
+    """
+    with open(project_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"Файл проекта должен содержать JSON-объект: {project_path}")
+    return ProjectData.from_dict(data).resolved(os.path.dirname(os.path.abspath(project_path)))
+
+
+def find_missing_files(project_data):
+    """Файлы проекта, которых нет на диске."""
+    missing_files = []
+    if project_data.json_schema_path and not os.path.exists(project_data.json_schema_path):
+        missing_files.append(project_data.json_schema_path)
+    if project_data.xsd_schema_path and not os.path.exists(project_data.xsd_schema_path):
+        missing_files.append(project_data.xsd_schema_path)
+    for path in project_data.json_examples_paths:
+        if not os.path.exists(path):
+            missing_files.append(path)
+    return missing_files
@@ -0,0 +1,107 @@
+import logging
+from types import MappingProxyType
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+XSD_NS = "http://www.w3.org/2001/XMLSchema"
+XSD_NS_MAP = {'xs': XSD_NS}
+
+
+class CompiledSchema:
+    """
+    Разобранная один раз XSD-схема, общая для генератора скелета (final_gen)
+    и анализатора маппинга (json_mapper_gen).
+
+    Все таблицы только для чтения: объект можно безопасно передавать
+    между этапами и повторно использовать для нескольких генераций.
+    """
+    __slots__ = ('path', 'root', 'schema_doc', 'target_ns', 'nsmap',
+                 'global_elements', 'global_types', 'nested_elements', 'named_types')
+
+    def __init__(self, root, path=None):
+        object.__setattr__(self, 'path', path)
+        object.__setattr__(self, 'root', root)
+        object.__setattr__(self, 'schema_doc', root.getroottree())
+        object.__setattr__(self, 'target_ns', root.get('targetNamespace'))
+        # Префиксы документа без пространства имён самой XSD
+        object.__setattr__(self, 'nsmap', MappingProxyType(
+            {k: v for k, v in root.nsmap.items() if k != 'xs' and v != XSD_NS}))
+
+        # Глобальные элементы и типы верхнего уровня (для final_gen)
+        global_elements = {}
+        for elem in root.xpath('xs:element[@name]', namespaces=XSD_NS_MAP):
+            name = elem.get('name')
+            if name:
+                global_elements[name] = elem
+        global_types = {}
+        for elem in root.xpath('(xs:complexType[@name] | xs:simpleType[@name])', namespaces=XSD_NS_MAP):
+            name = elem.get('name')
+            if name:
+                global_types[name] = elem
+
+        # Таблицы в том виде, в котором их собирает XSDSchemaAnalyzer:
+        # именованные элементы на любой глубине, кроме прямых потомков
+        # complexType/schema, и именованные типы на любой глубине.
+        nested_elements = {}
+        for elem in root.xpath('//xs:element[@name]', namespaces=XSD_NS_MAP):
+            name = elem.get('name')
+            parent = elem.getparent()
+            if name and not (parent is not None and etree.QName(parent).localname in ['complexType', 'schema']):
+                nested_elements[name] = elem
+        named_types = {}
+        for elem in root.xpath('//xs:complexType[@name] | //xs:simpleType[@name]', namespaces=XSD_NS_MAP):
+            name = elem.get('name')
+            if name:
+                named_types[name] = elem
+
+        object.__setattr__(self, 'global_elements', MappingProxyType(global_elements))
+        object.__setattr__(self, 'global_types', MappingProxyType(global_types))
+        object.__setattr__(self, 'nested_elements', MappingProxyType(nested_elements))
+        object.__setattr__(self, 'named_types', MappingProxyType(named_types))
+
+    def __setattr__(self, key, value):
+        raise AttributeError("CompiledSchema доступна только для чтения")
+
+    def __delattr__(self, key):
+        raise AttributeError("CompiledSchema доступна только для чтения")
+
+
+def compile_schema(data, path=None):
+    """
+    Строит CompiledSchema из байтов XSD-документа.
+
+    Args:
+        data (bytes): Содержимое XSD-файла.
+        path (str): Путь к файлу (только для сообщений).
+
+    Returns:
+        CompiledSchema: Разобранная схема.
+
+    Raises:
+        etree.XMLSyntaxError: Если документ не является корректным XML.
+    """
+    return CompiledSchema(etree.fromstring(data), path)
+
+
+def load_schema(xsd_path):
+    """
+    Читает XSD-файл одним чтением байтов и компилирует его.
+    Возвращает None, если файл не найден или не разбирается.
+    """
+    try:
+        with open(xsd_path, 'rb') as f:
+            data = f.read()
+        return compile_schema(data, xsd_path)
+    except FileNotFoundError:
+        logger.error("Файл XSD не найден: %s", xsd_path)
+    except etree.XMLSyntaxError as e:
+        logger.error("Ошибка парсинга XSD %s: %s", xsd_path, e)
+    return None
+
+
+def ensure_schema(xsd_source):
+    """Принимает путь к XSD или уже скомпилированную схему."""
+    if isinstance(xsd_source, CompiledSchema):
+        return xsd_source
+    return load_schema(xsd_source)
@@ -0,0 +1,252 @@
+import json
+import logging
+import os
+import socket
+import socketserver
+import stat
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import core.json_mapper_gen
+import core.vm_templ_finalizer
+from core.analysis_cache import compute_service_schema_results, compute_xsd_results
+from core.project import ProjectData, find_missing_files, load_project
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_MAX_ENTRIES = 64
+# Допустимые значения заголовка Host (защита от DNS rebinding)
+LOCAL_HOST_NAMES = ('127.0.0.1', 'localhost', '::1')
+
+
+class InputLRU:
+    """
+    Потокобезопасный LRU разобранных входных файлов.
+
+    Ключ - (вид, абсолютный путь, mtime, размер): изменение файла на диске
+    дает новый ключ, а устаревшая запись со временем вытесняется.
+    Один и тот же файл, запрошенный одновременно несколькими потоками,
+    разбирается один раз - остальные ждут результата.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._in_progress = {}  # {ключ: threading.Event}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(kind, path):
+        st = os.stat(path)
+        return kind, os.path.abspath(path), st.st_mtime_ns, st.st_size
+
+    def get_or_compute(self, kind, path, compute):
+        key = self._key(kind, path)
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key]
+                pending = self._in_progress.get(key)
+                if pending is None:
+                    pending = self._in_progress[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # Файл уже разбирается в другом потоке
+            pending.wait()
+
+        try:
+            value = compute(path)
+            with self._lock:
+                self._entries[key] = value
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return value
+        finally:
+            with self._lock:
+                del self._in_progress[key]
+            pending.set()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class GenerationService:
+    """Конвейер final_gen -> json_mapper_gen -> vm_templ_finalizer с LRU разобранных входов."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.inputs = InputLRU(max_entries)
+
+    @staticmethod
+    def validate(project):
+        """
+        Проверяет, что в проекте указаны схемы и все входные файлы существуют.
+
+        Raises:
+            ValueError: Если не указаны XSD-схема или JSON-схема услуги.
+            FileNotFoundError: Если каких-то файлов нет.
+        """
+        if not project.xsd_schema_path or not project.json_schema_path:
+            raise ValueError("Не указаны XSD-схема или JSON-схема услуги")
+        missing_files = find_missing_files(project)
+        if missing_files:
+            raise FileNotFoundError("Не найдены файлы: " + ", ".join(missing_files))
+
+    def generate(self, project):
+        """Генерирует шаблон для ProjectData; возвращает строку шаблона."""
+        self.validate(project)
+        initial_vm, xsd_analysis = self.inputs.get_or_compute('xsd', project.xsd_schema_path, compute_xsd_results)
+        service_schema_analysis = self.inputs.get_or_compute('service', project.json_schema_path,
+                                                             compute_service_schema_results)
+        parts = []
+        for scenario_path in project.json_examples_paths:
+            part = self.inputs.get_or_compute('scenario', scenario_path,
+                                              core.json_mapper_gen.analyze_scenario_file)
+            if part is not None:
+                parts.append(part)
+        json_analysis = core.json_mapper_gen.merge_scenario_analyses(parts)
+
+        mapping, _ = core.json_mapper_gen.create_mapping_from_analyses(xsd_analysis, json_analysis,
+                                                                       service_schema_analysis)
+        return core.vm_templ_finalizer.apply_mapping_to_vm_template(initial_vm, mapping)
+
+
+class GenerationRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP API:
+      GET  /health    - состояние сервера и статистика LRU;
+      POST /generate  - тело JSON с полями проекта (xsd_schema_path, json_schema_path,
+                        json_examples_paths) или {"project": "путь к .raw_esks"};
+                        ответ {"template": ..., "elapsed": ...}.
+    """
+    server_version = "VMGenerator/1.0"
+
+    def _rejection(self):
+        """
+        Причина отказа для запросов не от локальных инструментов, иначе None.
+        Запрос из браузера (есть Origin) отклоняется всегда, по HTTP - также запрос
+        с нелокальным Host: страница могла обратиться к серверу через DNS rebinding.
+        """
+        if 'Origin' in self.headers:
+            return "Запросы из браузера не принимаются"
+        if isinstance(self.client_address, tuple) and _host_name(self.headers.get('Host', '')) not in LOCAL_HOST_NAMES:
+            return "Недопустимый заголовок Host"
+        return None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        rejection = self._rejection()
+        if rejection:
+            self._send_json(403, {'error': rejection})
+            return
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok', 'inputs': self.server.service.inputs.stats()})
+        else:
+            self._send_json(404, {'error': f"Неизвестный путь: {self.path}"})
+
+    def do_POST(self):
+        rejection = self._rejection()
+        if rejection:
+            self._send_json(403, {'error': rejection})
+            return
+        if self.path != '/generate':
+            self._send_json(404, {'error': f"Неизвестный путь: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(request, dict):
+                raise ValueError("Тело запроса должно быть JSON-объектом")
+            if request.get('project'):
+                project = load_project(request['project'])
+            else:
+                project = ProjectData.from_dict(request)
+            # Ошибки в самом проекте - ошибки клиента (400), а не сервера
+            self.server.service.validate(project)
+        except (ValueError, OSError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+
+        started = time.perf_counter()
+        try:
+            template_content = self.server.service.generate(project)
+        except ValueError as e:
+            # Файлы проекта есть, но не разбираются (например, некорректная XSD-схема)
+            self._send_json(400, {'error': str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {'error': f"{type(e).__name__}: {e}"})
+            return
+        self._send_json(200, {'template': template_content, 'elapsed': time.perf_counter() - started})
+
+    def address_string(self):
+        # У Unix-сокета нет адреса клиента
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        logger.info("%s %s", self.address_string(), format % args)
+
+
+def _host_name(host_header):
+    """Имя хоста из заголовка Host без порта (127.0.0.1:8765 -> 127.0.0.1, [::1]:8765 -> ::1)."""
+    host = host_header.strip().lower()
+    if host.startswith('['):
+        return host[1:host.find(']')] if ']' in host else host
+    return host.rsplit(':', 1)[0] if host.count(':') == 1 else host
+
+
+class _IPv6HTTPServer(ThreadingHTTPServer):
+    address_family = socket.AF_INET6
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+def create_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+    """
+    Создает сервер: на Unix-сокете socket_path или по HTTP на host:port.
+    Внешние адреса не поддерживаются - сервер только для локальных инструментов.
+    """
+    if socket_path:
+        if not hasattr(socketserver, 'UnixStreamServer'):
+            raise OSError("Unix-сокеты не поддерживаются в этой системе")
+        # Удаляется только оставшийся от прошлого запуска сокет, а не произвольный файл
+        try:
+            mode = os.lstat(socket_path).st_mode
+        except FileNotFoundError:
+            mode = None
+        if mode is not None:
+            if not stat.S_ISSOCK(mode):
+                raise ValueError(f"{socket_path} существует и не является сокетом")
+            os.remove(socket_path)
+        server = _UnixHTTPServer(socket_path, GenerationRequestHandler)
+    else:
+        if host not in LOCAL_HOST_NAMES:
+            raise ValueError(f"Сервер слушает только локальный адрес, а не {host}")
+        # ThreadingHTTPServer слушает только IPv4
+        server_class = _IPv6HTTPServer if host == '::1' else ThreadingHTTPServer
+        server = server_class((host, port), GenerationRequestHandler)
+        server.daemon_threads = True
+    server.service = service
+    return server
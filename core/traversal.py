@@ -0,0 +1,31 @@
+from core.progress import CHECK_EVERY
+
+
+def run_frames(root_frame, progress=None):
+    """
+    Выполняет обход дерева на явном стеке вместо рекурсии Python.
+
+    Кадр - это генератор. Чтобы обработать дочерний узел, кадр отдаёт через yield
+    генератор-кадр этого узла; он кладётся на стек и выполняется до конца, после
+    чего родительский кадр продолжает работу с того же места. Так порядок действий
+    совпадает с рекурсивным вариантом, а глубина схемы не ограничена лимитом рекурсии.
+
+    Args:
+        root_frame: Генератор корневого кадра.
+        progress (core.progress.ProgressToken): Токен отмены; проверяется
+            каждые CHECK_EVERY кадров, поэтому обход большого поддерева прерывается быстро.
+    """
+    stack = [root_frame]
+    steps = 0
+    while stack:
+        if progress is not None:
+            steps += 1
+            if steps % CHECK_EVERY == 0:
+                progress.check()
+        try:
+            child_frame = next(stack[-1])
+        except StopIteration:
+            stack.pop()
+            continue
+        if child_frame is not None:
+            stack.append(child_frame)
@@ -1,58 +1,84 @@
+import logging
 import re
 
+from core.instrumentation import ensure_instrumentation
+from core.progress import ensure_progress
 
-def apply_mapping_to_vm_template(template_str: str, mapping: dict) -> str:
+logger = logging.getLogger(__name__)
+
+
+def compile_mapping_pattern(mapping: dict):
+    """
+    Собирает одно регулярное выражение, находящее за один проход все переменные маппинга.
+
+    Альтернативы отсортированы по длине по убыванию, поэтому в каждой позиции
+    шаблона побеждает самая длинная переменная (например, $request.firstNameBeforeMarriage
+    раньше, чем $request.firstName).
+
+    Args:
+        mapping (dict): Словарь маппинга вида {"$request.varName": "$currentValue.path.to.data"}.
+
+    Returns:
+        re.Pattern: Скомпилированный шаблон или None, если маппинг пуст.
+    """
+    if not mapping:
+        return None
+    sorted_vm_vars = sorted(mapping.keys(), key=len, reverse=True)
+    return re.compile('|'.join(re.escape(vm_variable) for vm_variable in sorted_vm_vars))
+
+
+def apply_mapping_with_counts(template_str: str, mapping: dict, pattern=None):
+    """
+    Заменяет переменные маппинга за один проход по шаблону.
+
+    Args:
+        template_str (str): Строка сгенерированного VM-шаблона.
+        mapping (dict): Словарь маппинга вида {"$request.varName": "$currentValue.path.to.data"}.
+        pattern (re.Pattern): Заранее скомпилированный compile_mapping_pattern(mapping),
+            если один маппинг применяется к нескольким шаблонам.
+
+    Returns:
+        tuple: (шаблон с замененными переменными, {"$request.varName": количество_замен}).
+    """
+    if pattern is None:
+        pattern = compile_mapping_pattern(mapping)
+    if pattern is None:
+        return template_str, {}
+
+    counts = dict.fromkeys(mapping, 0)
+
+    def replace(match):
+        vm_variable = match.group(0)
+        counts[vm_variable] += 1
+        # Значение подставляется как есть, без разбора обратных ссылок re
+        return mapping[vm_variable]
+
+    return pattern.sub(replace, template_str), counts
+
+
+def apply_mapping_to_vm_template(template_str: str, mapping: dict, progress=None, instrumentation=None) -> str:
     """
     Применяет маппинг к сгенерированному VM-шаблону, заменяя переменные.
 
     Args:
         template_str (str): Строка сгенерированного VM-шаблона.
         mapping (dict): Словарь маппинга вида {"$request.varName": "$currentValue.path.to.data"}.
+        progress (core.progress.ProgressToken): Ход выполнения и отмена.
+        instrumentation (core.instrumentation.Instrumentation): Счетчик замен (finalize.replacements).
 
     Returns:
         str: VM-шаблон с замененными переменными.
     """
+    progress = ensure_progress(progress)
+    progress.stage('finalize', total=1)
     if not mapping:
-        print("Предупреждение: Маппинг пуст. Шаблон возвращается без изменений.")
+        logger.warning("Маппинг пуст. Шаблон возвращается без изменений.")
         return template_str
 
-    modified_template = template_str
-    replacements_made = 0
-
-    # Сортируем ключи маппинга по длине по убыванию.
-    # Это помогает избежать частичной замены более коротких переменных,
-    # которые являются подстроками более длинных.
-    # Например, сначала заменить $request.firstNameBeforeMarriage,
-    # а потом $request.firstName.
-    sorted_vm_vars = sorted(mapping.keys(), key=len, reverse=True)
+    modified_template, counts = apply_mapping_with_counts(template_str, mapping)
+    replacements_made = sum(counts.values())
 
-    for vm_variable in sorted_vm_vars:
-        json_path = mapping[vm_variable]
-
-        # Экранируем специальные символы в переменной VM для регулярного выражения
-        # $request.firstName -> \$request\.firstName
-        escaped_vm_var = re.escape(vm_variable)
-
-        # Используем word boundaries (\b) для более точной замены, если это возможно.
-        # Однако \b не работает корректно с символами $ и .,
-        # поэтому используем lookahead и lookbehind.
-        # (?<!\w) - отрицательный lookbehind: не буква/цифра/_ перед
-        # (?!\w) - отрицательный lookahead: не буква/цифра/_ после
-        # pattern = f"(?<!\\w){escaped_vm_var}(?!\\w)"
-        # Более надежный способ для $request.*: убедиться, что перед $request нет $
-        # и после переменной нет буквы/цифры/_
-        # pattern = f"(?<!\\$){escaped_vm_var}(?!\\w)"
-
-        # Еще более точный способ: искать $request.varName как отдельное слово в контексте.
-        # Учитывая, что переменные обычно находятся внутри тегов или атрибутов,
-        # можно искать их как есть, полагаясь на сортировку по длине.
-        # Для максимальной точности можно использовать более сложные паттерны,
-        # но для большинства случаев простая замена с сортировкой должна работать хорошо.
-
-        # Заменяем все вхождения
-        # re.subn возвращает кортеж (новая_строка, количество_замен)
-        modified_template, count = re.subn(escaped_vm_var, json_path, modified_template)
-        replacements_made += count
-
-    print(f"Выполнено {replacements_made} замен в шаблоне на основе маппинга.")
-    return modified_template
\ No newline at end of file
+    logger.info("Выполнено %d замен в шаблоне на основе маппинга.", replacements_made)
+    ensure_instrumentation(instrumentation).count('finalize.replacements', replacements_made)
+    progress.advance()
+    return modified_template
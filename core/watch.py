@@ -0,0 +1,120 @@
+import logging
+import os
+import time
+
+from core.batch import generate_project, output_paths_for
+from core.project import load_project
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 1.0
+DEFAULT_DEBOUNCE = 0.5
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class ProjectWatcher:
+    """
+    Следит за входными файлами проектов (XSD, схема услуги, сценарии и сам файл проекта)
+    опросом mtime/размера и перегенерирует только затронутые проекты.
+
+    Серия изменений объединяется: генерация запускается, когда файлы не менялись
+    debounce секунд. Анализ неизмененных файлов берется из кэша (core.analysis_cache),
+    поэтому перегенерация после правки одного сценария не разбирает XSD заново.
+    """
+
+    def __init__(self, project_paths, output_dir=None, cache_dir=None, use_cache=True,
+                 interval=DEFAULT_INTERVAL, debounce=DEFAULT_DEBOUNCE, on_result=None):
+        self.project_paths = list(project_paths)
+        self.output_dir = output_dir
+        self.cache_dir = cache_dir
+        self.use_cache = use_cache
+        self.interval = interval
+        self.debounce = debounce
+        self.on_result = on_result
+        # Пути результатов считаются для всего набора проектов сразу (ValueError при совпадении)
+        self._output_paths = dict(zip(self.project_paths, output_paths_for(self.project_paths, output_dir)))
+        self._inputs = {}  # {проект: [входные файлы]}
+        self._stamps = {}  # {файл: отметка}
+        self._pending = set()  # проекты, ожидающие перегенерации
+        self._last_change = None
+        for project_path in self.project_paths:
+            self._read_inputs(project_path)
+        self._rebuild_stamps()
+
+    def _read_inputs(self, project_path):
+        """(Пере)читает список входных файлов проекта."""
+        try:
+            inputs = load_project(project_path).input_paths()
+        except (OSError, ValueError) as e:
+            logger.error("Не удалось прочитать проект %s: %s", project_path, e)
+            inputs = []
+        self._inputs[project_path] = [project_path] + inputs
+
+    def _rebuild_stamps(self):
+        """
+        Пересобирает отметки по файлам, на которые проекты ссылаются сейчас: файлы,
+        убранные из всех проектов, больше не опрашиваются. Отметки уже отслеживаемых
+        файлов сохраняются, чтобы не потерять их изменения.
+        """
+        stamps = {}
+        for paths in self._inputs.values():
+            for path in paths:
+                if path not in stamps:
+                    stamps[path] = self._stamps[path] if path in self._stamps else _stamp(path)
+        self._stamps = stamps
+
+    def _affected_projects(self, path):
+        return [project for project, inputs in self._inputs.items() if path in inputs]
+
+    def poll(self, now=None):
+        """
+        Одна проверка файлов. Возвращает проекты, которые пора перегенерировать
+        (изменения закончились debounce секунд назад), или пустой список.
+        """
+        now = time.monotonic() if now is None else now
+        for path, old_stamp in list(self._stamps.items()):
+            new_stamp = _stamp(path)
+            if new_stamp != old_stamp:
+                self._stamps[path] = new_stamp
+                self._pending.update(self._affected_projects(path))
+                self._last_change = now
+
+        if not self._pending or now - self._last_change < self.debounce:
+            return []
+        ready = [project for project in self.project_paths if project in self._pending]
+        self._pending.clear()
+        # Файл проекта мог измениться вместе со списком входных файлов
+        for project_path in ready:
+            self._read_inputs(project_path)
+        self._rebuild_stamps()
+        return ready
+
+    def regenerate(self, project_paths):
+        results = []
+        for project_path in project_paths:
+            result = generate_project(project_path, self._output_paths[project_path],
+                                      self.cache_dir, self.use_cache)
+            if self.on_result:
+                self.on_result(result)
+            results.append(result)
+        return results
+
+    def run(self, initial=True, stop=None):
+        """
+        Основной цикл наблюдения; stop() -> True завершает его.
+        При initial=True все проекты генерируются сразу при запуске.
+        """
+        if initial:
+            self.regenerate(self.project_paths)
+        while stop is None or not stop():
+            time.sleep(self.interval)
+            ready = self.poll()
+            if ready:
+                self.regenerate(ready)
@@ -1,14 +1,16 @@
 import os
 import sys
 import json
+import logging
 import re
+import functools
 from PySide6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QLineEdit, QPushButton, QFileDialog, QPlainTextEdit,
     QGroupBox, QListWidget, QAbstractItemView, QSplitter, QMessageBox, QMenuBar,
     QDialog, QStackedWidget, QFrame, QApplication, QGraphicsDropShadowEffect
 )
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, QObject, QRunnable, QThreadPool, Signal
 from PySide6.QtGui import QIcon, QFont, QPalette, QColor, QSyntaxHighlighter, QTextCharFormat, QBrush, QFontDatabase, \
     QPixmap
 
@@ -24,6 +26,12 @@ def resource_path(relative_path):
 
 
 import core.mid_vm
+from core.analysis_cache import AnalysisCache, load_scenario_analysis
+from core.json_mapper_gen import IncrementalScenarioAnalyzer
+from core.progress import STAGE_TITLES, GenerationCancelled, ProgressToken
+from core.project import ProjectData, find_missing_files
+
+logger = logging.getLogger(__name__)
 
 
 class JSONSchemeReader(QWidget):
@@ -398,6 +406,12 @@ class VMGeneratorBlock(QWidget):
             QPushButton:disabled {
                 background-color: #66727F;
             }
+            QPushButton[running="true"] {
+                background-color: #EE3F58;
+            }
+            QPushButton[running="true"]:hover {
+                background-color: #D63850;
+            }
         """)
         button_container = QWidget()
         button_layout = QHBoxLayout(button_container)
@@ -411,8 +425,82 @@ class VMGeneratorBlock(QWidget):
     def set_enabled(self, enabled):
         self.button.setEnabled(enabled)
 
+    def set_running(self, running):
+        """Во время генерации кнопка превращается в кнопку отмены."""
+        self.button.setText("Отменить" if running else "Сгенерировать шаблон")
+        self.button.setProperty("running", running)
+        self.button.style().unpolish(self.button)
+        self.button.style().polish(self.button)
+
+
+class GenerationSignals(QObject):
+    # Первый аргумент - номер генерации, по нему отбрасываются устаревшие результаты
+    progress = Signal(int, str)
+    finished = Signal(int, str)
+    failed = Signal(int, str)
+    cancelled = Signal(int)
+
+
+class GenerationTask(QRunnable):
+    """Генерация шаблона в фоновом потоке; результат передается сигналами."""
+
+    def __init__(self, generation_id, xsd_path, schema_path, example_paths, cache, scenario_analyzer):
+        super().__init__()
+        self.generation_id = generation_id
+        self.xsd_path = xsd_path
+        self.schema_path = schema_path
+        self.example_paths = list(example_paths)
+        self.cache = cache
+        self.scenario_analyzer = scenario_analyzer
+        self.signals = GenerationSignals()
+        # Отмена прерывает конвейер на ближайшей проверке (core.progress)
+        self.progress = ProgressToken(self._on_progress)
+
+    def cancel(self):
+        self.progress.cancel()
+
+    def _on_progress(self, stage, done, total, detail):
+        message = STAGE_TITLES.get(stage, stage)
+        if total:
+            message += f" ({done} из {total})"
+        self.signals.progress.emit(self.generation_id, message)
+
+    def run(self):
+        try:
+            self.progress.check()
+            template_content = core.mid_vm.generate_template(self.xsd_path, self.schema_path, self.example_paths,
+                                                              cache=self.cache,
+                                                              scenario_analyzer=self.scenario_analyzer,
+                                                              progress=self.progress)
+        except GenerationCancelled:
+            self.signals.cancelled.emit(self.generation_id)
+            return
+        except Exception as e:
+            self.signals.failed.emit(self.generation_id, str(e))
+            return
+        self.signals.finished.emit(self.generation_id, template_content)
+
 
 class VMSyntaxHighlighter(QSyntaxHighlighter):
+    """
+    Подсветка Velocity-шаблона за один проход по строке: все лексемы ищутся одним
+    заранее скомпилированным выражением, и строка просматривается один раз.
+    Многострочный комментарий #* ... *# продолжается на следующих блоках через состояние блока.
+    """
+    # Состояния блока (previousBlockState() == -1 у первого блока)
+    NORMAL_STATE = 0
+    IN_COMMENT_STATE = 1
+
+    TOKEN_PATTERN = re.compile(r"""
+        (?P<comment>\#\*)                             # начало комментария #* ... *#
+      | (?P<line_comment>\#\#.*)                      # однострочный комментарий ## ...
+      | (?P<directive>\#\w+)                          # #if, #foreach, #end, ...
+      | (?P<variable>\$!?\{[^}]*\}|\$[a-zA-Z0-9_-]+)  # ${var}, $!{var}, $var
+      | (?P<tag><[^>]*>)                              # XML-тег
+    """, re.VERBOSE)
+    ATTRIBUTE_PATTERN = re.compile(r'(\w+)=("[^"]*")')
+    COMMENT_END = '*#'
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.default_format = QTextCharFormat()
@@ -427,48 +515,51 @@ class VMSyntaxHighlighter(QSyntaxHighlighter):
         self.tag_format.setForeground(QColor("#0000FF"))
         self.attribute_format = QTextCharFormat()
         self.attribute_format.setForeground(QColor("#FFA500"))
+        self.token_formats = {
+            'line_comment': self.comment_format,
+            'directive': self.directive_format,
+            'variable': self.variable_format,
+        }
 
     def highlightBlock(self, text):
-        # Сначала применяем формат по умолчанию ко всему блоку
-        self.setFormat(0, len(text), self.default_format)
-        comment_start = 0
-        while comment_start < len(text):
-            comment_start = text.find('#*', comment_start)
-            if comment_start == -1:
+        length = len(text)
+        self.setFormat(0, length, self.default_format)
+        pos = 0
+        # Продолжение комментария, начатого в предыдущих блоках
+        if self.previousBlockState() == self.IN_COMMENT_STATE:
+            close = text.find(self.COMMENT_END)
+            if close == -1:
+                self.setFormat(0, length, self.comment_format)
+                self.setCurrentBlockState(self.IN_COMMENT_STATE)
+                return
+            pos = close + len(self.COMMENT_END)
+            self.setFormat(0, pos, self.comment_format)
+
+        search = self.TOKEN_PATTERN.search
+        while True:
+            match = search(text, pos)
+            if match is None:
                 break
-            comment_end = text.find('*#', comment_start + 2)
-            if comment_end == -1:
-                comment_end = len(text)
-            else:
-                comment_end += 2
-            self.setFormat(comment_start, comment_end - comment_start, self.comment_format)
-            comment_start = comment_end
-        directive_pattern = re.compile(r'(#\w+)')
-        for match in directive_pattern.finditer(text):
-            start, end = match.span()
-            is_in_comment = False
-            for comment_start_match in re.finditer(r'#\*', text):
-                comment_end_match = re.search(r'\*#', text[comment_start_match.start():])
-                if comment_end_match:
-                    actual_comment_end = comment_start_match.start() + comment_end_match.end()
-                    if comment_start_match.start() <= start < actual_comment_end:
-                        is_in_comment = True
-                        break
-            if not is_in_comment:
-                self.setFormat(start, end - start, self.directive_format)
-        variable_pattern = re.compile(r'\$!?\{[^}]*\}|\$[a-zA-Z_][a-zA-Z0-9_-]*|\$[a-zA-Z0-9_-]+')
-        for match in variable_pattern.finditer(text):
-            start, end = match.span()
-            self.setFormat(start, end - start, self.variable_format)
-        tag_pattern = re.compile(r'<[^>]*>')
-        for match in tag_pattern.finditer(text):
+            kind = match.lastgroup
             start, end = match.span()
-            tag_text = text[start:end]
-            attr_pattern = re.compile(r'(\w+)=("[^"]*")')
-            for attr_match in attr_pattern.finditer(tag_text):
-                attr_start, attr_end = attr_match.span()
-                self.setFormat(start + attr_start, attr_end - attr_start, self.attribute_format)
-            self.setFormat(start, end - start, self.tag_format)
+            if kind == 'comment':
+                close = text.find(self.COMMENT_END, end)
+                if close == -1:
+                    # Комментарий не закрыт в этой строке - продолжается в следующих блоках
+                    self.setFormat(start, length - start, self.comment_format)
+                    self.setCurrentBlockState(self.IN_COMMENT_STATE)
+                    return
+                end = close + len(self.COMMENT_END)
+                self.setFormat(start, end - start, self.comment_format)
+            elif kind == 'tag':
+                self.setFormat(start, end - start, self.tag_format)
+                for attr_match in self.ATTRIBUTE_PATTERN.finditer(text, start, end):
+                    attr_start, attr_end = attr_match.span()
+                    self.setFormat(attr_start, attr_end - attr_start, self.attribute_format)
+            else:
+                self.setFormat(start, end - start, self.token_formats[kind])
+            pos = end
+        self.setCurrentBlockState(self.NORMAL_STATE)
 
 
 class VMTemplateViewer(QWidget):
@@ -571,28 +662,6 @@ class VMTemplateViewer(QWidget):
         self.save_button.clicked.connect(slot)
 
 
-class ProjectData:
-    def __init__(self, json_schema_path="", json_examples_paths=None, xsd_schema_path=""):
-        self.json_schema_path = json_schema_path
-        self.json_examples_paths = json_examples_paths or []
-        self.xsd_schema_path = xsd_schema_path
-
-    @classmethod
-    def from_dict(cls, data):
-        return cls(
-            json_schema_path=data.get("json_schema_path", ""),
-            json_examples_paths=data.get("json_examples_paths", []),
-            xsd_schema_path=data.get("xsd_schema_path", "")
-        )
-
-    def to_dict(self):
-        return {
-            "json_schema_path": self.json_schema_path,
-            "json_examples_paths": self.json_examples_paths,
-            "xsd_schema_path": self.xsd_schema_path
-        }
-
-
 class RecentFilesManager:
     def __init__(self, main_window):
         self.main_window = main_window
@@ -615,7 +684,7 @@ class RecentFilesManager:
             with open(self.file_path, 'w', encoding='utf-8') as f:
                 json.dump({"recent_files": self.recent_files}, f, ensure_ascii=False, indent=4)
         except Exception as e:
-            print(f"Ошибка при сохранении списка недавних файлов: {e}")
+            logger.error("Ошибка при сохранении списка недавних файлов: %s", e)
 
     def add_file(self, file_path):
         if file_path in self.recent_files:
@@ -673,7 +742,7 @@ class ProjectManager:
             self.update_window_title()
             return True
         except Exception as e:
-            print(f"Ошибка при сохранении проекта: {e}")
+            logger.error("Ошибка при сохранении проекта: %s", e)
             QMessageBox.critical(self.main_window, "Ошибка", f"Не удалось сохранить проект:\n{e}")
             return False
 
@@ -691,7 +760,7 @@ class ProjectManager:
                 data = json.load(f)
             project_data = ProjectData.from_dict(data)
         except Exception as e:
-            print(f"Ошибка при загрузке проекта: {e}")
+            logger.error("Ошибка при загрузке проекта: %s", e)
             QMessageBox.critical(self.main_window, "Ошибка", f"Не удалось загрузить проект:\n{e}")
             return
         self.main_window.json_schema_reader.set_path(project_data.json_schema_path)
@@ -717,15 +786,7 @@ class ProjectManager:
         self.main_window.vm_template_viewer.set_content("")
 
     def _check_files_existence(self, project_data):
-        missing_files = []
-        if project_data.json_schema_path and not os.path.exists(project_data.json_schema_path):
-            missing_files.append(project_data.json_schema_path)
-        if project_data.xsd_schema_path and not os.path.exists(project_data.xsd_schema_path):
-            missing_files.append(project_data.xsd_schema_path)
-        for path in project_data.json_examples_paths:
-            if not os.path.exists(path):
-                missing_files.append(path)
-        return missing_files
+        return find_missing_files(project_data)
 
     def _show_missing_files_warning(self, missing_files):
         msg_box = QMessageBox()
@@ -849,6 +910,17 @@ class MainWindow(QMainWindow):
         self.setFont(app_font)
         self.project_manager = ProjectManager(self)
         self.recent_files_manager = RecentFilesManager(self)
+        # Результаты анализа неизмененных файлов переиспользуются между запусками
+        self.analysis_cache = AnalysisCache()
+        # Сценарии анализируются по одному: при добавлении/удалении файла пересчитывается только он
+        self.scenario_analyzer = IncrementalScenarioAnalyzer(
+            loader=functools.partial(load_scenario_analysis, self.analysis_cache))
+        # Генерация идет вне потока интерфейса. Один поток: кэш и анализатор сценариев
+        # не разделяются между генерациями, новая ждет завершения отмененной.
+        self.generation_pool = QThreadPool(self)
+        self.generation_pool.setMaxThreadCount(1)
+        self.generation_id = 0
+        self.current_task = None
         self.setWindowTitle(f"{self.project_manager.default_project_name} - Генератор VM-шаблонов")
         self.setGeometry(100, 100, 920, 700)
         qr = self.frameGeometry()
@@ -989,7 +1061,7 @@ class MainWindow(QMainWindow):
         vm_template_viewer_layout.addWidget(self.vm_template_wrapper)
         splitter.addWidget(self.vm_template_viewer_widget)
         splitter.setSizes([440, 440])
-        self.vm_generator_block.connect_generate_signal(self.generate_template)
+        self.vm_generator_block.connect_generate_signal(self._on_generate_clicked)
         self._on_file_state_changed()
         self.vm_template_viewer.connect_copy_signal(self.copy_template)
         self.vm_template_viewer.connect_save_signal(self.save_template)
@@ -1012,7 +1084,7 @@ class MainWindow(QMainWindow):
                     data = json.load(f)
                 project_data = ProjectData.from_dict(data)
             except Exception as e:
-                print(f"Ошибка при загрузке проекта из недавних: {e}")
+                logger.error("Ошибка при загрузке проекта из недавних: %s", e)
                 QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить проект:\n{e}")
                 return
             self.json_schema_reader.set_path(project_data.json_schema_path)
@@ -1047,7 +1119,44 @@ class MainWindow(QMainWindow):
         schema_loaded = bool(self.json_schema_reader.get_path())
         xsd_loaded = bool(self.xsd_scheme_reader.get_path())
         all_loaded = schema_loaded and xsd_loaded
-        self.vm_generator_block.set_enabled(all_loaded)
+        # Отмена доступна всегда, пока идет генерация
+        self.vm_generator_block.set_enabled(all_loaded or self.current_task is not None)
+
+    def _on_generate_clicked(self):
+        if self.current_task is not None:
+            self.cancel_generation()
+        else:
+            self.generate_template()
+
+    def cancel_generation(self):
+        if self.current_task is None:
+            return
+        self.current_task.cancel()
+        self.current_task = None
+        self.vm_generator_block.set_running(False)
+        self._on_file_state_changed()
+        self.statusBar().showMessage("Генерация отменена", 3000)
+
+    def _finish_generation(self, generation_id):
+        """True, если результат относится к текущей генерации (а не к отмененной/устаревшей)."""
+        if generation_id != self.generation_id or self.current_task is None:
+            return False
+        self.current_task = None
+        self.vm_generator_block.set_running(False)
+        self._on_file_state_changed()
+        self.statusBar().clearMessage()
+        return True
+
+    def _on_generation_progress(self, generation_id, message):
+        if generation_id == self.generation_id and self.current_task is not None:
+            self.statusBar().showMessage(message)
+
+    def _on_generation_failed(self, generation_id, error):
+        if self._finish_generation(generation_id):
+            self.vm_template_viewer.set_content(f"Ошибка при генерации шаблона: {error}")
+
+    def _on_generation_cancelled(self, generation_id):
+        self._finish_generation(generation_id)
 
     def generate_template(self):
         schema_path = self.json_schema_reader.get_path()
@@ -1064,26 +1173,37 @@ class MainWindow(QMainWindow):
             self.project_manager._remove_missing_files_from_ui(project_data)
             self._on_file_state_changed()
             return
-        try:
-            template_content = core.mid_vm.generate_template(xsd_path, schema_path, example_paths)
-            self.vm_template_viewer.set_content(template_content)
-            clipboard = QApplication.clipboard()
-            clipboard.setText(template_content)
-            file_path, _ = QFileDialog.getSaveFileName(
-                self,
-                "Сохранить VM-шаблон",
-                "xxxxxxxxx_Applicant.vm",
-                "VM Files (*.vm);;All Files (*)"
-            )
-            if file_path:
-                try:
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        f.write(template_content)
-                except Exception as e:
-                    print(f"Ошибка при сохранении шаблона: {e}")
-                    QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить шаблон:\n{e}")
-        except Exception as e:
-            self.vm_template_viewer.set_content(f"Ошибка при генерации шаблона: {e}")
+        self.generation_id += 1
+        task = GenerationTask(self.generation_id, xsd_path, schema_path, example_paths,
+                              self.analysis_cache, self.scenario_analyzer)
+        task.signals.progress.connect(self._on_generation_progress)
+        task.signals.finished.connect(self._on_template_generated)
+        task.signals.failed.connect(self._on_generation_failed)
+        task.signals.cancelled.connect(self._on_generation_cancelled)
+        self.current_task = task
+        self.vm_generator_block.set_running(True)
+        self.statusBar().showMessage("Генерация шаблона...")
+        self.generation_pool.start(task)
+
+    def _on_template_generated(self, generation_id, template_content):
+        if not self._finish_generation(generation_id):
+            return
+        self.vm_template_viewer.set_content(template_content)
+        clipboard = QApplication.clipboard()
+        clipboard.setText(template_content)
+        file_path, _ = QFileDialog.getSaveFileName(
+            self,
+            "Сохранить VM-шаблон",
+            "xxxxxxxxx_Applicant.vm",
+            "VM Files (*.vm);;All Files (*)"
+        )
+        if file_path:
+            try:
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    f.write(template_content)
+            except Exception as e:
+                logger.error("Ошибка при сохранении шаблона: %s", e)
+                QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить шаблон:\n{e}")
 
     def copy_template(self):
         clipboard = QApplication.clipboard()
@@ -1106,12 +1226,18 @@ class MainWindow(QMainWindow):
                 with open(file_path, 'w', encoding='utf-8') as f:
                     f.write(template_text)
             except Exception as e:
-                print(f"Ошибка при сохранении шаблона: {e}")
+                logger.error("Ошибка при сохранении шаблона: %s", e)
 
     def show_instruction(self):
         tutorial = TutorialDialog()
         tutorial.exec()
 
+    def closeEvent(self, event):
+        # Пул потоков дожидается задачи при закрытии окна - просим ее остановиться
+        if self.current_task is not None:
+            self.current_task.cancel()
+        super().closeEvent(event)
+
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
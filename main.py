@@ -1,7 +1,13 @@
+import logging
+import multiprocessing
 from PySide6.QtWidgets import QApplication
 import sys
 from gui.main_window import MainWindow
 if __name__ == "__main__":
+    # В собранном .exe дочерние процессы пула снова запускают этот файл
+    multiprocessing.freeze_support()
+    # В оконной сборке выводятся только предупреждения и ошибки
+    logging.basicConfig(level=logging.WARNING)
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()